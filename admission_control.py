@@ -0,0 +1,374 @@
+"""
+File name: admission_control.py
+Author: Luigi Saetta
+Date last modified: 2026-10-19
+Python Version: 3.11
+
+Description:
+    Admission control, in front of the router: under a burst the requests
+    that can't be served in time are rejected fast, instead of all of them
+    (LLM, embeddings, Select AI, DB) timing out together.
+
+    * a global limit and a limit per route (endpoint) on the requests
+      in progress (a request is in progress until its stream ends)
+    * a rate limit per conversation (token bucket)
+    * a bounded queue for the requests over the limits, with a deadline
+
+    Rejected requests get 429 (rate limit) or 503 (saturated),
+    with the Retry-After header.
+
+Inspired by:
+
+Usage:
+    Import this module into other scripts to use its functions.
+    Example:
+        permit = await admission.acquire("streaming_chat", conv_id)
+        events = release_at_end(events, permit)
+
+License:
+    This code is released under the MIT License.
+
+Notes:
+    This is a part of a set of demos showing how to build a SQL Agent
+    for Text2SQL tasks
+
+Warnings:
+    This module is in development, may change in future versions.
+    The limits are per process (every worker has its own).
+"""
+
+import asyncio
+import math
+import weakref
+from collections import OrderedDict, deque
+from time import monotonic
+from typing import Dict, Optional
+
+# weight of the last value in the EWMA of the time a request is in progress
+HOLD_TIME_ALPHA = 0.1
+
+
+class AdmissionRejected(Exception):
+    """
+    The request is not admitted: status_code is 429 (rate limit)
+    or 503 (saturated), retry_after is in sec.
+    """
+
+    def __init__(self, status_code: int, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+    def get_headers(self):
+        """
+        the headers of the response
+        """
+        return {"Retry-After": str(max(1, math.ceil(self.retry_after)))}
+
+
+class TokenBucket:
+    """
+    Token bucket: rate tokens per sec., up to burst
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = monotonic()
+
+    def try_take(self, now: float) -> float:
+        """
+        take a token, if available
+
+        Returns:
+            0 if taken, otherwise the time (sec.) until the next token
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class Permit:
+    """
+    A request admitted: must be released when the request ends
+    (release can be called more than once)
+    """
+
+    __slots__ = ("controller", "route", "time_admitted", "released")
+
+    def __init__(self, controller: "AdmissionController", route: str):
+        self.controller = controller
+        self.route = route
+        self.time_admitted = monotonic()
+        self.released = False
+
+    def release(self):
+        """
+        release the slot, admitting the next request in queue
+        """
+        if not self.released:
+            self.released = True
+            self.controller.release(self)
+
+
+class AdmissionController:
+    """
+    Limits the requests in progress (global and per route),
+    the rate of every conversation and the requests waiting
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = 64,
+        route_limits: Optional[Dict[str, int]] = None,
+        queue_size: int = 100,
+        queue_timeout: float = 5,
+        conv_rate: float = 1.0,
+        conv_burst: float = 5,
+        max_buckets: int = 10000,
+        enabled: bool = True,
+    ):
+        """
+        max_concurrent: max n. of requests in progress
+        route_limits: route -> max n. of requests in progress for the route
+        queue_size: max n. of requests waiting for a slot (then 503)
+        queue_timeout: max wait (sec.) in queue (then 503)
+        conv_rate, conv_burst: requests per sec. and burst for every
+            conversation (then 429), conv_rate 0 to disable
+        max_buckets: max n. of conversations tracked (the least recent
+            are removed)
+        enabled: if False, every request is admitted
+        """
+        self.max_concurrent = max_concurrent
+        self.route_limits = dict(route_limits or {})
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.conv_rate = conv_rate
+        self.conv_burst = conv_burst
+        self.max_buckets = max_buckets
+        self.enabled = enabled
+
+        # conv_id -> TokenBucket
+        self.buckets = OrderedDict()
+
+        self.n_active = 0
+        # route -> n. of requests in progress
+        self.active_by_route: Dict[str, int] = {}
+        # (route, future) waiting for a slot, in arrival order
+        self.waiters = deque()
+        # route -> n. of requests waiting
+        self.waiting_by_route: Dict[str, int] = {}
+
+        # time (sec.) a request is in progress (EWMA), to estimate Retry-After
+        self.avg_hold_time = 1.0
+
+        # stats
+        self.n_admitted = 0
+        self.n_queued = 0
+        self.n_rejected_rate = 0
+        self.n_rejected_queue_full = 0
+        self.n_rejected_timeout = 0
+        self.max_queue_depth = 0
+        self.total_wait_time = 0.0
+
+    def _has_capacity(self, route: str) -> bool:
+        if self.n_active >= self.max_concurrent:
+            return False
+
+        limit = self.route_limits.get(route)
+        return limit is None or self.active_by_route.get(route, 0) < limit
+
+    def _admit(self, route: str) -> Permit:
+        self.n_active += 1
+        self.active_by_route[route] = self.active_by_route.get(route, 0) + 1
+        self.n_admitted += 1
+        return Permit(self, route)
+
+    def _estimate_wait(self) -> float:
+        """
+        the time (sec.) to serve the requests in progress and in queue
+        """
+        n_ahead = self.n_active + len(self.waiters)
+        return self.avg_hold_time * n_ahead / max(1, self.max_concurrent)
+
+    def _check_rate(self, conv_id: str):
+        """
+        take a token from the bucket of the conversation, or raise (429)
+        """
+        if not self.conv_rate or conv_id is None:
+            return
+
+        bucket = self.buckets.get(conv_id)
+        if bucket is None:
+            bucket = TokenBucket(self.conv_rate, self.conv_burst)
+            self.buckets[conv_id] = bucket
+
+            while len(self.buckets) > self.max_buckets:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(conv_id)
+
+        wait = bucket.try_take(monotonic())
+        if wait > 0:
+            self.n_rejected_rate += 1
+            raise AdmissionRejected(429, "Too many requests in the conversation", wait)
+
+    async def acquire(self, route: str, conv_id: Optional[str] = None) -> Permit:
+        """
+        admit the request, waiting in queue (up to queue_timeout) if needed
+
+        Returns:
+            the Permit, to release when the request ends
+
+        Raises:
+            AdmissionRejected if not admitted
+        """
+        if not self.enabled:
+            return Permit(self, route)
+
+        self._check_rate(conv_id)
+
+        # the requests in queue for the same route come first
+        # (the ones of other routes are waiting for their own route)
+        if not self.waiting_by_route.get(route) and self._has_capacity(route):
+            return self._admit(route)
+
+        if len(self.waiters) >= self.queue_size:
+            self.n_rejected_queue_full += 1
+            raise AdmissionRejected(
+                503, "Service saturated, queue full", self._estimate_wait()
+            )
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = (route, future)
+        self.waiters.append(waiter)
+        self.waiting_by_route[route] = self.waiting_by_route.get(route, 0) + 1
+        self.n_queued += 1
+        self.max_queue_depth = max(self.max_queue_depth, len(self.waiters))
+
+        time_start = monotonic()
+        try:
+            permit = await asyncio.wait_for(future, timeout=self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            # the permit, if given in the meantime, is passed on
+            if future.done() and not future.cancelled():
+                future.result().release()
+
+            if isinstance(e, asyncio.CancelledError):
+                # the client has gone
+                raise
+
+            self.n_rejected_timeout += 1
+            raise AdmissionRejected(
+                503, "Service saturated, timeout in queue", self._estimate_wait()
+            ) from None
+        finally:
+            if waiter in self.waiters:
+                self._remove_waiter(waiter)
+            self.total_wait_time += monotonic() - time_start
+
+        return permit
+
+    def release(self, permit: Permit):
+        """
+        release the slot of the permit and admit the requests in queue
+        """
+        if not self.enabled:
+            return
+
+        self.n_active -= 1
+        self.active_by_route[permit.route] -= 1
+
+        hold_time = monotonic() - permit.time_admitted
+        self.avg_hold_time += HOLD_TIME_ALPHA * (hold_time - self.avg_hold_time)
+
+        self._wake_waiters()
+
+    def _remove_waiter(self, waiter):
+        self.waiters.remove(waiter)
+        self.waiting_by_route[waiter[0]] -= 1
+
+    def _wake_waiters(self):
+        """
+        admit, in arrival order, the requests in queue whose route has capacity
+        (FIFO among the requests of the same route)
+        """
+        for waiter in list(self.waiters):
+            if self.n_active >= self.max_concurrent:
+                break
+
+            route, future = waiter
+            if future.done() or not self._has_capacity(route):
+                continue
+
+            self._remove_waiter(waiter)
+            future.set_result(self._admit(route))
+
+    def get_stats(self):
+        """
+        returns the stats of the admission control
+        """
+        n_rejected = (
+            self.n_rejected_rate + self.n_rejected_queue_full + self.n_rejected_timeout
+        )
+
+        return {
+            "enabled": self.enabled,
+            "active": self.n_active,
+            "active_by_route": dict(self.active_by_route),
+            "queue_depth": len(self.waiters),
+            "queue_depth_by_route": {
+                route: n_waiting
+                for route, n_waiting in self.waiting_by_route.items()
+                if n_waiting
+            },
+            "max_queue_depth": self.max_queue_depth,
+            "n_admitted": self.n_admitted,
+            "n_queued": self.n_queued,
+            "n_rejected": n_rejected,
+            "n_rejected_rate": self.n_rejected_rate,
+            "n_rejected_queue_full": self.n_rejected_queue_full,
+            "n_rejected_timeout": self.n_rejected_timeout,
+            "avg_wait_time": (
+                round(self.total_wait_time / self.n_queued, 3) if self.n_queued else 0.0
+            ),
+            "avg_hold_time": round(self.avg_hold_time, 3),
+            "n_conversations_tracked": len(self.buckets),
+        }
+
+
+async def _release_at_end(events, permit: Permit):
+    try:
+        async for event in events:
+            yield event
+    finally:
+        permit.release()
+
+
+def release_at_end(events, permit: Permit):
+    """
+    Pass the events through, releasing the permit when the stream ends
+    (completed, failed or interrupted)
+
+    If the stream is never started (the client has gone before the response)
+    the permit is released when the stream is garbage collected.
+    """
+    stream = _release_at_end(events, permit)
+
+    loop = asyncio.get_running_loop()
+
+    def release_in_loop():
+        # the collection can happen in any thread
+        if not permit.released and not loop.is_closed():
+            loop.call_soon_threadsafe(permit.release)
+
+    weakref.finalize(stream, release_in_loop)
+    return stream
@@ -0,0 +1,363 @@
+"""
+File name: analytics_engine.py
+Author: Luigi Saetta
+Date last modified: 2026-10-19
+Python Version: 3.11
+
+Description:
+    Local analytics on the data already fetched.
+    The last result set of every conversation is kept as a pandas DataFrame;
+    the LLM only translates the request into a small declarative operation
+    (group by, sort, filter, pivot, describe, top n), executed here,
+    vectorized. Only the (compact) output goes back to the model,
+    or directly to the client.
+
+Inspired by:
+
+Usage:
+    Import this module into other scripts to use its functions.
+    Example:
+        engine = AnalyticsEngine()
+        engine.set_result(conv_id, request_text, rows)
+        result_df = engine.execute(conv_id, operation)
+
+Dependencies:
+    pandas
+
+License:
+    This code is released under the MIT License.
+
+Notes:
+    This is a part of a set of demos showing how to build a SQL Agent
+    for Text2SQL tasks
+
+Warnings:
+    This module is in development, may change in future versions.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+import pandas as pd
+
+from utils import decimal_to_float, get_console_logger
+
+logger = get_console_logger()
+
+# the operations supported
+OP_GROUP_BY = "group_by"
+OP_SORT = "sort"
+OP_FILTER = "filter"
+OP_PIVOT = "pivot"
+OP_DESCRIBE = "describe"
+OP_TOP_N = "top_n"
+# the request can't be answered with an operation on the data
+OP_NONE = "none"
+
+OPERATIONS = [OP_GROUP_BY, OP_SORT, OP_FILTER, OP_PIVOT, OP_DESCRIBE, OP_TOP_N, OP_NONE]
+AGG_FUNCTIONS = ["sum", "mean", "min", "max", "count", "median", "nunique"]
+FILTER_OPERATORS = ["==", "!=", ">", ">=", "<", "<=", "contains", "in"]
+
+# JSON schema for the operation produced by the LLM
+operation_json_schema = {
+    "title": "operation",
+    "description": "the operation to execute on the data.",
+    "type": "object",
+    "properties": {
+        "operation": {
+            "type": "string",
+            "enum": OPERATIONS,
+            "description": "the main operation",
+        },
+        "filters": {
+            "type": "array",
+            "description": "filters applied before the operation",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "column": {"type": "string"},
+                    "operator": {"type": "string", "enum": FILTER_OPERATORS},
+                    "value": {},
+                },
+                "required": ["column", "operator", "value"],
+            },
+        },
+        "group_by": {
+            "type": "array",
+            "items": {"type": "string"},
+            "description": "columns to group by (group_by) or index (pivot)",
+        },
+        "pivot_columns": {
+            "type": "string",
+            "description": "for pivot: the column whose values become columns",
+        },
+        "aggregations": {
+            "type": "array",
+            "description": "for group_by and pivot",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "column": {"type": "string"},
+                    "function": {"type": "string", "enum": AGG_FUNCTIONS},
+                },
+                "required": ["column", "function"],
+            },
+        },
+        "sort_by": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "column": {"type": "string"},
+                    "ascending": {"type": "boolean"},
+                },
+                "required": ["column"],
+            },
+        },
+        "limit": {"type": "integer", "description": "max n. of rows returned"},
+    },
+    "required": ["operation"],
+}
+
+
+def rows_to_frame(rows: List[dict]) -> pd.DataFrame:
+    """
+    build a DataFrame from the rows returned by the SQL agent
+    (Decimal from the DB are converted to float)
+    """
+    records = [{k: decimal_to_float(v) for k, v in row.items()} for row in rows]
+    return pd.DataFrame.from_records(records)
+
+
+def frame_to_rows(df: pd.DataFrame) -> List[dict]:
+    """
+    convert a DataFrame to a list of dict, with python types
+    """
+    # keep the index only if it carries data (e.g. after a group by)
+    named_index = any(name is not None for name in df.index.names)
+    df = df.reset_index(drop=not named_index)
+    df = df.set_axis(
+        [
+            "_".join(str(c) for c in col) if isinstance(col, tuple) else str(col)
+            for col in df.columns
+        ],
+        axis=1,
+    )
+    df = df.astype(object).where(pd.notna(df), None)
+    return df.to_dict("records")
+
+
+def _check_columns(df: pd.DataFrame, columns):
+    missing = [col for col in columns if col not in df.columns]
+    if missing:
+        raise ValueError(f"Unknown columns: {', '.join(missing)}")
+
+
+def _apply_filters(df: pd.DataFrame, filters) -> pd.DataFrame:
+    if not filters:
+        return df
+
+    _check_columns(df, [f["column"] for f in filters])
+
+    mask = pd.Series(True, index=df.index)
+    for f in filters:
+        col = df[f["column"]]
+        operator = f["operator"]
+        value = f["value"]
+
+        if operator == "==":
+            mask &= col == value
+        elif operator == "!=":
+            mask &= col != value
+        elif operator == ">":
+            mask &= col > value
+        elif operator == ">=":
+            mask &= col >= value
+        elif operator == "<":
+            mask &= col < value
+        elif operator == "<=":
+            mask &= col <= value
+        elif operator == "contains":
+            mask &= col.astype(str).str.contains(str(value), case=False, regex=False)
+        elif operator == "in":
+            mask &= col.isin(value if isinstance(value, list) else [value])
+        else:
+            raise ValueError(f"Unknown filter operator: {operator}")
+    return df[mask]
+
+
+def _agg_spec(df: pd.DataFrame, aggregations):
+    if not aggregations:
+        raise ValueError("At least one aggregation is required.")
+    _check_columns(df, [a["column"] for a in aggregations])
+    for a in aggregations:
+        if a["function"] not in AGG_FUNCTIONS:
+            raise ValueError(f"Unknown aggregation function: {a['function']}")
+
+    # named aggregations, e.g. AMOUNT_sum
+    return {
+        f"{a['column']}_{a['function']}": (a["column"], a["function"])
+        for a in aggregations
+    }
+
+
+def _apply_sort(df: pd.DataFrame, sort_by) -> pd.DataFrame:
+    if not sort_by:
+        return df
+    _check_columns(df, [s["column"] for s in sort_by])
+    return df.sort_values(
+        by=[s["column"] for s in sort_by],
+        ascending=[s.get("ascending", True) for s in sort_by],
+        kind="stable",
+    )
+
+
+def execute_operation(df: pd.DataFrame, operation: dict) -> pd.DataFrame:
+    """
+    Execute the operation (see operation_json_schema) on the DataFrame
+
+    Raises:
+        ValueError: if the operation is not valid for the data
+    """
+    op = operation.get("operation")
+
+    if op not in OPERATIONS or op == OP_NONE:
+        raise ValueError(f"Not an executable operation: {op}")
+
+    df = _apply_filters(df, operation.get("filters"))
+
+    group_by = operation.get("group_by") or []
+    _check_columns(df, group_by)
+
+    if op == OP_GROUP_BY:
+        if not group_by:
+            raise ValueError("group_by requires at least one column.")
+        df = df.groupby(group_by, sort=False, dropna=False).agg(
+            **_agg_spec(df, operation.get("aggregations"))
+        )
+        df = df.reset_index()
+    elif op == OP_PIVOT:
+        pivot_columns = operation.get("pivot_columns")
+        aggregations = operation.get("aggregations") or []
+        if not group_by or not pivot_columns or len(aggregations) != 1:
+            raise ValueError(
+                "pivot requires group_by, pivot_columns and one aggregation."
+            )
+        _check_columns(df, [pivot_columns])
+        _agg_spec(df, aggregations)
+        df = df.pivot_table(
+            index=group_by,
+            columns=pivot_columns,
+            values=aggregations[0]["column"],
+            aggfunc=aggregations[0]["function"],
+        ).reset_index()
+    elif op == OP_DESCRIBE:
+        df = df.describe(include="all").transpose()
+        df.index.name = "column"
+        df = df.reset_index()
+    elif op == OP_TOP_N and not operation.get("limit"):
+        raise ValueError("top_n requires limit.")
+
+    df = _apply_sort(df, operation.get("sort_by"))
+
+    limit = operation.get("limit")
+    if limit:
+        df = df.head(int(limit))
+
+    return df
+
+
+class AnalyticsEngine:
+    """
+    Keep the last result set of every conversation as a DataFrame
+    and execute operations on it.
+
+    It is a singleton, bounded (LRU on conversations)
+    """
+
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self, max_conversations: int = 100):
+        # Only initialize attributes if they haven't been initialized yet
+        if not hasattr(self, "frames"):
+            # conv_id -> (request_text, DataFrame)
+            self.frames = OrderedDict()
+            self.max_conversations = max_conversations
+            self.lock = threading.Lock()
+
+    def set_result(self, conv_id: str, request_text: str, rows: List[dict]):
+        """
+        save the last result set for the conversation
+        """
+        if not rows:
+            return
+
+        df = rows_to_frame(rows)
+
+        with self.lock:
+            self.frames[conv_id] = (request_text, df)
+            self.frames.move_to_end(conv_id)
+            while len(self.frames) > self.max_conversations:
+                self.frames.popitem(last=False)
+
+    def has_result(self, conv_id: str) -> bool:
+        """
+        the conversation has a result set
+        """
+        with self.lock:
+            return conv_id in self.frames
+
+    def get_frame(self, conv_id: str) -> Optional[pd.DataFrame]:
+        """
+        return the last result set for the conversation, None if not available
+        """
+        with self.lock:
+            entry = self.frames.get(conv_id)
+            if entry is None:
+                return None
+            self.frames.move_to_end(conv_id)
+            return entry[1]
+
+    def describe_frame(self, conv_id: str) -> Optional[str]:
+        """
+        a short description of the data (request, columns and types),
+        used in the prompt to plan the operation
+        """
+        with self.lock:
+            entry = self.frames.get(conv_id)
+        if entry is None:
+            return None
+
+        request_text, df = entry
+        columns = "\n".join(f"- {col}: {dtype}" for col, dtype in df.dtypes.items())
+        return (
+            f"Data retrieved for request: {request_text}\n"
+            f"Rows: {len(df)}\nColumns:\n{columns}"
+        )
+
+    def execute(self, conv_id: str, operation: dict) -> pd.DataFrame:
+        """
+        execute the operation on the last result set of the conversation
+
+        Raises:
+            ValueError: if there are no data, or the operation is not valid
+        """
+        df = self.get_frame(conv_id)
+
+        if df is None:
+            raise ValueError(f"No data available for conversation: {conv_id}")
+
+        return execute_operation(df, operation)
+
+    def clear(self, conv_id: str):
+        """
+        remove the data of the conversation
+        """
+        with self.lock:
+            self.frames.pop(conv_id, None)
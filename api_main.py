@@ -1,7 +1,7 @@
 """
 File name: api_main.py
 Author: Luigi Saetta
-Date last modified: 2024-11-24
+Date last modified: 2026-10-19
 Python Version: 3.11
 
 Description:
@@ -27,9 +27,13 @@ Warnings:
     This module is in development, may change in future versions.
 """
 
-import os
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import StreamingResponse
+import asyncio
+from contextlib import asynccontextmanager
+from time import time
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Header
+from fastapi.responses import JSONResponse, StreamingResponse
+from langchain_core.messages import AIMessage, HumanMessage
 from pydantic import BaseModel
 import uvicorn
 
@@ -37,27 +41,28 @@ import uvicorn
 from opentelemetry import trace
 from tracer_singleton import TracerSingleton
 
-from conversation_manager import ConversationManager
-from llm_manager import LLMManager
-from dispatcher import Dispatcher
-from router_with_dispatcher import RouterWithDispatcher
-from config_reader import ConfigReader
-from sql_agent_factory import sql_agent_factory
+from admission_control import AdmissionRejected, release_at_end
+from app_container import AppContainer
+from config_reader import get_config
+from result_encoders import (
+    FORMAT_MARKDOWN,
+    FORMAT_NDJSON,
+    encode_rows,
+    get_encoder,
+    get_supported_formats,
+    negotiate_format,
+)
+from event_transport import (
+    TEXT_EVENT_STREAM,
+    SSE_HEADERS,
+    with_lifecycle,
+    tee_answer,
+    render_text,
+    encode_sse,
+    encode_data,
+)
 from utils import get_console_logger
 
-from config_private import COMPARTMENT_OCID
-from config_private import DB_USER, DB_PWD, DSN, WALLET_DIR, WALLET_PWD
-
-# create the struct from params in config_private
-CONNECT_ARGS = {
-    "user": DB_USER,
-    "password": DB_PWD,
-    "dsn": DSN,
-    "config_dir": WALLET_DIR,
-    "wallet_location": WALLET_DIR,
-    "wallet_password": WALLET_PWD,
-}
-
 # media types
 TEXT_PLAIN = "text/plain"
 
@@ -70,30 +75,111 @@ class UserRequest(BaseModel):
     # Unique conversation ID
     conv_id: str
     request_text: str
+    # markdown (default), ndjson, csv, arrow
+    # if not provided, it is taken from the Accept header
+    output_format: Optional[str] = None
 
 
 logger = get_console_logger()
 
-current_dir = os.path.dirname(os.path.abspath(__file__))
-config_path = os.path.join(current_dir, "config.toml")
-config = ConfigReader(config_path)
+# shared by all the modules
+config = get_config()
 
-VERBOSE = bool(config.find_key("verbose"))
-MAX_MSGS = config.find_key("max_msgs")
+VERBOSE = config.find_key("verbose")
+
+# all the components, created at startup (see lifespan)
+container = AppContainer(config)
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """
+    create the components and start the background tasks,
+    stop them at shutdown
+    """
+    await container.astart()
+    yield
+    await container.astop()
+
+
+app = FastAPI(lifespan=lifespan)
 
-# Initialize router and dispatcher
-llm_manager = LLMManager(
-    config,
-    compartment_id=COMPARTMENT_OCID,
-    logger=logger,
-)
-dispatcher = Dispatcher(config)
-router_w = RouterWithDispatcher(config, llm_manager, dispatcher)
 
-app = FastAPI()
+# the answers being saved in the history (references kept until done)
+save_tasks = set()
+
+
+async def asave_answer(conv_id: str, messages: list):
+    """
+    save request and answer in the history
+    (the store, if any, is used in a thread)
+    """
+    conversation_manager = container.conversation_manager
+    for msg in messages:
+        await conversation_manager.aadd_message(conv_id, msg)
+    # embedded in background, for the selection of the history
+    container.history_selector.schedule(messages)
+    # if too long, summarized in background
+    container.history_compactor.schedule(conv_id)
+
+
+def answer_saver(user_request: UserRequest):
+    """
+    returns the callback that saves request and answer in the history,
+    when the stream ends (see tee_answer)
+    """
+
+    def save_answer(answer: str, complete: bool):
+        if not complete:
+            logger.warning(
+                "Answer interrupted, saved as partial in conversation %s",
+                user_request.conv_id,
+            )
+
+        messages = [
+            HumanMessage(content=user_request.request_text),
+            AIMessage(content=answer),
+        ]
+        # in a task: the end of the stream doesn't wait for the store
+        task = asyncio.get_running_loop().create_task(
+            asave_answer(user_request.conv_id, messages)
+        )
+        save_tasks.add(task)
+        task.add_done_callback(save_tasks.discard)
+
+    return save_answer
+
+
+def with_history(events, user_request: UserRequest):
+    """
+    add the lifecycle events and save the answer in the history
+    """
+    return tee_answer(
+        with_lifecycle(events),
+        answer_saver(user_request),
+        max_chars=config.find_key("max_answer_chars"),
+    )
+
+
+async def admit(route: str, user_request: UserRequest):
+    """
+    admission control, before the routing
+
+    Returns:
+        the Permit, to release at the end of the stream (see release_at_end)
+
+    Raises:
+        HTTPException (429 or 503, with Retry-After) if not admitted
+    """
+    try:
+        return await container.admission.acquire(route, user_request.conv_id)
+    except AdmissionRejected as e:
+        if VERBOSE:
+            logger.info("%s, request rejected: %s", route, e.reason)
+        raise HTTPException(
+            status_code=e.status_code, detail=e.reason, headers=e.get_headers()
+        ) from e
 
-# Initialize ConversationManager
-conversation_manager = ConversationManager(max_msgs=MAX_MSGS, verbose=VERBOSE)
 
 # to integrate with OCI APM
 TRACER = TracerSingleton.get_instance()
@@ -101,9 +187,15 @@ TRACER = TracerSingleton.get_instance()
 
 @app.post("/streaming_chat")
 @TRACER.start_as_current_span("streaming_chat")
-async def streaming_chat(user_request: UserRequest):
+async def streaming_chat(
+    user_request: UserRequest, accept: Optional[str] = Header(default=None)
+):
     """
     handle the streaming chat
+
+    The output format is negotiated using the output_format field
+    or the Accept header: markdown in text/plain (default),
+    or data only in NDJSON, CSV, Arrow IPC stream.
     """
     current_span = trace.get_current_span()
 
@@ -119,18 +211,188 @@ async def streaming_chat(user_request: UserRequest):
     if VERBOSE:
         logger.info("streaming_chat, received request: %s", request_text)
 
-    # create the conversation, if not exists
-    conversation = conversation_manager.get_conversation(user_request.conv_id)
+    output_format = negotiate_format(accept, user_request.output_format)
+
+    if output_format is None:
+        raise HTTPException(
+            status_code=406,
+            detail=f"Supported formats are: {', '.join(get_supported_formats())}",
+        )
+
+    permit = await admit("streaming_chat", user_request)
+
+    if output_format != FORMAT_MARKDOWN:
+        return await streaming_data(user_request, output_format, permit)
 
     try:
-        response_stream = await router_w.route_request(user_request)
+        events = await container.router_w.route_request(user_request)
+
+        response_stream = render_text(
+            release_at_end(with_history(events, user_request), permit),
+            sample_rows=config.find_key("table_sample_rows"),
+            max_col_width=config.find_key("table_max_col_width"),
+            chunk_size=config.find_key("table_chunk_size"),
+        )
 
-        # TODO add response to history
         return StreamingResponse(response_stream, media_type=TEXT_PLAIN)
 
     except Exception as e:
+        permit.release()
+        logger.error("Error in streaming_chat: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error") from e
+    except BaseException:
+        # cancelled: the client has gone
+        permit.release()
+        raise
+
+
+async def streaming_data(user_request: UserRequest, output_format: str, permit):
+    """
+    stream only the data, in a machine-readable format
+    """
+    encoder = get_encoder(output_format)
+
+    try:
+        events = await container.router_w.route_data_request(user_request)
+    except Exception as e:
+        permit.release()
         logger.error("Error in streaming_chat: %s", e)
         raise HTTPException(status_code=500, detail="Internal server error") from e
+    except BaseException:
+        # cancelled: the client has gone
+        permit.release()
+        raise
+
+    if events is None:
+        permit.release()
+        # the request doesn't read data from the DB
+        raise HTTPException(
+            status_code=406,
+            detail=f"Request can't be answered in format: {output_format}",
+        )
+
+    return StreamingResponse(
+        encode_data(release_at_end(with_lifecycle(events), permit), encoder),
+        media_type=encoder.media_type,
+    )
+
+
+@app.post("/streaming_events")
+@TRACER.start_as_current_span("streaming_events")
+async def streaming_events(user_request: UserRequest):
+    """
+    handle the streaming chat, using Server-Sent Events
+
+    Events are typed (progress, classification, sql, columns, rows,
+    token, done, error) and carry timing metadata,
+    so that the client can update incrementally.
+    """
+    time_start = time()
+
+    current_span = trace.get_current_span()
+    request_text = user_request.request_text
+    current_span.set_attribute("genai-chat-input", request_text)
+
+    if not request_text.strip():
+        raise HTTPException(status_code=400, detail="Request cannot be empty.")
+
+    if VERBOSE:
+        logger.info("streaming_events, received request: %s", request_text)
+
+    permit = await admit("streaming_events", user_request)
+
+    try:
+        events = await container.router_w.route_request(user_request)
+
+        return StreamingResponse(
+            encode_sse(
+                release_at_end(with_history(events, user_request), permit),
+                time_start=time_start,
+            ),
+            media_type=TEXT_EVENT_STREAM,
+            headers=SSE_HEADERS,
+        )
+
+    except Exception as e:
+        permit.release()
+        logger.error("Error in streaming_events: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error") from e
+    except BaseException:
+        permit.release()
+        raise
+
+
+@app.get("/health/live")
+def health_live():
+    """
+    Liveness probe: the process is up and serving
+    """
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+def health_ready():
+    """
+    Readiness probe: 200 only when the warmup is completed
+    (DB pool filled, clients connected, SQL cache loaded),
+    503 while warming up or if the DB is not reachable (checked again,
+    with a ping, after the warmup)
+    """
+    readiness = container.get_readiness()
+
+    if readiness["status"] != "ready":
+        return JSONResponse(status_code=503, content=readiness)
+    return readiness
+
+
+@app.get("/metrics")
+def get_metrics():
+    """
+    Returns the internal metrics of the service
+    """
+    return {
+        "admission": container.admission.get_stats(),
+        "router": container.router_w.get_stats(),
+        "dispatcher": container.dispatcher.get_stats(),
+        "llm": container.llm_manager.get_stats(),
+        "response_cache": container.response_cache.get_stats(),
+        "history_selection": container.history_selector.get_stats(),
+        "history_compaction": container.history_compactor.get_stats(),
+        "conversations": container.conversation_manager.get_stats(),
+        "result_store": container.result_store.get_stats(),
+        "startup": container.get_stats(),
+    }
+
+
+@app.get("/results/{result_id}")
+def get_result(result_id: str, accept: Optional[str] = Header(default=None)):
+    """
+    Returns the full result of a query, by the result_id reported in the
+    conversation history when the result is summarized
+
+    The format is taken from the Accept header: NDJSON (default), CSV, Arrow IPC.
+    """
+    output_format = negotiate_format(accept)
+
+    if output_format is None:
+        raise HTTPException(
+            status_code=406,
+            detail=f"Supported formats are: {', '.join(get_supported_formats())}",
+        )
+    if output_format == FORMAT_MARKDOWN:
+        # only the data
+        output_format = FORMAT_NDJSON
+
+    rows = container.result_store.get(result_id)
+    if rows is None:
+        raise HTTPException(status_code=404, detail="Result not found.")
+
+    encoder = get_encoder(output_format)
+
+    return StreamingResponse(
+        encode_rows(rows, encoder, config.find_key("data_batch_size")),
+        media_type=encoder.media_type,
+    )
 
 
 @app.delete("/conversation/{conv_id}")
@@ -144,10 +406,12 @@ def delete_conversation(conv_id: str):
     Returns:
         dict: A message confirming the deletion.
     """
-    if conv_id not in conversation_manager.conversations:
+    if not container.conversation_manager.has_conversation(conv_id):
         raise HTTPException(status_code=404, detail="Conversation not found.")
 
-    conversation_manager.clear_conversation(conv_id)
+    container.conversation_manager.clear_conversation(conv_id)
+    # and its last result set
+    container.analytics_engine.clear(conv_id)
 
     return {
         "message": f"Conversation with ID '{conv_id}' has been deleted successfully."
@@ -159,17 +423,8 @@ def delete_conversation(conv_id: str):
 #
 if __name__ == "__main__":
     HOST = config.find_key("host")
-    PORT = int(config.find_key("port"))
-
-    # test DB connection is ok
-    sql_agent = sql_agent_factory(config)
-    sql_agent.get_db_connection()
-    logger.info("")
-    logger.info(
-        "DB connection as %s to DSN: %s OK...",
-        CONNECT_ARGS["user"],
-        CONNECT_ARGS["dsn"],
-    )
-    logger.info("")
+    PORT = config.find_key("port")
 
+    # the components are created at startup, then the warmup
+    # (DB pool, clients, SQL cache) runs in background: see /health/ready
     uvicorn.run(app, host=HOST, port=PORT)
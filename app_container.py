@@ -0,0 +1,511 @@
+"""
+File name: app_container.py
+Author: Luigi Saetta
+Date last modified: 2026-10-19
+Python Version: 3.11
+
+Description:
+    The application container: creates, at startup, all the components
+    of the service (LLM manager, conversations, caches, router...),
+    with a single shared config, and starts/stops the background tasks.
+
+    Nothing is created at import time: the container is started in the
+    FastAPI lifespan hook. The heavy clients (embeddings, LLM clients,
+    kNN index for routing) are created in parallel, in threads.
+    The time of every startup step is logged and exposed as stats.
+
+    Then a warmup phase runs in background: the saved SQL cache is loaded,
+    the DB pool is filled, the LLM and embedding connections are opened
+    and the SQL of the most requested questions is executed.
+    The instance is ready (see /health/ready) only when the warmup ends,
+    so that the load balancer sends traffic only to warmed instances.
+    Failed warmup steps are retried, with exponential backoff, and once
+    ready the DB is re-checked (ping) by the readiness probe.
+
+Inspired by:
+
+Usage:
+    Import this module into other scripts to use its functions.
+    Example:
+        container = AppContainer(get_config())
+
+        @asynccontextmanager
+        async def lifespan(app):
+            await container.astart()
+            yield
+            await container.astop()
+
+Dependencies:
+    langChain
+
+License:
+    This code is released under the MIT License.
+
+Notes:
+    This is a part of a set of demos showing how to build a SQL Agent
+    for Text2SQL tasks
+
+Warnings:
+    This module is in development, may change in future versions.
+"""
+
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+
+from config_reader import ConfigReader
+from llm_manager import LLMManager
+from conversation_manager import ConversationManager
+from conversation_store import create_conversation_store
+from sql_cache import SQLCache
+from sql_agent import SQLAgent
+from sql_agent_factory import sql_agent_factory
+from select_ai_sql_agent import close_pool
+from result_summarizer import ResultStore
+from analytics_engine import AnalyticsEngine
+from response_cache import SemanticResponseCache
+from history_selector import HistorySelector
+from history_compactor import HistoryCompactor
+from dispatcher import Dispatcher
+from router_with_dispatcher import RouterWithDispatcher
+from routing_cache import RoutingCache
+from knn_router import (
+    KNNRoutingClassifier,
+    parse_prompt_examples,
+    load_examples_file,
+)
+from prompt_routing import PROMPT_ROUTING_TEMPLATE
+from admission_control import AdmissionController
+from handlers import init_handlers
+from utils import get_console_logger
+
+from config_private import COMPARTMENT_OCID
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+class AppContainer:
+    """
+    The components of the service, created at startup
+    """
+
+    def __init__(self, config: ConfigReader):
+        self.config = config
+        self.logger = get_console_logger()
+
+        self.llm_manager: LLMManager = None
+        self.conversation_manager: ConversationManager = None
+        self.sql_cache: SQLCache = None
+        self.result_store: ResultStore = None
+        self.analytics_engine: AnalyticsEngine = None
+        self.response_cache: SemanticResponseCache = None
+        self.history_selector: HistorySelector = None
+        self.history_compactor: HistoryCompactor = None
+        self.knn_classifier: KNNRoutingClassifier = None
+        self.routing_cache: RoutingCache = None
+        self.dispatcher: Dispatcher = None
+        self.router_w: RouterWithDispatcher = None
+        self.sql_agent: SQLAgent = None
+        self.admission: AdmissionController = None
+
+        self.started = False
+        # step -> time (sec.)
+        self.startup_times = {}
+
+        # True when all the warmup steps are completed (and the DB is reachable)
+        self.ready = False
+        self._warmup_task = None
+        # step -> {"ok", "time", "attempts", "error"}
+        self.warmup_steps = {}
+        # the last check of the DB by the readiness probe
+        self.db_ok = False
+        self.db_checked = 0.0
+        self._db_check_lock = threading.Lock()
+
+    async def _atimed(self, step: str, func, *args, **kwargs):
+        """
+        run func in a thread, recording the time
+        """
+        time_start = time()
+        result = await asyncio.to_thread(func, *args, **kwargs)
+        self.startup_times[step] = round(time() - time_start, 3)
+        return result
+
+    def _create_components(self):
+        """
+        create the components (cheap: the clients are created on first use)
+        """
+        config = self.config
+
+        self.llm_manager = LLMManager(
+            config,
+            compartment_id=COMPARTMENT_OCID,
+            logger=self.logger,
+        )
+
+        # it is a singleton
+        self.conversation_manager = ConversationManager(
+            max_msgs=config.find_key("max_msgs"),
+            verbose=config.find_key("verbose"),
+            max_conversations=config.find_key("max_conversations"),
+            max_bytes=config.find_key("max_conversations_bytes"),
+            idle_ttl=config.find_key("conversation_idle_ttl"),
+            store=create_conversation_store(config),
+            batch_size=config.find_key("conversation_batch_size"),
+            version_ttl=config.find_key("conversation_version_ttl"),
+        )
+
+        # it is a singleton
+        self.sql_cache = SQLCache(max_size=1000)
+
+        # it is a singleton, with the full results of the last queries
+        self.result_store = ResultStore(
+            max_size=config.find_key("result_store_size"),
+            max_bytes=config.find_key("result_store_max_bytes"),
+        )
+
+        # it is a singleton, with the last result set of every conversation
+        self.analytics_engine = AnalyticsEngine(
+            max_conversations=config.find_key("analytics_max_conversations")
+        )
+
+        # it is a singleton, summarizes the older messages of long conversations
+        self.history_compactor = HistoryCompactor(
+            self.conversation_manager,
+            self.llm_manager,
+            model_index=config.find_key("index_model_compaction"),
+            token_threshold=config.find_key("compaction_token_threshold"),
+            n_recent=config.find_key("compaction_recent_msgs"),
+            msgs_margin=config.find_key("compaction_msgs_margin"),
+            data_max_chars=config.find_key("compaction_data_max_chars"),
+            enabled=config.find_key("history_compaction_enable"),
+        )
+
+        # the cache of the classifications (disabled for A/B runs with the flag)
+        self.routing_cache = RoutingCache(
+            max_size=config.find_key("routing_cache_max_size"),
+            ttl=config.find_key("routing_cache_ttl"),
+            enabled=config.find_key("routing_cache_enable"),
+        )
+        self.dispatcher = Dispatcher(config)
+        self.sql_agent = sql_agent_factory(config)
+
+        # in front of the router: concurrency, rate limits and load shedding
+        self.admission = AdmissionController(
+            max_concurrent=config.find_key("max_concurrent_requests"),
+            route_limits=dict(config.find_key("admission_route_limits") or {}),
+            queue_size=config.find_key("admission_queue_size"),
+            queue_timeout=config.find_key("admission_queue_timeout"),
+            conv_rate=config.find_key("conv_rate_limit"),
+            conv_burst=config.find_key("conv_rate_burst"),
+            max_buckets=config.find_key("conv_rate_max_conversations"),
+            enabled=config.find_key("admission_enable"),
+        )
+
+    def _create_embedding_components(self):
+        """
+        create the components using the embedding model
+        """
+        config = self.config
+        embed_model = self.llm_manager.get_embed_model()
+
+        # it is a singleton, with the answers to answer_directly requests
+        self.response_cache = SemanticResponseCache(
+            embed_model,
+            threshold=config.find_key("response_cache_threshold"),
+            ttl=config.find_key("response_cache_ttl"),
+            max_size=config.find_key("response_cache_max_size"),
+            enabled=config.find_key("response_cache_enable"),
+        )
+
+        # it is a singleton, selects the history sent to the LLM
+        self.history_selector = HistorySelector(
+            embed_model,
+            token_budget=config.find_key("history_token_budget"),
+            n_recent=config.find_key("history_recent_msgs"),
+            top_k=config.find_key("history_top_k"),
+            min_similarity=config.find_key("history_min_similarity"),
+            enabled=config.find_key("history_selection_enable"),
+        )
+
+    def _create_knn_classifier(self):
+        """
+        create the kNN classifier used before the routing LLM,
+        with the examples from the routing prompt and from the files in config
+        """
+        config = self.config
+
+        if not config.find_key("knn_routing_enable"):
+            return None
+
+        knn = KNNRoutingClassifier(
+            self.llm_manager.get_embed_model(),
+            k=config.find_key("knn_k"),
+            min_similarity=config.find_key("knn_min_similarity"),
+            min_margin=config.find_key("knn_min_margin"),
+            max_examples=config.find_key("knn_max_examples"),
+            min_votes=config.find_key("knn_min_votes"),
+        )
+
+        examples = parse_prompt_examples(PROMPT_ROUTING_TEMPLATE)
+        for file_name in config.find_key("knn_examples_files"):
+            examples += load_examples_file(os.path.join(current_dir, file_name))
+
+        try:
+            knn.add_examples(examples)
+        except Exception as e:
+            self.logger.error("Error creating the kNN index for routing: %s", e)
+
+        return knn
+
+    async def astart(self):
+        """
+        create the components and start the background tasks
+        """
+        config = self.config
+        time_start = time()
+
+        # the LLM streams without native async support are read
+        # in the default executor, one thread for every stream
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=config.find_key("executor_max_workers"))
+        )
+
+        await self._atimed("components", self._create_components)
+
+        # the heavy clients, in parallel
+        # (the LLM clients are created in the warmup)
+        _, self.knn_classifier, _ = await asyncio.gather(
+            self._atimed("embedding_components", self._create_embedding_components),
+            self._atimed("knn_classifier", self._create_knn_classifier),
+            # the SQL cache has its own client
+            self._atimed("sql_cache", lambda: self.sql_cache.embed_model),
+        )
+
+        self.router_w = RouterWithDispatcher(
+            config,
+            self.llm_manager,
+            self.dispatcher,
+            self.knn_classifier,
+            conversation_manager=self.conversation_manager,
+            routing_cache=self.routing_cache,
+        )
+        init_handlers(self)
+
+        # background tasks
+        self.conversation_manager.start_sweeper(
+            interval=config.find_key("conversation_sweep_interval")
+        )
+        # the messages are written to the conversation store in batches
+        self.conversation_manager.start_writer(
+            interval=config.find_key("conversation_flush_interval")
+        )
+        # config.toml is reloaded when it changes
+        reload_interval = config.find_key("config_reload_interval") or 0
+        if reload_interval > 0:
+            ConfigReader.start_watcher(reload_interval)
+
+        self.started = True
+        self.startup_times["total"] = round(time() - time_start, 3)
+        self.logger.info("Startup completed: %s", self.startup_times)
+
+        # in background: the process is live, but not ready
+        self._warmup_task = asyncio.create_task(self.awarmup())
+
+    def _get_sql_cache_path(self):
+        return os.path.join(current_dir, self.config.find_key("sql_cache_file"))
+
+    def _load_sql_cache(self):
+        if self.config.find_key("sql_cache_persist"):
+            self.sql_cache.load(self._get_sql_cache_path())
+
+    def _replay_top_requests(self, n: int):
+        """
+        execute the SQL of the most requested questions (only the first batch),
+        to warm the DB (connections, parsed statements, buffer cache)
+        """
+        batch_size = self.config.find_key("data_batch_size")
+
+        for _, sql in self.sql_cache.get_top_requests(n):
+            batches = self.sql_agent.execute_sql_batches(sql, batch_size=batch_size)
+            next(batches, None)
+            batches.close()
+
+    async def _awarmup_step(
+        self, step: str, func, *args, retry: bool = False, **kwargs
+    ) -> bool:
+        """
+        run a step of the warmup in a thread, recording time and errors
+
+        retry: if True, the step is retried (with exponential backoff)
+            until it succeeds or warmup_max_attempts is reached
+
+        Returns:
+            True if the step succeeded
+        """
+        max_attempts = self.config.find_key("warmup_max_attempts") or 0
+        delay = self.config.find_key("warmup_retry_delay")
+        max_delay = self.config.find_key("warmup_retry_max_delay")
+
+        time_start = time()
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                await asyncio.to_thread(func, *args, **kwargs)
+                self.warmup_steps[step] = {"ok": True}
+            except Exception as e:
+                self.logger.error(
+                    "Error in warmup step %s (attempt %d): %s", step, attempts, e
+                )
+                self.warmup_steps[step] = {"ok": False, "error": str(e)}
+
+            self.warmup_steps[step]["attempts"] = attempts
+            self.warmup_steps[step]["time"] = round(time() - time_start, 3)
+
+            if (
+                self.warmup_steps[step]["ok"]
+                or not retry
+                or (max_attempts and attempts >= max_attempts)
+            ):
+                return self.warmup_steps[step]["ok"]
+
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_delay)
+
+    async def _awarmup_db(self) -> bool:
+        """
+        fill the DB pool and warm the DB
+
+        Returns:
+            True if the DB is reachable
+        """
+        db_ok = await self._awarmup_step("db_pool", self.sql_agent.warmup, retry=True)
+
+        n_replay = self.config.find_key("warmup_replay_top_n") or 0
+        if db_ok and n_replay > 0:
+            # not needed to be ready
+            await self._awarmup_step("replay", self._replay_top_requests, n_replay)
+
+        self.db_ok = db_ok
+        self.db_checked = time()
+        self.logger.info("DB warmup completed, DB reachable: %s", db_ok)
+        return db_ok
+
+    async def awarmup(self):
+        """
+        the warmup, before the instance is ready
+        """
+        config = self.config
+        time_start = time()
+
+        # before the replay (local, fast)
+        await self._awarmup_step("sql_cache_load", self._load_sql_cache)
+
+        # the connections, in parallel
+        results = await asyncio.gather(
+            self._awarmup_db(),
+            self._awarmup_step(
+                "embeddings",
+                self.llm_manager.get_embed_model().embed_query,
+                "warmup",
+                retry=True,
+            ),
+            self._awarmup_step(
+                "llm",
+                self.llm_manager.warmup,
+                send_request=config.find_key("llm_warmup_request"),
+                retry=True,
+            ),
+        )
+
+        # ready only when the DB, the LLM and the embedding clients are warmed
+        # (the steps are retried until they succeed, or out of attempts)
+        self.ready = all(results)
+
+        self.logger.info(
+            "Warmup completed in %.2f sec., ready: %s", time() - time_start, self.ready
+        )
+
+    async def astop(self):
+        """
+        stop the background tasks and save the state
+        """
+        # no more traffic from the load balancer
+        self.ready = False
+        if self._warmup_task is not None and not self._warmup_task.done():
+            self._warmup_task.cancel()
+
+        ConfigReader.stop_watcher()
+
+        if self.conversation_manager is not None:
+            self.conversation_manager.stop_sweeper()
+            # the pending messages are written
+            self.conversation_manager.stop_writer()
+
+        # the classifications learned online by the kNN router
+        if self.knn_classifier is not None and self.config.find_key("knn_learn_online"):
+            self.knn_classifier.save_learned_examples(
+                os.path.join(
+                    current_dir, self.config.find_key("knn_learned_examples_file")
+                )
+            )
+
+        if self.sql_cache is not None and self.config.find_key("sql_cache_persist"):
+            try:
+                self.sql_cache.save(self._get_sql_cache_path())
+            except Exception as e:
+                self.logger.error("Error saving the SQL cache: %s", e)
+
+        if self.dispatcher is not None:
+            self.dispatcher.close()
+
+        close_pool()
+        self.started = False
+
+    def get_stats(self):
+        """
+        returns the stats of the startup
+        """
+        return {
+            "started": self.started,
+            "startup_times": dict(self.startup_times),
+            "ready": self.ready,
+            "db_ok": self.db_ok,
+            "warmup": dict(self.warmup_steps),
+        }
+
+    def check_db(self) -> bool:
+        """
+        check that the DB is reachable (a ping, with a connection of the pool),
+        at most every readiness_db_check_interval sec.
+        (blocking: called by the readiness probe, in a thread)
+        """
+        interval = self.config.find_key("readiness_db_check_interval")
+
+        with self._db_check_lock:
+            if time() - self.db_checked >= interval:
+                try:
+                    self.sql_agent.ping()
+                    self.db_ok = True
+                except Exception as e:
+                    self.logger.error("DB not reachable: %s", e)
+                    self.db_ok = False
+                self.db_checked = time()
+            return self.db_ok
+
+    def get_readiness(self):
+        """
+        the state of the instance, for the readiness probe
+        (once warmed up, the DB is re-checked)
+        """
+        if self.ready:
+            status = "ready" if self.check_db() else "db_unreachable"
+        elif self._warmup_task is not None and not self._warmup_task.done():
+            status = "warming_up"
+        else:
+            status = "not_ready"
+
+        return {"status": status, "warmup": dict(self.warmup_steps)}
@@ -0,0 +1,125 @@
+"""
+File name: chat_events.py
+Author: Luigi Saetta
+Date last modified: 2026-10-19
+Python Version: 3.11
+
+Description:
+    Typed events produced by the handlers while serving a request.
+    Handlers don't produce text: they yield events and the transport
+    layer (see event_transport.py) encodes them (text, SSE, data formats).
+
+Inspired by:
+
+Usage:
+    Import this module into other scripts to use its functions.
+    Example:
+        yield progress_event("Answer in preparation...")
+
+License:
+    This code is released under the MIT License.
+
+Notes:
+    This is a part of a set of demos showing how to build a SQL Agent
+    for Text2SQL tasks
+
+Warnings:
+    This module is in development, may change in future versions.
+"""
+
+from dataclasses import dataclass, field
+from enum import Enum
+from time import time
+from typing import Any, Dict, List, Optional
+
+
+class EventType(Enum):
+    """
+    The types of events sent to the client
+    """
+
+    PROGRESS = "progress"
+    CLASSIFICATION = "classification"
+    SQL = "sql"
+    COLUMNS = "columns"
+    ROWS = "rows"
+    TOKEN = "token"
+    DONE = "done"
+    ERROR = "error"
+
+
+@dataclass
+class ChatEvent:
+    """
+    A single event
+
+    type: the type of the event
+    data: the payload (dict, must be JSON serializable)
+    ts: when the event has been produced (epoch, sec.)
+    """
+
+    type: EventType
+    data: dict
+    ts: float = field(default_factory=time)
+
+
+def progress_event(message: str) -> ChatEvent:
+    """
+    a message on the progress of the request
+    """
+    return ChatEvent(EventType.PROGRESS, {"message": message})
+
+
+def classification_event(classification: str) -> ChatEvent:
+    """
+    the outcome of the router
+    """
+    return ChatEvent(EventType.CLASSIFICATION, {"classification": classification})
+
+
+def sql_event(sql: str) -> ChatEvent:
+    """
+    the SQL generated (or found in cache)
+    """
+    return ChatEvent(EventType.SQL, {"sql": sql})
+
+
+def columns_event(
+    columns: List[str], column_types: Optional[Dict[str, str]] = None
+) -> ChatEvent:
+    """
+    the columns of the result set, sent before the rows,
+    with their types in the DB, if known (see SQLAgent.execute_sql_batches)
+    """
+    data = {"columns": list(columns)}
+    if column_types:
+        data["types"] = dict(column_types)
+    return ChatEvent(EventType.COLUMNS, data)
+
+
+def rows_event(rows: List[dict]) -> ChatEvent:
+    """
+    a batch of rows of the result set
+    """
+    return ChatEvent(EventType.ROWS, {"rows": rows})
+
+
+def token_event(text: Any) -> ChatEvent:
+    """
+    a chunk of text generated by the LLM
+    """
+    return ChatEvent(EventType.TOKEN, {"text": str(text)})
+
+
+def done_event() -> ChatEvent:
+    """
+    the request has been completely served
+    """
+    return ChatEvent(EventType.DONE, {})
+
+
+def error_event(message: str) -> ChatEvent:
+    """
+    an error while serving the request
+    """
+    return ChatEvent(EventType.ERROR, {"message": message})
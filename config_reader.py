@@ -1,20 +1,36 @@
 """
 File name: config_reader.py
 Author: Luigi Saetta
-Date last modified: 2024-11-23
+Date last modified: 2026-10-19
 Python Version: 3.11
 
 Description:
     This file provide a class to handle the configuration
     read from a toml file
 
+    The file is compiled, when loaded, in a flat immutable index
+    (key -> value, in any section): find_key is a dict lookup.
+    The values of the keys with a type (key_types, for the config of the
+    service see config_types.py) are converted when compiling
+    (e.g. port = "8888" is an int): callers don't convert them on every
+    lookup. A file with a value that can't be converted is not loaded.
+    Keys defined in more than one section are reported (the first one wins,
+    as in a search of the file).
+    The file can be reloaded when it changes (hot reload), by a background
+    watcher: the index is replaced atomically.
+
 Inspired by:
-   
+
 
 Usage:
-    Import this module into other scripts to use its functions. 
+    Import this module into other scripts to use its functions.
     Example:
-
+        config = ConfigReader("config.toml", key_types={"port": int})
+        config.find_key("verbose")
+        # the config.toml of the service, shared by all the modules
+        config = get_config()
+        # reload the changed files, every 5 sec.
+        ConfigReader.start_watcher(5)
 
 License:
     This code is released under the MIT License.
@@ -25,40 +41,187 @@ Notes:
 
 Warnings:
     This module is in development, may change in future versions.
+    Values read at startup (e.g. to create objects) are not changed
+    by a reload, only the ones read with find_key when used.
 """
 
+import os
+import threading
+import weakref
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Any, Callable, Dict, List, Mapping, Optional
+
 import toml
+from config_types import CONFIG_KEY_TYPES, looks_typed
 from utils import get_console_logger
 
+# the config of the service
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.toml")
+
+
+def _freeze(value):
+    """
+    an immutable copy of a value of the file
+    """
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def compile_index(
+    data: Dict[str, Any], key_types: Optional[Mapping[str, Callable]] = None
+):
+    """
+    flatten the content of the file in an index: key -> value
+
+    key_types: key -> function converting the value (e.g. int)
+
+    Returns:
+        (index, duplicates): duplicates is a dict key -> list of the paths
+        where it is defined (only for keys defined more than once)
+
+    Raises:
+        ValueError if a value can't be converted to the type of its key
+    """
+    index = {}
+    paths: Dict[str, List[str]] = {}
+
+    def visit(dictionary, path):
+        for k, v in dictionary.items():
+            key_path = f"{path}.{k}" if path else k
+            paths.setdefault(k, []).append(key_path)
+            # the first found wins (same order of a recursive search)
+            if k not in index and v is not None:
+                index[k] = _freeze(v)
+            if isinstance(v, dict):
+                visit(v, key_path)
+
+    visit(data, "")
+
+    for k, to_type in (key_types or {}).items():
+        if k in index:
+            try:
+                index[k] = to_type(index[k])
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Invalid value for config key {k}: {e}") from e
+
+    duplicates = {k: v for k, v in paths.items() if len(v) > 1}
+    return MappingProxyType(index), duplicates
+
+
+def _section_items(data: Dict[str, Any]):
+    """
+    the (key, value) in the sections of the file (not in inline tables)
+    """
+    for k, v in data.items():
+        if isinstance(v, dict):
+            yield from v.items()
+        else:
+            yield k, v
+
 
 class ConfigReader:
     """
     Read the configuration from a toml file
     """
 
-    def __init__(self, file_path):
+    # all the readers, checked by the watcher
+    _readers = weakref.WeakSet()
+    _watcher = None
+    _stop_watcher = threading.Event()
+
+    def __init__(self, file_path, key_types: Optional[Mapping[str, Callable]] = None):
         """
         Initializes the TOML reader and loads the file into memory.
         :param file_path: Path to the TOML file
+        :param key_types: key -> function converting the value (e.g. int),
+            the other keys are returned as in the file
         """
         self.file_path = file_path
+        self.key_types = dict(key_types or {})
         self.data = None
+        self.index: Mapping[str, Any] = MappingProxyType({})
+        self.mtime = None
+        self.n_reloads = 0
         self.logger = get_console_logger()
         self.load_file()
 
+        ConfigReader._readers.add(self)
+
+    def _get_mtime(self):
+        try:
+            return os.stat(self.file_path).st_mtime_ns
+        except OSError:
+            return None
+
     def load_file(self):
         """
-        Reads the TOML file and stores it in a dictionary.
+        Reads the TOML file and compiles the index.
+
+        If the file can't be read (or has invalid values), the current index
+        is kept (empty on the first load).
         """
+        mtime = self._get_mtime()
+
         try:
             with open(self.file_path, "r", encoding="utf-8") as f:
-                self.data = toml.load(f)
+                data = toml.load(f)
+            index, duplicates = compile_index(data, self.key_types)
         except FileNotFoundError:
             self.logger.error("Error: The file %s does not exist.", self.file_path)
-            self.data = {}
+            self.data = self.data or {}
+            return False
         except Exception as e:
             self.logger.error("Error while reading the TOML file: %s", e)
-            self.data = {}
+            self.data = self.data or {}
+            return False
+
+        if self.key_types:
+            # probably a key missing in key_types (the keys of the sections)
+            for key, value in _section_items(data):
+                if key not in self.key_types and looks_typed(value):
+                    self.logger.warning(
+                        "Config key %s (%r) has no type, returned as in the file",
+                        key,
+                        value,
+                    )
+
+        for key, paths in duplicates.items():
+            self.logger.warning(
+                "Config key %s defined more than once: %s, using %s",
+                key,
+                ", ".join(paths),
+                paths[0],
+            )
+
+        # replaced atomically: readers see the old or the new config
+        self.data = data
+        self.index = index
+        self.mtime = mtime
+        return True
+
+    def reload_if_changed(self) -> bool:
+        """
+        Reloads the file if it has been modified.
+
+        Returns:
+            True if reloaded
+        """
+        mtime = self._get_mtime()
+        if mtime is None or mtime == self.mtime:
+            return False
+
+        if not self.load_file():
+            # the current config is kept, retried at the next check
+            # (e.g. the file was being written)
+            return False
+
+        self.n_reloads += 1
+        self.logger.info("Config reloaded from %s", self.file_path)
+        return True
 
     def find_key(self, key_name):
         """
@@ -66,19 +229,55 @@ class ConfigReader:
         :param key_name: Name of the key to search for
         :return: The value associated with the key if found, otherwise None
         """
+        return self.index.get(key_name)
 
-        def recursive_search(dictionary, target_key):
-            for k, v in dictionary.items():
-                if k == target_key:
-                    return v
-                if isinstance(v, dict):
-                    result = recursive_search(v, target_key)
-                    if result is not None:
-                        return result
-            return None
+    def get_snapshot(self) -> Mapping[str, Any]:
+        """
+        the current (immutable) index: to read several keys consistently
+        """
+        return self.index
 
-        # Search for the key in the already loaded file
-        if self.data is None:
-            self.logger.error("Error: No TOML file loaded.")
-            return None
-        return recursive_search(self.data, key_name)
+    @classmethod
+    def start_watcher(cls, interval: float = 5):
+        """
+        Starts a background thread that reloads the files changed,
+        checked every interval seconds.
+        """
+        if cls._watcher is not None and cls._watcher.is_alive():
+            return
+
+        cls._stop_watcher.clear()
+
+        def watch():
+            while not cls._stop_watcher.wait(interval):
+                for reader in list(cls._readers):
+                    try:
+                        reader.reload_if_changed()
+                    except Exception as e:
+                        reader.logger.error("Error reloading the config: %s", e)
+
+        cls._watcher = threading.Thread(
+            target=watch, name="config-watcher", daemon=True
+        )
+        cls._watcher.start()
+
+    @classmethod
+    def stop_watcher(cls):
+        """
+        Stops the background watcher.
+        """
+        cls._stop_watcher.set()
+        if cls._watcher is not None:
+            cls._watcher.join()
+            cls._watcher = None
+
+
+@lru_cache(maxsize=None)
+def get_config(file_path: str = CONFIG_PATH) -> ConfigReader:
+    """
+    the ConfigReader of the file, shared: the file is read only once
+    (then reloaded by the watcher, if started).
+    The config of the service has the types of config_types.py
+    """
+    key_types = CONFIG_KEY_TYPES if file_path == CONFIG_PATH else None
+    return ConfigReader(file_path, key_types)
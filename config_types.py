@@ -0,0 +1,177 @@
+"""
+File name: config_types.py
+Author: Luigi Saetta
+Date last modified: 2026-10-19
+Python Version: 3.11
+
+Description:
+    The types of the keys of the config of the service (config.toml),
+    used by get_config (see config_reader.py): the values are converted
+    once, when the file is loaded.
+    A key with a bool or numeric value not listed here is returned
+    as in the file, with a warning when the file is loaded.
+
+Inspired by:
+
+Usage:
+    Import this module into other scripts to use its functions.
+    Example:
+        config = ConfigReader("config.toml", CONFIG_KEY_TYPES)
+
+License:
+    This code is released under the MIT License.
+
+Notes:
+    This is a part of a set of demos showing how to build a SQL Agent
+    for Text2SQL tasks
+
+Warnings:
+    This module is in development, may change in future versions.
+"""
+
+
+def to_bool(value) -> bool:
+    """
+    a boolean from the file (also "true"/"false" and 0/1)
+    """
+    if isinstance(value, str) and value.lower() in ("true", "false"):
+        return value.lower() == "true"
+    if isinstance(value, (bool, int)):
+        return bool(value)
+    raise ValueError(f"not a boolean: {value!r}")
+
+
+# the type of the keys of config.toml (the others are returned as in the file)
+# add here every new key with a bool or numeric value
+CONFIG_KEY_TYPES = {
+    **dict.fromkeys(
+        [
+            "verbose",
+            "debug",
+            "admission_enable",
+            "knn_routing_enable",
+            "knn_learn_online",
+            "routing_cache_enable",
+            "return_sql",
+            "db_pool_enable",
+            "hedge_enable",
+            "llm_warmup_request",
+            "analytics_enable",
+            "analytics_direct_answer",
+            "sql_cache_persist",
+            "history_selection_enable",
+            "history_compaction_enable",
+            "cascade_enable",
+            "response_cache_enable",
+            "speculative_enable",
+            "speculative_generate_sql",
+            "trace_enable",
+        ],
+        to_bool,
+    ),
+    **dict.fromkeys(
+        [
+            "port",
+            "max_tokens",
+            "max_concurrent_requests",
+            "admission_queue_size",
+            "conv_rate_max_conversations",
+            "max_concurrent_llm",
+            "max_concurrent_db",
+            "db_executor_workers",
+            "max_concurrent_analyze_data",
+            "max_msgs",
+            "max_conversations",
+            "max_conversations_bytes",
+            "conversation_batch_size",
+            "max_answer_chars",
+            "index_model_for_routing",
+            "index_model_answer_directly",
+            "index_model_analyze_data",
+            "index_model_analytics",
+            "index_model_compaction",
+            "executor_max_workers",
+            "hedge_min_samples",
+            "endpoint_failure_threshold",
+            "knn_k",
+            "knn_min_votes",
+            "knn_max_examples",
+            "routing_cache_max_size",
+            "db_pool_min",
+            "db_pool_max",
+            "db_pool_increment",
+            "table_sample_rows",
+            "table_max_col_width",
+            "table_chunk_size",
+            "data_batch_size",
+            "result_token_budget",
+            "result_sample_rows",
+            "result_top_values",
+            "result_store_size",
+            "result_store_max_bytes",
+            "result_max_rows",
+            "analytics_max_conversations",
+            "warmup_replay_top_n",
+            "warmup_max_attempts",
+            "history_token_budget",
+            "history_recent_msgs",
+            "history_top_k",
+            "compaction_token_threshold",
+            "compaction_msgs_margin",
+            "compaction_recent_msgs",
+            "compaction_data_max_chars",
+            "response_cache_max_size",
+            "response_cache_chunk_size",
+        ],
+        int,
+    ),
+    **dict.fromkeys(
+        [
+            "config_reload_interval",
+            "api_timeout",
+            "admission_queue_timeout",
+            "conv_rate_limit",
+            "conv_rate_burst",
+            "timeout_generate_sql",
+            "timeout_analyze_data",
+            "timeout_answer_directly",
+            "conversation_idle_ttl",
+            "conversation_sweep_interval",
+            "conversation_flush_interval",
+            "conversation_version_ttl",
+            "temperature",
+            "endpoint_ewma_alpha",
+            "endpoint_open_time",
+            "hedge_min_delay",
+            "knn_min_similarity",
+            "knn_min_margin",
+            "routing_cache_ttl",
+            "db_pool_wait_timeout",
+            "zero_distance",
+            "warmup_retry_delay",
+            "warmup_retry_max_delay",
+            "readiness_db_check_interval",
+            "history_min_similarity",
+            "response_cache_threshold",
+            "response_cache_ttl",
+        ],
+        float,
+    ),
+}
+
+
+def looks_typed(value) -> bool:
+    """
+    the value looks like a bool or a number (to be listed in the types)
+    """
+    if isinstance(value, (bool, int, float)):
+        return True
+    if isinstance(value, str):
+        if value.lower() in ("true", "false"):
+            return True
+        try:
+            float(value)
+            return True
+        except ValueError:
+            return False
+    return False
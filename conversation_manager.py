@@ -1,7 +1,7 @@
 """
 Module: conversation_manager.py
 Author: Luigi Saetta
-Date last modified: 2024-11-29
+Date last modified: 2026-10-19
 Python Version: 3.11
 
 Description:
@@ -9,25 +9,136 @@ Description:
     in a database-independent format, preparing for external storage while returning
     BaseMessage objects when required.
 
+    Memory is bounded: every conversation keeps at most max_msgs messages,
+    conversations are evicted (LRU) above max_conversations or max_bytes
+    and expired after idle_ttl seconds, by a background sweeper.
+
+    With a store (see conversation_store.py), the history is shared by all
+    the workers: the conversations in memory are a read-through cache
+    (validated with the version in the store, at most every version_ttl sec.,
+    outside the lock; the async methods do it in a thread) and appends
+    are written in batches by a background writer. The handlers use
+    the async methods (aadd_message, aget_conversation): the event loop
+    never waits for the store.
+
+    Messages are kept as compact records (MessageRecord), the LangChain
+    messages are built once and every conversation has a cached, immutable
+    view (shared by routing and answering), rebuilt only after a change.
+
+    The oldest messages can be replaced by a summary (compact), see
+    history_compactor.py.
+
 License:
     This code is released under the MIT License.
 """
 
-from typing import Dict, List, Union
+import asyncio
+import sys
+import threading
+from collections import OrderedDict, deque
+from time import time
+from typing import Deque, Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
 from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, AIMessage
+from conversation_store import ConversationStore
 from utils import get_console_logger
 
+# prefix of the system messages with the data retrieved from the DB
+DATA_MSG_PREFIX = "Data retrieved for request"
+# prefix of the system message with the summary of the older messages
+SUMMARY_MSG_PREFIX = "Summary of the previous conversation"
+
+# roles are interned: one string shared by all the records
+ROLE_HUMAN = sys.intern("human")
+ROLE_SYSTEM = sys.intern("system")
+ROLE_AI = sys.intern("ai")
+
+MESSAGE_CLASSES = {
+    ROLE_HUMAN: HumanMessage,
+    ROLE_SYSTEM: SystemMessage,
+    ROLE_AI: AIMessage,
+}
+
+
+class MessageRecord:
+    """
+    A message of the history, independent of LangChain.
+
+    The LangChain message is built on first use and reused
+    (it shares the content, stored once).
+    """
+
+    __slots__ = ("role", "content", "size", "_message")
+
+    def __init__(self, role: str, content: str):
+        if role not in MESSAGE_CLASSES:
+            raise ValueError(f"Unknown role '{role}' in message.")
+
+        self.role = sys.intern(role)
+        self.content = content
+        # size (UTF-8) of the content
+        self.size = len(content.encode("utf-8"))
+        self._message = None
+
+    @classmethod
+    def from_message(cls, msg: BaseMessage) -> "MessageRecord":
+        """
+        the record of a LangChain message
+        """
+        if isinstance(msg, HumanMessage):
+            return cls(ROLE_HUMAN, msg.content)
+        if isinstance(msg, SystemMessage):
+            return cls(ROLE_SYSTEM, msg.content)
+        if isinstance(msg, AIMessage):
+            return cls(ROLE_AI, msg.content)
+        raise ValueError(f"Unknown message type: {type(msg)}")
+
+    @classmethod
+    def from_dict(cls, msg_dict: Dict[str, Union[str, None]]) -> "MessageRecord":
+        """
+        the record of a message stored as dict (role, content)
+        """
+        return cls(msg_dict.get("role"), msg_dict.get("content") or "")
+
+    def to_dict(self) -> Dict[str, str]:
+        """
+        the message as dict (role, content), as stored
+        """
+        return {"role": self.role, "content": self.content}
+
+    def to_message(self) -> BaseMessage:
+        """
+        the LangChain message (not to be modified, it is shared)
+        """
+        if self._message is None:
+            self._message = MESSAGE_CLASSES[self.role](content=self.content)
+        return self._message
+
+
+class ConversationView(NamedTuple):
+    """
+    The cached view of a conversation
+    """
+
+    messages: Tuple[BaseMessage, ...]
+    has_data: bool
+
+
+EMPTY_VIEW = ConversationView(messages=(), has_data=False)
+
 
 class ConversationManager:
     """
     A Singleton class to manage conversation history for an AI Assistant.
 
-    Stores messages as dictionaries but reconstructs BaseMessage objects
-    when fetching conversation history.
+    Stores messages as compact records, returning an immutable
+    (cached) sequence of BaseMessage objects when fetching conversation history.
 
     Attributes:
         verbose (bool): Flag to enable verbose logging.
         max_msgs (int): Maximum number of messages to retain in a conversation.
+        max_conversations (int): Maximum number of conversations kept.
+        max_bytes (int): Maximum size of the content of all the messages.
+        idle_ttl (float): Seconds after which an idle conversation is removed.
         logger: Logger instance for logging messages.
     """
 
@@ -41,72 +152,221 @@ class ConversationManager:
             cls._instance = super().__new__(cls)
         return cls._instance
 
-    def __init__(self, max_msgs: int, verbose: bool = False):
+    def __init__(
+        self,
+        max_msgs: int,
+        verbose: bool = False,
+        max_conversations: int = 1000,
+        max_bytes: int = 100_000_000,
+        idle_ttl: float = 3600,
+        store: Optional[ConversationStore] = None,
+        batch_size: int = 50,
+        version_ttl: float = 0.5,
+    ):
         """
         Initializes the conversation manager.
 
         Args:
             max_msgs (int): Maximum number of messages to retain in a conversation.
             verbose (bool): Flag to enable verbose logging. Default is False.
+            max_conversations (int): Maximum number of conversations kept (LRU).
+            max_bytes (int): Maximum size (UTF-8) of the content of all messages.
+            idle_ttl (float): Seconds after which an idle conversation is removed.
+            store (ConversationStore): Shared storage; if None, the history
+                is kept only in memory.
+            batch_size (int): Max n. of messages written to the store at once.
+            version_ttl (float): Seconds during which a conversation in memory
+                is used without checking its version in the store.
         """
         # Only initialize attributes if they haven't been initialized yet
         if not hasattr(self, "conversations"):
-            self.conversations: Dict[str, List[Dict[str, Union[str, None]]]] = {}
+            # ordered from the least recently used
+            self.conversations: OrderedDict[str, Deque[MessageRecord]] = OrderedDict()
+            # conv_id -> cached view, removed when the conversation changes
+            self.views: Dict[str, ConversationView] = {}
+            # conv_id -> time of last access
+            self.last_access: Dict[str, float] = {}
+            # conv_id -> size of the content of the messages
+            self.sizes: Dict[str, int] = {}
+            self.total_bytes = 0
+            # conv_id -> last classification made by the router
+            self.last_classifications: Dict[str, str] = {}
             self.max_msgs = max_msgs
+            self.max_conversations = max_conversations
+            self.max_bytes = max_bytes
+            self.idle_ttl = idle_ttl
             self.verbose = verbose
             self.logger = get_console_logger()
-
-    def _get_role(self, msg: BaseMessage) -> str:
+            # the sweeper runs in another thread
+            self.lock = threading.RLock()
+            self._sweeper = None
+            self._stop_sweeper = threading.Event()
+
+            self.store = store
+            self.batch_size = batch_size
+            # conv_id -> version in the store of the messages in memory
+            # (None: to be re-loaded)
+            self.versions: Dict[str, Optional[int]] = {}
+            self.version_ttl = version_ttl
+            # conv_id -> time of the last check of the version in the store
+            self.validated: Dict[str, float] = {}
+            # messages not yet written in the store: (conv_id, record)
+            self.pending = []
+            # conv_id -> n. of messages not yet written
+            self.pending_counts: Dict[str, int] = {}
+            self._flush_lock = threading.Lock()
+            self._writer = None
+            self._stop_writer = threading.Event()
+            self._flush_event = threading.Event()
+
+            # stats
+            self.n_evicted = 0
+            self.n_expired = 0
+            self.n_cache_hits = 0
+            self.n_store_loads = 0
+            self.n_view_hits = 0
+            self.n_view_builds = 0
+
+    def _touch(self, conv_id: str):
         """
-        Get the role from the type of msg.
+        mark the conversation as the most recently used
         """
-        if isinstance(msg, HumanMessage):
-            return "human"
-        if isinstance(msg, SystemMessage):
-            return "system"
-        if isinstance(msg, AIMessage):
-            return "ai"
-        raise ValueError(f"Unknown message type: {type(msg)}")
-
-    def _message_to_dict(self, msg: BaseMessage) -> Dict[str, Union[str, None]]:
+        self.conversations.move_to_end(conv_id)
+        self.last_access[conv_id] = time()
+
+    def _remove(self, conv_id: str):
+        self.total_bytes -= self.sizes.pop(conv_id, 0)
+        del self.conversations[conv_id]
+        self.last_access.pop(conv_id, None)
+        self.last_classifications.pop(conv_id, None)
+        self.versions.pop(conv_id, None)
+        self.validated.pop(conv_id, None)
+        self.views.pop(conv_id, None)
+
+    def _load_from_store(
+        self, conv_id: str, loaded: Optional[Tuple[List[Dict], int]] = None
+    ) -> bool:
         """
-        Converts a BaseMessage to a dictionary format.
+        (re)load the conversation in memory from the store,
+        with the messages not yet written
 
-        Args:
-            msg (BaseMessage): The message object to convert.
+        loaded: the messages and the version, if already read from the store
 
         Returns:
-            Dict[str, Union[str, None]]: A dictionary with `role` and `content`.
+            bool: False if the conversation doesn't exist
         """
-        role = self._get_role(msg)
-
-        return {
-            "role": role,
-            "content": msg.content,
-        }
-
-    def _dict_to_message(self, msg_dict: Dict[str, Union[str, None]]) -> BaseMessage:
+        if loaded is None:
+            loaded = self.store.load(conv_id, self.max_msgs)
+        messages, version = loaded
+        self.n_store_loads += 1
+
+        records = [MessageRecord.from_dict(msg_dict) for msg_dict in messages]
+        records += [record for c_id, record in self.pending if c_id == conv_id]
+        if not records and conv_id not in self.conversations:
+            return False
+
+        conversation = deque(records, maxlen=self.max_msgs)
+        size = sum(record.size for record in conversation)
+
+        self.total_bytes += size - self.sizes.get(conv_id, 0)
+        self.sizes[conv_id] = size
+        self.conversations[conv_id] = conversation
+        self.versions[conv_id] = version
+        self.validated[conv_id] = time()
+        self.views.pop(conv_id, None)
+        self._touch(conv_id)
+        return True
+
+    def _is_fresh(self, conv_id: str) -> bool:
+        """
+        the conversation in memory can be used without checking the store
         """
-        Converts a dictionary back to a BaseMessage based on the role.
+        return conv_id in self.conversations and bool(
+            # the messages not yet written are only here
+            self.pending_counts.get(conv_id)
+            or time() - self.validated.get(conv_id, 0.0) < self.version_ttl
+        )
 
-        Args:
-            msg_dict (Dict[str, Union[str, None]]): The message dictionary.
+    def _needs_check(self, conv_id: str) -> bool:
+        return self.store is not None and not self._is_fresh(conv_id)
 
-        Returns:
-            BaseMessage: A reconstructed BaseMessage object of the correct type.
+    def _validate(self, conv_id: str):
+        """
+        check the version in the store and reload the conversation
+        if it has changed (the round trips without the lock)
+        """
+        with self.lock:
+            if self._is_fresh(conv_id):
+                self.n_cache_hits += 1
+                return
+            in_memory = conv_id in self.conversations
+            known_version = self.versions.get(conv_id)
+
+        if in_memory and self.store.version(conv_id) == known_version:
+            with self.lock:
+                if conv_id in self.conversations:
+                    self.validated[conv_id] = time()
+                self.n_cache_hits += 1
+            return
+
+        loaded = self.store.load(conv_id, self.max_msgs)
+
+        with self.lock:
+            # changed in the meantime (messages added or already reloaded)
+            if self._is_fresh(conv_id) or self.versions.get(conv_id) != known_version:
+                return
+            self._load_from_store(conv_id, loaded)
+
+    def _get_view(self, conv_id: str, validate: bool = True) -> ConversationView:
         """
-        role = msg_dict.get("role")
-        content = msg_dict.get("content", "")
+        the view of the conversation, from memory if up to date
 
-        if role == "human":
-            return HumanMessage(content=content)
-        if role == "system":
-            return SystemMessage(content=content)
-        if role == "ai":
-            return AIMessage(content=content)
+        validate: check the store (False if just done)
+        """
+        if validate and self._needs_check(conv_id):
+            self._validate(conv_id)
+
+        with self.lock:
+            if conv_id not in self.conversations:
+                return EMPTY_VIEW
+
+            self._touch(conv_id)
+
+            view = self.views.get(conv_id)
+            if view is not None:
+                self.n_view_hits += 1
+                return view
+
+            records = self.conversations[conv_id]
+            view = ConversationView(
+                messages=tuple(record.to_message() for record in records),
+                has_data=any(
+                    record.role is ROLE_SYSTEM
+                    and record.content.startswith(DATA_MSG_PREFIX)
+                    for record in records
+                ),
+            )
+            self.views[conv_id] = view
+            self.n_view_builds += 1
+            return view
+
+    def _enforce_limits(self, current_id: str):
+        """
+        evict the least recently used conversations, above the limits
+        (the current one is never evicted)
+        """
+        while (
+            len(self.conversations) > self.max_conversations
+            or self.total_bytes > self.max_bytes
+        ):
+            oldest_id = next(iter(self.conversations))
+            if oldest_id == current_id:
+                break
 
-        self.logger.warning("Unknown role '%s' encountered in message.", role)
-        raise ValueError(f"Unknown role '{role}' in message dictionary.")
+            if self.verbose:
+                self.logger.info("Evicting conversation with ID: %s", oldest_id)
+            self._remove(oldest_id)
+            self.n_evicted += 1
 
     def add_message(self, conv_id: str, msg: BaseMessage):
         """
@@ -119,22 +379,177 @@ class ConversationManager:
             conv_id (str): The unique identifier for the conversation.
             msg (BaseMessage): The message to add.
         """
-        if conv_id not in self.conversations:
-            self.logger.info("Creating new conversation with ID: %s", conv_id)
-            self.conversations[conv_id] = []
-
-        # Convert the BaseMessage to a dictionary and add it
         # Messages are stored in a format that is independent of LangChain
-        conversation = self.conversations[conv_id]
-        conversation.append(self._message_to_dict(msg))
+        record = MessageRecord.from_message(msg)
+
+        # not in memory: read from the store, without the lock
+        loaded = None
+        if self.store is not None:
+            with self.lock:
+                in_memory = conv_id in self.conversations
+            if not in_memory:
+                loaded = self.store.load(conv_id, self.max_msgs)
+
+        with self.lock:
+            if (
+                loaded is not None
+                and conv_id not in self.conversations
+                and self._load_from_store(conv_id, loaded)
+            ):
+                self.logger.info("Loaded conversation with ID: %s", conv_id)
+
+            if conv_id not in self.conversations:
+                self.logger.info("Creating new conversation with ID: %s", conv_id)
+                self.conversations[conv_id] = deque(maxlen=self.max_msgs)
+                self.sizes[conv_id] = 0
+                self.versions[conv_id] = 0
+
+            conversation = self.conversations[conv_id]
+
+            # Trim conversation to maximum allowed messages
+            # (the deque removes the oldest, O(1))
+            if len(conversation) == self.max_msgs:
+                if self.verbose:
+                    self.logger.info("Trimming conversation with ID: %s", conv_id)
+                removed_size = conversation[0].size
+                self.sizes[conv_id] -= removed_size
+                self.total_bytes -= removed_size
+
+            conversation.append(record)
+            self.sizes[conv_id] += record.size
+            self.total_bytes += record.size
+            self.views.pop(conv_id, None)
+
+            self._touch(conv_id)
+            self._enforce_limits(conv_id)
+
+            if self.store is None:
+                return
+
+            self.pending.append((conv_id, record))
+            self.pending_counts[conv_id] = self.pending_counts.get(conv_id, 0) + 1
+            n_pending = len(self.pending)
+
+        if self._writer is None:
+            # no background writer: written immediately
+            self.flush()
+        elif n_pending >= self.batch_size:
+            self._flush_event.set()
+
+    def flush(self):
+        """
+        Writes the pending messages to the store, one append for every conversation.
+        """
+        if self.store is None:
+            return
+
+        with self._flush_lock:
+            with self.lock:
+                batch, self.pending = self.pending, []
+
+            if not batch:
+                return
+
+            # grouped by conversation, in order
+            by_conv: Dict[str, List[MessageRecord]] = {}
+            for conv_id, record in batch:
+                by_conv.setdefault(conv_id, []).append(record)
+
+            for conv_id, records in by_conv.items():
+                try:
+                    version_before, version_after = self.store.append(
+                        conv_id, [record.to_dict() for record in records]
+                    )
+                except Exception as e:
+                    self.logger.error("Error writing conversation %s: %s", conv_id, e)
+                    # to be retried
+                    with self.lock:
+                        self.pending = [
+                            (conv_id, record) for record in records
+                        ] + self.pending
+                    continue
+
+                with self.lock:
+                    self.pending_counts[conv_id] -= len(records)
+                    if not self.pending_counts[conv_id]:
+                        del self.pending_counts[conv_id]
+
+                    if conv_id in self.conversations:
+                        # if another worker has written in between,
+                        # the conversation will be re-loaded
+                        self.versions[conv_id] = (
+                            version_after
+                            if self.versions.get(conv_id) == version_before
+                            else None
+                        )
+
+    def start_writer(self, interval: float = 0.05):
+        """
+        Starts a background thread that writes the pending messages
+        every interval seconds (or when batch_size messages are pending).
+        """
+        if self.store is None or (self._writer is not None and self._writer.is_alive()):
+            return
+
+        self._stop_writer.clear()
+
+        def write():
+            while not self._stop_writer.is_set():
+                self._flush_event.wait(interval)
+                self._flush_event.clear()
+                try:
+                    self.flush()
+                except Exception as e:
+                    self.logger.error("Error in conversation writer: %s", e)
+
+        self._writer = threading.Thread(
+            target=write, name="conversation-writer", daemon=True
+        )
+        self._writer.start()
+
+    def stop_writer(self):
+        """
+        Stops the background writer, writing the pending messages.
+        """
+        self._stop_writer.set()
+        self._flush_event.set()
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+        self.flush()
+
+    async def _avalidate(self, conv_id: str):
+        """
+        check the store in a thread: the event loop is not blocked
+        """
+        if self._needs_check(conv_id):
+            await asyncio.to_thread(self._validate, conv_id)
 
-        # Trim conversation to maximum allowed messages
-        if len(conversation) > self.max_msgs:
-            if self.verbose:
-                self.logger.info("Trimming conversation with ID: %s", conv_id)
-            conversation.pop(0)
+    async def aadd_message(self, conv_id: str, msg: BaseMessage):
+        """
+        async version of add_message, for the handlers: the store
+        (load, or write if there is no background writer) is used in a thread
+        """
+        if self.store is None:
+            self.add_message(conv_id, msg)
+        else:
+            await asyncio.to_thread(self.add_message, conv_id, msg)
+
+    async def aget_conversation(self, conv_id: str) -> Tuple[BaseMessage, ...]:
+        """
+        async version of get_conversation, for the handlers
+        """
+        await self._avalidate(conv_id)
+        return self._get_view(conv_id, validate=False).messages
+
+    async def ahas_data(self, conv_id: str) -> bool:
+        """
+        async version of has_data, for the router
+        """
+        await self._avalidate(conv_id)
+        return self._get_view(conv_id, validate=False).has_data
 
-    def get_conversation(self, conv_id: str) -> List[BaseMessage]:
+    def get_conversation(self, conv_id: str) -> Tuple[BaseMessage, ...]:
         """
         Retrieves the conversation history for a given ID.
 
@@ -142,15 +557,118 @@ class ConversationManager:
             conv_id (str): The unique identifier for the conversation.
 
         Returns:
-            List[BaseMessage]: The list of messages reconstructed as BaseMessage objects.
+            Tuple[BaseMessage, ...]: The messages as BaseMessage objects
+                (empty if the conversation doesn't exist). It is shared:
+                the messages must not be modified.
+        """
+        return self._get_view(conv_id).messages
+
+    def compact(
+        self,
+        conv_id: str,
+        replaced: Sequence[BaseMessage],
+        messages: Sequence[BaseMessage],
+    ) -> bool:
+        """
+        Replaces the oldest messages of the conversation with other messages
+        (e.g. a summary).
+
+        Args:
+            conv_id (str): The unique identifier for the conversation.
+            replaced (Sequence[BaseMessage]): The oldest messages, as returned
+                by get_conversation.
+            messages (Sequence[BaseMessage]): The messages that replace them.
+
+        Returns:
+            bool: False if the conversation has changed in the meantime
+                (nothing is replaced).
+        """
+        # the store must be up to date
+        self.flush()
+
+        with self.lock:
+            conversation = self.conversations.get(conv_id)
+
+            if (
+                conversation is None
+                or len(conversation) < len(replaced)
+                or self.pending_counts.get(conv_id)
+                # the messages are shared, the same objects if not changed
+                or any(
+                    record.to_message() is not msg
+                    for record, msg in zip(conversation, replaced)
+                )
+            ):
+                return False
+
+            records = [MessageRecord.from_message(msg) for msg in messages]
+            records += list(conversation)[len(replaced) :]
+
+            if self.store is not None:
+                version = self.versions.get(conv_id)
+                new_version = (
+                    None
+                    if version is None
+                    else self.store.replace(
+                        conv_id, [record.to_dict() for record in records], version
+                    )
+                )
+                if new_version is None:
+                    # changed by another worker, to be re-loaded
+                    self.versions[conv_id] = None
+                    return False
+                self.versions[conv_id] = new_version
+
+            conversation = deque(records, maxlen=self.max_msgs)
+            size = sum(record.size for record in conversation)
+
+            self.total_bytes += size - self.sizes[conv_id]
+            self.sizes[conv_id] = size
+            self.conversations[conv_id] = conversation
+            self.views.pop(conv_id, None)
+            return True
+
+    def has_conversation(self, conv_id: str) -> bool:
+        """
+        Checks if the conversation exists.
+
+        Args:
+            conv_id (str): The unique identifier for the conversation.
+        """
+        with self.lock:
+            if self.store is None:
+                return conv_id in self.conversations
+            if conv_id in self.pending_counts:
+                return True
+
+        # the store is the reference (another worker could have deleted it),
+        # read without the lock (blocking: not to be called in the event loop)
+        return self.store.version(conv_id) > 0
+
+    def has_data(self, conv_id: str) -> bool:
         """
-        # if the conversation not exist, create it empty
-        if conv_id not in self.conversations:
-            self.logger.info("Creating new conversation with ID: %s", conv_id)
-            self.conversations[conv_id] = []
+        Checks if the conversation holds data retrieved from the DB.
 
-        messages = self.conversations.get(conv_id, [])
-        return [self._dict_to_message(msg_dict) for msg_dict in messages]
+        Args:
+            conv_id (str): The unique identifier for the conversation.
+        """
+        return self._get_view(conv_id).has_data
+
+    def set_last_classification(self, conv_id: str, classification: str):
+        """
+        Saves the last classification made by the router for the conversation.
+        """
+        with self.lock:
+            # only for conversations in memory, to keep memory bounded
+            if conv_id in self.conversations:
+                self.last_classifications[conv_id] = classification
+
+    def get_last_classification(self, conv_id: str) -> Union[str, None]:
+        """
+        Returns the last classification made by the router for the conversation,
+        None if not available.
+        """
+        return self.last_classifications.get(conv_id)
 
     def clear_conversation(self, conv_id: str):
         """
@@ -159,7 +677,91 @@ class ConversationManager:
         Args:
             conv_id (str): The unique identifier for the conversation.
         """
-        if conv_id in self.conversations:
-            if self.verbose:
-                self.logger.info("Clearing conversation with ID: %s", conv_id)
-            del self.conversations[conv_id]
+        with self.lock:
+            if conv_id in self.conversations:
+                if self.verbose:
+                    self.logger.info("Clearing conversation with ID: %s", conv_id)
+                self._remove(conv_id)
+
+            if self.store is not None:
+                self.pending = [item for item in self.pending if item[0] != conv_id]
+                self.pending_counts.pop(conv_id, None)
+
+        if self.store is not None:
+            self.store.delete(conv_id)
+
+    def expire_idle(self) -> int:
+        """
+        Removes the conversations idle for more than idle_ttl seconds.
+
+        Returns:
+            int: The number of conversations removed.
+        """
+        limit = time() - self.idle_ttl
+        n_expired = 0
+
+        with self.lock:
+            # ordered from the least recently used
+            while self.conversations:
+                oldest_id = next(iter(self.conversations))
+                if self.last_access.get(oldest_id, 0) > limit:
+                    break
+                self._remove(oldest_id)
+                n_expired += 1
+            self.n_expired += n_expired
+
+        if self.store is not None:
+            # the conversations in memory were only a cache
+            self.store.expire_idle(self.idle_ttl)
+
+        if n_expired and self.verbose:
+            self.logger.info("Expired %d idle conversations.", n_expired)
+        return n_expired
+
+    def start_sweeper(self, interval: float = 60):
+        """
+        Starts a background thread that removes the idle conversations
+        every interval seconds.
+        """
+        if self._sweeper is not None and self._sweeper.is_alive():
+            return
+
+        self._stop_sweeper.clear()
+
+        def sweep():
+            while not self._stop_sweeper.wait(interval):
+                try:
+                    self.expire_idle()
+                except Exception as e:
+                    self.logger.error("Error in conversation sweeper: %s", e)
+
+        self._sweeper = threading.Thread(
+            target=sweep, name="conversation-sweeper", daemon=True
+        )
+        self._sweeper.start()
+
+    def stop_sweeper(self):
+        """
+        Stops the background sweeper.
+        """
+        self._stop_sweeper.set()
+        if self._sweeper is not None:
+            self._sweeper.join()
+            self._sweeper = None
+
+    def get_stats(self):
+        """
+        Returns the memory stats of the conversations.
+        """
+        return {
+            "n_conversations": len(self.conversations),
+            "total_bytes": self.total_bytes,
+            "n_evicted": self.n_evicted,
+            "n_expired": self.n_expired,
+            "store": type(self.store).__name__ if self.store is not None else None,
+            "n_pending": len(self.pending),
+            "n_cache_hits": self.n_cache_hits,
+            "n_store_loads": self.n_store_loads,
+            "n_view_hits": self.n_view_hits,
+            "n_view_builds": self.n_view_builds,
+        }
@@ -0,0 +1,495 @@
+"""
+File name: conversation_store.py
+Author: Luigi Saetta
+Date last modified: 2026-10-19
+Python Version: 3.11
+
+Description:
+    Storage backends for the conversation history, shared by all the
+    workers (and nodes) of the service:
+        * InMemoryConversationStore: single process (mainly for tests)
+        * SQLiteConversationStore: a SQLite DB in WAL mode
+          (the workers on the same node)
+        * RedisConversationStore: a Redis server (several nodes),
+          the client is injectable (e.g. a local stand-in for tests,
+          see tests/redis_stand_in.py)
+
+    Messages are stored as dict (role, content).
+    Every conversation has a version, used by the ConversationManager
+    to validate its read-through cache: versions come from a clock
+    of the store, so they are never reused, also after a delete
+    (or an expiry) of the conversation with the same conv_id.
+
+Inspired by:
+
+Usage:
+    Import this module into other scripts to use its functions.
+    Example:
+        store = create_conversation_store(config)
+        store.append(conv_id, [{"role": "human", "content": "Hi"}])
+        messages, version = store.load(conv_id, max_msgs=20)
+
+Dependencies:
+    redis (only for RedisConversationStore, without an injected client)
+
+License:
+    This code is released under the MIT License.
+
+Notes:
+    This is a part of a set of demos showing how to build a SQL Agent
+    for Text2SQL tasks
+
+Warnings:
+    This module is in development, may change in future versions.
+"""
+
+import json
+import sqlite3
+from abc import ABC, abstractmethod
+import threading
+from time import time
+from typing import Dict, List, Optional, Tuple
+
+from utils import get_console_logger
+
+logger = get_console_logger()
+
+STORE_MEMORY = "memory"
+STORE_SQLITE = "sqlite"
+STORE_REDIS = "redis"
+
+
+class ConversationStore(ABC):
+    """
+    The interface of a conversation store
+    """
+
+    @abstractmethod
+    def append(self, conv_id: str, messages: List[Dict]) -> Tuple[int, int]:
+        """
+        append the messages to the conversation (created if not exists)
+
+        Returns:
+            (version before, version after) of the conversation
+        """
+
+    @abstractmethod
+    def load(self, conv_id: str, max_msgs: int) -> Tuple[List[Dict], int]:
+        """
+        the last max_msgs messages of the conversation
+
+        Returns:
+            (messages, version), ([], 0) if the conversation doesn't exist
+        """
+
+    @abstractmethod
+    def replace(
+        self, conv_id: str, messages: List[Dict], expected_version: int
+    ) -> Optional[int]:
+        """
+        replace all the messages of the conversation (e.g. after compaction),
+        only if its version is still expected_version
+
+        Returns:
+            the new version, None if the conversation has changed
+        """
+
+    @abstractmethod
+    def version(self, conv_id: str) -> int:
+        """
+        the version of the conversation, 0 if it doesn't exist
+
+        Versions are unique in the store (never reused): the same version
+        means the same content.
+        """
+
+    @abstractmethod
+    def delete(self, conv_id: str):
+        """
+        remove the conversation
+        """
+
+    def expire_idle(self, idle_ttl: float) -> int:
+        """
+        remove the conversations not updated for idle_ttl seconds
+
+        Returns:
+            the n. of conversations removed
+        """
+        # pylint: disable=unused-argument
+        return 0
+
+    def close(self):
+        """
+        release the resources
+        """
+
+
+class InMemoryConversationStore(ConversationStore):
+    """
+    Store in the memory of the process
+    """
+
+    def __init__(self, max_msgs: int = 20):
+        self.max_msgs = max_msgs
+        # conv_id -> (messages, version, time of last update)
+        self.conversations = {}
+        # the source of the versions
+        self.clock = 0
+        self.lock = threading.Lock()
+
+    def append(self, conv_id: str, messages: List[Dict]) -> Tuple[int, int]:
+        with self.lock:
+            stored, version, _ = self.conversations.get(conv_id, ([], 0, 0.0))
+            stored = (stored + list(messages))[-self.max_msgs :]
+            self.clock += 1
+            self.conversations[conv_id] = (stored, self.clock, time())
+            return version, self.clock
+
+    def load(self, conv_id: str, max_msgs: int) -> Tuple[List[Dict], int]:
+        with self.lock:
+            stored, version, _ = self.conversations.get(conv_id, ([], 0, 0.0))
+            return list(stored[-max_msgs:]), version
+
+    def replace(
+        self, conv_id: str, messages: List[Dict], expected_version: int
+    ) -> Optional[int]:
+        with self.lock:
+            version = self.conversations.get(conv_id, ([], 0, 0.0))[1]
+            if version != expected_version:
+                return None
+            stored = list(messages)[-self.max_msgs :]
+            self.clock += 1
+            self.conversations[conv_id] = (stored, self.clock, time())
+            return self.clock
+
+    def version(self, conv_id: str) -> int:
+        with self.lock:
+            return self.conversations.get(conv_id, ([], 0, 0.0))[1]
+
+    def delete(self, conv_id: str):
+        with self.lock:
+            self.conversations.pop(conv_id, None)
+
+    def expire_idle(self, idle_ttl: float) -> int:
+        limit = time() - idle_ttl
+        with self.lock:
+            expired = [
+                conv_id
+                for conv_id, (_, _, updated) in self.conversations.items()
+                if updated < limit
+            ]
+            for conv_id in expired:
+                del self.conversations[conv_id]
+        return len(expired)
+
+
+class SQLiteConversationStore(ConversationStore):
+    """
+    Store in a SQLite DB, in WAL mode (readers don't block the writer),
+    shared by the workers on the same node
+    """
+
+    def __init__(self, db_path: str, max_msgs: int = 20):
+        self.db_path = db_path
+        self.max_msgs = max_msgs
+        self.lock = threading.Lock()
+
+        # the connection is shared by the threads of the worker (with the lock)
+        self.conn = sqlite3.connect(
+            db_path, check_same_thread=False, isolation_level=None, timeout=10
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS conversations (
+                conv_id TEXT PRIMARY KEY,
+                version INTEGER NOT NULL,
+                updated REAL NOT NULL)"""
+        )
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                conv_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT)"""
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS messages_conv_idx ON messages (conv_id, id)"
+        )
+        # the source of the versions (a single row)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS clock (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                value INTEGER NOT NULL)"""
+        )
+        # (for an existing DB, after the versions already used)
+        self.conn.execute(
+            """INSERT OR IGNORE INTO clock (id, value)
+            SELECT 0, COALESCE(MAX(version), 0) FROM conversations"""
+        )
+
+    @staticmethod
+    def _next_version(cursor) -> int:
+        """
+        the next value of the clock (in the transaction)
+        """
+        return cursor.execute(
+            "UPDATE clock SET value = value + 1 WHERE id = 0 RETURNING value"
+        ).fetchone()[0]
+
+    def append(self, conv_id: str, messages: List[Dict]) -> Tuple[int, int]:
+        with self.lock:
+            cursor = self.conn.cursor()
+            # the write lock is taken immediately: versions can't interleave
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                row = cursor.execute(
+                    "SELECT version FROM conversations WHERE conv_id = ?", (conv_id,)
+                ).fetchone()
+                version = row[0] if row else 0
+                new_version = self._next_version(cursor)
+
+                cursor.executemany(
+                    "INSERT INTO messages (conv_id, role, content) VALUES (?, ?, ?)",
+                    [(conv_id, msg["role"], msg["content"]) for msg in messages],
+                )
+                cursor.execute(
+                    """INSERT INTO conversations (conv_id, version, updated)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT (conv_id)
+                    DO UPDATE SET version = excluded.version, updated = excluded.updated""",
+                    (conv_id, new_version, time()),
+                )
+                # keep only the last max_msgs
+                cursor.execute(
+                    """DELETE FROM messages WHERE conv_id = ? AND id <= (
+                        SELECT id FROM messages WHERE conv_id = ?
+                        ORDER BY id DESC LIMIT 1 OFFSET ?)""",
+                    (conv_id, conv_id, self.max_msgs),
+                )
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+
+        return version, new_version
+
+    def load(self, conv_id: str, max_msgs: int) -> Tuple[List[Dict], int]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT version FROM conversations WHERE conv_id = ?", (conv_id,)
+            ).fetchone()
+            if row is None:
+                return [], 0
+
+            rows = self.conn.execute(
+                """SELECT role, content FROM messages WHERE conv_id = ?
+                ORDER BY id DESC LIMIT ?""",
+                (conv_id, max_msgs),
+            ).fetchall()
+
+        messages = [{"role": role, "content": content} for role, content in rows]
+        messages.reverse()
+        return messages, row[0]
+
+    def replace(
+        self, conv_id: str, messages: List[Dict], expected_version: int
+    ) -> Optional[int]:
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                row = cursor.execute(
+                    "SELECT version FROM conversations WHERE conv_id = ?", (conv_id,)
+                ).fetchone()
+                if (row[0] if row else 0) != expected_version:
+                    cursor.execute("ROLLBACK")
+                    return None
+                new_version = self._next_version(cursor)
+
+                cursor.execute("DELETE FROM messages WHERE conv_id = ?", (conv_id,))
+                cursor.executemany(
+                    "INSERT INTO messages (conv_id, role, content) VALUES (?, ?, ?)",
+                    [
+                        (conv_id, msg["role"], msg["content"])
+                        for msg in messages[-self.max_msgs :]
+                    ],
+                )
+                cursor.execute(
+                    """INSERT INTO conversations (conv_id, version, updated)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT (conv_id)
+                    DO UPDATE SET version = excluded.version, updated = excluded.updated""",
+                    (conv_id, new_version, time()),
+                )
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+
+        return new_version
+
+    def version(self, conv_id: str) -> int:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT version FROM conversations WHERE conv_id = ?", (conv_id,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def delete(self, conv_id: str):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute("DELETE FROM messages WHERE conv_id = ?", (conv_id,))
+            self.conn.execute("DELETE FROM conversations WHERE conv_id = ?", (conv_id,))
+            self.conn.execute("COMMIT")
+
+    def expire_idle(self, idle_ttl: float) -> int:
+        limit = time() - idle_ttl
+
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute(
+                """DELETE FROM messages WHERE conv_id IN (
+                    SELECT conv_id FROM conversations WHERE updated < ?)""",
+                (limit,),
+            )
+            n_expired = self.conn.execute(
+                "DELETE FROM conversations WHERE updated < ?", (limit,)
+            ).rowcount
+            self.conn.execute("COMMIT")
+        return n_expired
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class RedisConversationStore(ConversationStore):
+    """
+    Store in Redis: a list of JSON messages and a version for every
+    conversation, both with a TTL refreshed on every append
+    (idle conversations are expired by Redis).
+    Versions come from a global counter (without TTL).
+    """
+
+    def __init__(
+        self,
+        client=None,
+        url: str = "redis://localhost:6379/0",
+        max_msgs: int = 20,
+        idle_ttl: float = 3600,
+        prefix: str = "oraculum:conv:",
+    ):
+        """
+        client: a redis-py compatible client; if None, created from url
+        """
+        if client is None:
+            # optional dependency, needed only here
+            import redis
+
+            client = redis.Redis.from_url(url)
+
+        self.client = client
+        self.max_msgs = max_msgs
+        self.idle_ttl = int(idle_ttl)
+        self.prefix = prefix
+
+    def _msgs_key(self, conv_id: str) -> str:
+        return f"{self.prefix}{conv_id}:msgs"
+
+    def _version_key(self, conv_id: str) -> str:
+        return f"{self.prefix}{conv_id}:version"
+
+    def _clock_key(self) -> str:
+        return f"{self.prefix}clock"
+
+    def append(self, conv_id: str, messages: List[Dict]) -> Tuple[int, int]:
+        msgs_key = self._msgs_key(conv_id)
+        version_key = self._version_key(conv_id)
+
+        # unique, never reused
+        new_version = int(self.client.incr(self._clock_key()))
+
+        # executed atomically (MULTI/EXEC)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.rpush(msgs_key, *[json.dumps(msg) for msg in messages])
+        pipe.ltrim(msgs_key, -self.max_msgs, -1)
+        pipe.getset(version_key, new_version)
+        pipe.expire(msgs_key, self.idle_ttl)
+        pipe.expire(version_key, self.idle_ttl)
+        version = int(pipe.execute()[2] or 0)
+
+        return version, new_version
+
+    def load(self, conv_id: str, max_msgs: int) -> Tuple[List[Dict], int]:
+        pipe = self.client.pipeline(transaction=True)
+        pipe.lrange(self._msgs_key(conv_id), -max_msgs, -1)
+        pipe.get(self._version_key(conv_id))
+        raw_messages, version = pipe.execute()
+
+        return [json.loads(msg) for msg in raw_messages], int(version or 0)
+
+    def replace(
+        self, conv_id: str, messages: List[Dict], expected_version: int
+    ) -> Optional[int]:
+        msgs_key = self._msgs_key(conv_id)
+        version_key = self._version_key(conv_id)
+
+        # optimistic: the transaction fails if the version changes (WATCH)
+        with self.client.pipeline(transaction=True) as pipe:
+            try:
+                pipe.watch(version_key)
+                if int(pipe.get(version_key) or 0) != expected_version:
+                    return None
+                # (immediate, another key)
+                new_version = int(pipe.incr(self._clock_key()))
+
+                pipe.multi()
+                pipe.delete(msgs_key)
+                pipe.rpush(msgs_key, *[json.dumps(msg) for msg in messages])
+                pipe.ltrim(msgs_key, -self.max_msgs, -1)
+                pipe.set(version_key, new_version)
+                pipe.expire(msgs_key, self.idle_ttl)
+                pipe.expire(version_key, self.idle_ttl)
+                pipe.execute()
+                return new_version
+            except Exception as e:
+                # WatchError: changed in the meantime
+                logger.warning("Conversation %s not replaced: %s", conv_id, e)
+                return None
+
+    def version(self, conv_id: str) -> int:
+        return int(self.client.get(self._version_key(conv_id)) or 0)
+
+    def delete(self, conv_id: str):
+        self.client.delete(self._msgs_key(conv_id), self._version_key(conv_id))
+
+    def close(self):
+        self.client.close()
+
+
+def create_conversation_store(config) -> Optional[ConversationStore]:
+    """
+    create the store defined in config (conversation_store)
+
+    Returns:
+        None for "memory": the history is kept only
+        in the ConversationManager of the process
+    """
+    store_type = config.find_key("conversation_store")
+    max_msgs = int(config.find_key("max_msgs"))
+
+    if store_type == STORE_SQLITE:
+        return SQLiteConversationStore(
+            config.find_key("conversation_sqlite_path"), max_msgs=max_msgs
+        )
+    if store_type == STORE_REDIS:
+        return RedisConversationStore(
+            url=config.find_key("conversation_redis_url"),
+            max_msgs=max_msgs,
+            idle_ttl=float(config.find_key("conversation_idle_ttl")),
+        )
+    if store_type != STORE_MEMORY:
+        logger.warning("Unknown conversation store %s, using memory.", store_type)
+    return None
@@ -1,17 +1,29 @@
 """
 File name: dispatcher.py
 Author: Luigi Saetta
-Date last modified: 2024-11-24
+Date last modified: 2026-10-19
 Python Version: 3.11
 
 Description:
     Implements the dispatching logic
 
+    Handlers are registered with their metadata (HandlerSpec):
+    resource class, concurrency cap, priority and timeout.
+    Every resource class (llm, db, local, see resource_classes.py) has its
+    own limit on the handlers running and, for blocking work, its own
+    threads: when the class is busy
+    the handlers wait and start by priority, so that fast routes
+    (not_allowed, cached SQL) keep a low latency while slow routes
+    (analyze_data on the large model) back up.
+
 Inspired by:
-   
+
 Usage:
-    Import this module into other scripts to use its functions. 
+    Import this module into other scripts to use its functions.
     Example:
+        dispatcher.register("my_route", handle_my_route,
+                            resource_class=RESOURCE_LLM, priority=PRIORITY_LOW)
+        events = await dispatcher.dispatch("my_route", user_request)
 
 Dependencies:
     langChain
@@ -27,7 +39,8 @@ Warnings:
     This module is in development, may change in future versions.
 """
 
-from typing import Any
+import asyncio
+from typing import Any, Callable, Dict, NamedTuple, Optional
 
 from prompt_routing import AllowedValues
 
@@ -37,8 +50,56 @@ from handlers import (
     handle_not_allowed,
     handle_answer_directly,
 )
+from resource_classes import (
+    ResourceClass,
+    RESOURCE_LLM,
+    RESOURCE_DB,
+    RESOURCE_LOCAL,
+)
 from utils import get_console_logger
 
+# priorities (the lower, the first)
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 10
+PRIORITY_LOW = 20
+
+# the speculative SQL prefetch (see router_with_dispatcher.py), in the db class
+ROUTE_SPECULATIVE_SQL = "speculative_sql"
+
+
+class HandlerSpec(NamedTuple):
+    """
+    A handler, with the metadata used to schedule it
+    """
+
+    handler: Callable
+    resource_class: str = RESOURCE_LOCAL
+    # max n. of handlers of the route running, None for no cap
+    max_concurrent: Optional[int] = None
+    priority: int = PRIORITY_NORMAL
+    # max time (sec.) of the request, waiting and running, None for no limit
+    timeout: Optional[float] = None
+    # the handler returns rows from the DB (columns and rows events)
+    returns_data: bool = False
+
+
+class _HandlerTimeout(NamedTuple):
+    """
+    a TimeoutError raised by the handler (not the deadline of the dispatcher)
+    """
+
+    error: BaseException
+
+
+async def _anext_or_timeout(events):
+    """
+    the next event of the handler, with its own TimeoutError as a value
+    """
+    try:
+        return await anext(events)
+    except asyncio.TimeoutError as e:
+        return _HandlerTimeout(e)
+
 
 class Dispatcher:
     """
@@ -49,14 +110,91 @@ class Dispatcher:
         self.logger = get_console_logger()
         self.config = config
 
-        # Mapping classification values to handler functions (in handlers.py)
-        self.tool_map = {
-            AllowedValues.GENERATE_SQL.value: handle_generate_sql,
-            AllowedValues.ANALYZE_DATA.value: handle_analyze_data,
-            AllowedValues.ANSWER_DIRECTLY.value: handle_answer_directly,
-            AllowedValues.NOT_ALLOWED.value: handle_not_allowed,
-            # Add more mappings as needed
+        def get_limit(key):
+            # 0 or missing: no limit
+            value = config.find_key(key)
+            return int(value) if value else None
+
+        self.resource_classes: Dict[str, ResourceClass] = {
+            RESOURCE_LLM: ResourceClass(
+                RESOURCE_LLM, max_concurrent=get_limit("max_concurrent_llm")
+            ),
+            RESOURCE_DB: ResourceClass(
+                RESOURCE_DB,
+                max_concurrent=get_limit("max_concurrent_db"),
+                max_workers=config.find_key("db_executor_workers") or 0,
+            ),
+            RESOURCE_LOCAL: ResourceClass(RESOURCE_LOCAL),
         }
+        self.resource_classes[RESOURCE_DB].add_route(ROUTE_SPECULATIVE_SQL)
+
+        # Mapping classification values to handlers (in handlers.py)
+        self.tool_map: Dict[str, HandlerSpec] = {}
+
+        # the SQL is often in cache, the data is needed by the other routes
+        self.register(
+            AllowedValues.GENERATE_SQL.value,
+            handle_generate_sql,
+            resource_class=RESOURCE_DB,
+            priority=PRIORITY_NORMAL,
+            timeout=get_limit("timeout_generate_sql"),
+            returns_data=True,
+        )
+        # the slowest (large model)
+        self.register(
+            AllowedValues.ANALYZE_DATA.value,
+            handle_analyze_data,
+            resource_class=RESOURCE_LLM,
+            max_concurrent=get_limit("max_concurrent_analyze_data"),
+            priority=PRIORITY_LOW,
+            timeout=get_limit("timeout_analyze_data"),
+        )
+        self.register(
+            AllowedValues.ANSWER_DIRECTLY.value,
+            handle_answer_directly,
+            resource_class=RESOURCE_LLM,
+            priority=PRIORITY_NORMAL,
+            timeout=get_limit("timeout_answer_directly"),
+        )
+        self.register(
+            AllowedValues.NOT_ALLOWED.value,
+            handle_not_allowed,
+            resource_class=RESOURCE_LOCAL,
+            priority=PRIORITY_HIGH,
+        )
+        # Add more handlers as needed
+
+        # stats
+        # route -> n. of requests dispatched
+        self.n_dispatched: Dict[str, int] = {}
+        # route -> n. of requests over the timeout
+        self.n_timeouts: Dict[str, int] = {}
+
+    def register(
+        self,
+        classification: str,
+        handler: Callable,
+        resource_class: str = RESOURCE_LOCAL,
+        max_concurrent: Optional[int] = None,
+        priority: int = PRIORITY_NORMAL,
+        timeout: Optional[float] = None,
+        returns_data: bool = False,
+    ):
+        """
+        Register the handler for a classification value (see HandlerSpec).
+        """
+        if resource_class not in self.resource_classes:
+            raise ValueError(f"Unknown resource class: {resource_class}")
+
+        self.tool_map[classification] = HandlerSpec(
+            handler,
+            resource_class=resource_class,
+            max_concurrent=max_concurrent,
+            priority=priority,
+            timeout=timeout,
+            returns_data=returns_data,
+        )
+        self.resource_classes[resource_class].add_route(classification, max_concurrent)
 
     def get_supported_values(self):
         """
@@ -64,26 +202,148 @@ class Dispatcher:
         """
         return list(self.tool_map.keys())
 
-    async def dispatch(self, classification: str, user_request: Any):
+    def get_data_values(self):
+        """
+        Returns the classification values for which the handler returns data
+        (columns and rows events), usable for machine-readable formats.
+        """
+        return [value for value, spec in self.tool_map.items() if spec.returns_data]
+
+    async def run_blocking(self, resource_class: str, func, *args, **kwargs):
+        """
+        run blocking work in the threads of the resource class
+        """
+        return await self.resource_classes[resource_class].run_blocking(
+            func, *args, **kwargs
+        )
+
+    async def run_speculative(self, func, *args):
+        """
+        run the speculative work (blocking) in the db resource class:
+        it counts against max_concurrent_db (started after the handlers
+        waiting) and runs in its threads.
+
+        If cancelled while running, the thread can't be interrupted:
+        its slot is released when it ends.
+        """
+        resource = self.resource_classes[RESOURCE_DB]
+        await resource.acquire(ROUTE_SPECULATIVE_SQL, PRIORITY_LOW, None)
+
+        def on_end(future):
+            resource.release(ROUTE_SPECULATIVE_SQL)
+            if not future.cancelled():
+                # retrieved, also if nobody is waiting anymore
+                future.exception()
+
+        future = asyncio.ensure_future(resource.run_blocking(func, *args))
+        future.add_done_callback(on_end)
+        return await asyncio.shield(future)
+
+    async def dispatch(self, classification: str, user_request: Any, **kwargs):
         """
         Route the request to the appropriate handler.
 
         Args:
             classification (str): Classification from the Router.
             user_request (str): User's input request.
+            kwargs: additional args for the handler (e.g. prefetch)
 
         Returns:
-            str: Response from the selected tool or an error message.
+            the stream of ChatEvent produced by the selected handler:
+            the handler starts when its resource class has capacity.
         """
-        verbose = bool(self.config.find_key("verbose"))
+        verbose = self.config.find_key("verbose")
         # get the handler for the classification
-        handler = self.tool_map.get(classification)
+        spec = self.tool_map.get(classification)
 
-        if not handler:
+        if not spec:
             self.logger.error("No handler found for classification: %s", classification)
             raise ValueError("Sorry, I don't know how to handle this request.")
 
         if verbose:
             self.logger.info("Dispatching request to handler for: %s", classification)
 
-        return handler(user_request)
+        self.n_dispatched[classification] = self.n_dispatched.get(classification, 0) + 1
+
+        return self._run(classification, spec, user_request, kwargs)
+
+    async def _run(self, classification: str, spec: HandlerSpec, user_request, kwargs):
+        """
+        wait for the resource class, then stream the events of the handler,
+        within the timeout
+        """
+        resource = self.resource_classes[spec.resource_class]
+        # in the time of the loop (see asyncio.timeout_at)
+        deadline = (
+            None
+            if spec.timeout is None
+            else asyncio.get_running_loop().time() + spec.timeout
+        )
+
+        try:
+            await resource.acquire(classification, spec.priority, spec.timeout)
+        except asyncio.TimeoutError:
+            self._on_timeout(classification, spec)
+
+        events = spec.handler(user_request, **kwargs)
+        try:
+            if deadline is None:
+                async for event in events:
+                    yield event
+                return
+
+            handler_timeout = None
+            try:
+                # a single timeout for the whole stream (no task per event)
+                async with asyncio.timeout_at(deadline) as timeout:
+                    while handler_timeout is None:
+                        try:
+                            event = await _anext_or_timeout(events)
+                        except StopAsyncIteration:
+                            return
+
+                        if isinstance(event, _HandlerTimeout):
+                            handler_timeout = event
+                        else:
+                            # the time of the consumer counts, but the consumer
+                            # is never cancelled while it has the event
+                            timeout.reschedule(None)
+                            yield event
+                            timeout.reschedule(deadline)
+            except asyncio.TimeoutError:
+                # only the deadline (the handler's own are wrapped)
+                self._on_timeout(classification, spec)
+
+            raise handler_timeout.error
+        finally:
+            try:
+                await events.aclose()
+            finally:
+                resource.release(classification)
+
+    def _on_timeout(self, classification: str, spec: HandlerSpec):
+        self.n_timeouts[classification] = self.n_timeouts.get(classification, 0) + 1
+        self.logger.warning(
+            "Timeout (%s sec.) in handler for: %s", spec.timeout, classification
+        )
+        raise TimeoutError(f"Request timed out after {spec.timeout} sec.")
+
+    def close(self):
+        """
+        stop the threads of the resource classes
+        """
+        for resource in self.resource_classes.values():
+            resource.close()
+
+    def get_stats(self):
+        """
+        returns the stats of the resource classes and of the routes
+        """
+        return {
+            "resource_classes": {
+                name: resource.get_stats()
+                for name, resource in self.resource_classes.items()
+            },
+            "n_dispatched": dict(self.n_dispatched),
+            "n_timeouts": dict(self.n_timeouts),
+        }
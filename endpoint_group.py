@@ -0,0 +1,410 @@
+"""
+File name: endpoint_group.py
+Author: Luigi Saetta
+Date last modified: 2026-10-19
+Python Version: 3.11
+
+Description:
+    A group of endpoints (e.g. regions) serving the same logical model.
+    * every call is routed to an endpoint chosen with weights inversely
+      proportional to its latency (EWMA)
+    * an endpoint with too many consecutive errors is excluded
+      for some time (circuit breaker)
+    * streams can be hedged: if the first token doesn't arrive within
+      the p95 latency of the group, the request is sent to a second endpoint
+      and the first to answer wins
+
+    Latencies (time to first token of the streams) and errors are collected
+    with a LangChain callback handler, attached to the client of every endpoint.
+
+Inspired by:
+    The Tail at Scale (Dean, Barroso)
+
+Usage:
+    Import this module into other scripts to use its functions.
+    Example:
+        group = EndpointGroup(model_name, endpoints)
+        i = group.select()
+        ...
+        async for chunk in hedged_astream(group, get_client, messages): ...
+
+Dependencies:
+    langChain, numpy
+
+License:
+    This code is released under the MIT License.
+
+Notes:
+    This is a part of a set of demos showing how to build a SQL Agent
+    for Text2SQL tasks
+
+Warnings:
+    This module is in development, may change in future versions.
+"""
+
+import asyncio
+import random
+import threading
+from collections import deque
+from time import time
+from typing import Callable, List, Optional
+
+import numpy as np
+from langchain_core.callbacks import BaseCallbackHandler
+
+from utils import get_console_logger
+
+logger = get_console_logger()
+
+# n. of latencies kept to compute the p95 of the group
+LATENCY_WINDOW = 100
+
+
+class EndpointState:
+    """
+    latency and errors of a single endpoint
+    """
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        # None until the first call
+        self.ewma_latency = None
+        self.consecutive_failures = 0
+        # circuit open until this time
+        self.open_until = 0.0
+
+        # stats
+        self.n_calls = 0
+        self.n_errors = 0
+        self.n_circuit_opened = 0
+
+    def is_available(self, now: float) -> bool:
+        """
+        closed, or half-open (the open time is over: a call is allowed)
+        """
+        return now >= self.open_until
+
+
+class EndpointGroup:
+    """
+    The endpoints of a logical model, with EWMA-weighted selection
+    and circuit breaking
+    """
+
+    def __init__(
+        self,
+        name: str,
+        endpoints: List[str],
+        ewma_alpha: float = 0.2,
+        failure_threshold: int = 3,
+        open_time: float = 30,
+        hedge_min_delay: float = 0.5,
+        hedge_min_samples: int = 20,
+    ):
+        """
+        ewma_alpha: weight of the last latency in the EWMA
+        failure_threshold: consecutive errors to open the circuit
+        open_time: sec. the endpoint is excluded after the circuit is opened
+        hedge_min_delay: min delay (sec.) before sending a hedged request
+        hedge_min_samples: latencies needed before hedging (to compute the p95)
+        """
+        self.name = name
+        self.states = [EndpointState(endpoint) for endpoint in endpoints]
+        self.ewma_alpha = ewma_alpha
+        self.failure_threshold = failure_threshold
+        self.open_time = open_time
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+
+        # last latencies of the group, for the p95
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.lock = threading.Lock()
+
+        # hedging stats
+        self.n_hedged = 0
+        self.n_hedge_wins = 0
+
+    def __len__(self):
+        return len(self.states)
+
+    def select(self, exclude=()) -> Optional[int]:
+        """
+        choose an endpoint, weighted on 1/latency, among the available ones
+
+        exclude: indexes not to be chosen (e.g. for the hedged request)
+
+        Returns:
+            the index of the endpoint. If all the circuits are open, the one
+            that will be closed first; None only if all are excluded
+        """
+        now = time()
+
+        with self.lock:
+            candidates = [i for i in range(len(self.states)) if i not in exclude]
+            if not candidates:
+                return None
+
+            available = [i for i in candidates if self.states[i].is_available(now)]
+            if not available:
+                return min(candidates, key=lambda i: self.states[i].open_until)
+
+            if len(available) == 1:
+                return available[0]
+
+            known = [
+                self.states[i].ewma_latency
+                for i in available
+                if self.states[i].ewma_latency is not None
+            ]
+            # endpoints without latency get the best weight (to be explored)
+            best = min(known) if known else 1.0
+
+            weights = [
+                1.0 / max(self.states[i].ewma_latency or best, 1e-3) for i in available
+            ]
+
+        return random.choices(available, weights=weights)[0]
+
+    def record_latency(self, index: int, latency: float, success: bool = True):
+        """
+        record the latency (TTFT) of a stream
+
+        success: False for calls interrupted (e.g. the losing hedged stream):
+            the latency is a lower bound, the circuit is not changed
+        """
+        with self.lock:
+            state = self.states[index]
+
+            if state.ewma_latency is None:
+                state.ewma_latency = latency
+            else:
+                state.ewma_latency = (
+                    self.ewma_alpha * latency
+                    + (1 - self.ewma_alpha) * state.ewma_latency
+                )
+            self.latencies.append(latency)
+
+            if success:
+                self._record_success(state)
+
+    @staticmethod
+    def _record_success(state: EndpointState):
+        state.n_calls += 1
+        state.consecutive_failures = 0
+        state.open_until = 0.0
+
+    def record_success(self, index: int):
+        """
+        record a call completed without a latency to compare
+        (not streamed: the total time is not a TTFT), the circuit is closed
+        """
+        with self.lock:
+            self._record_success(self.states[index])
+
+    def record_failure(self, index: int):
+        """
+        record an error, open the circuit after failure_threshold errors
+        """
+        with self.lock:
+            state = self.states[index]
+            state.n_calls += 1
+            state.n_errors += 1
+            state.consecutive_failures += 1
+
+            now = time()
+            # the circuit is opened (or re-opened, if half-open)
+            if (
+                state.consecutive_failures >= self.failure_threshold
+                and state.is_available(now)
+            ):
+                state.open_until = now + self.open_time
+                state.n_circuit_opened += 1
+
+                logger.warning(
+                    "Circuit opened for endpoint %s (%s) for %s sec.",
+                    state.endpoint,
+                    self.name,
+                    self.open_time,
+                )
+
+    def hedge_delay(self) -> Optional[float]:
+        """
+        how long to wait for the first token before sending a hedged request:
+        the p95 of the latencies of the group
+
+        Returns:
+            None if there are not enough samples
+        """
+        with self.lock:
+            if len(self.latencies) < self.hedge_min_samples:
+                return None
+            p95 = float(np.percentile(np.asarray(self.latencies), 95))
+
+        return max(p95, self.hedge_min_delay)
+
+    def get_stats(self):
+        """
+        returns the stats of the group
+        """
+        now = time()
+        hedge_delay = self.hedge_delay()
+
+        return {
+            "endpoints": [
+                {
+                    "endpoint": state.endpoint,
+                    "available": state.is_available(now),
+                    "ewma_latency": (
+                        round(state.ewma_latency, 3)
+                        if state.ewma_latency is not None
+                        else None
+                    ),
+                    "n_calls": state.n_calls,
+                    "n_errors": state.n_errors,
+                    "n_circuit_opened": state.n_circuit_opened,
+                }
+                for state in self.states
+            ],
+            "hedge_delay": hedge_delay and round(hedge_delay, 3),
+            "n_hedged": self.n_hedged,
+            "n_hedge_wins": self.n_hedge_wins,
+        }
+
+
+class EndpointCallbackHandler(BaseCallbackHandler):
+    """
+    Collect latency and errors of the calls to an endpoint
+
+    Only the time to first token of the streams is recorded as latency
+    (EWMA and p95 of the group): the calls not streamed only close the circuit.
+    """
+
+    # the work done is minimal, no need to run in a thread
+    run_inline = True
+
+    def __init__(self, group: EndpointGroup, index: int):
+        self.group = group
+        self.index = index
+        # run_id -> start time, until the first token (or the end)
+        self.started = {}
+
+    def _start(self, run_id):
+        self.started[run_id] = time()
+
+    def _done(self, run_id, success: bool = True):
+        time_start = self.started.pop(run_id, None)
+        if time_start is not None:
+            self.group.record_latency(self.index, time() - time_start, success)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        # only the first token counts
+        self._done(run_id)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        # no token: not streamed, the total time is not recorded
+        if self.started.pop(run_id, None) is not None:
+            self.group.record_success(self.index)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        if isinstance(error, (asyncio.CancelledError, GeneratorExit)):
+            # interrupted by us (e.g. hedging): not an error of the endpoint
+            self._done(run_id, success=False)
+            return
+
+        self.started.pop(run_id, None)
+        self.group.record_failure(self.index)
+
+
+async def _close_stream(stream, task):
+    """
+    stop a stream not needed anymore
+    """
+    if task is not None and not task.done():
+        task.cancel()
+    try:
+        if task is not None:
+            await task
+    except BaseException:
+        pass
+    try:
+        await stream.aclose()
+    except BaseException:
+        pass
+
+
+async def hedged_astream(
+    group: EndpointGroup, get_client: Callable[[int], object], messages
+):
+    """
+    Stream from an endpoint of the group. If the first token doesn't arrive
+    within the hedge delay, the request is sent also to a second endpoint:
+    the first stream that produces a token wins, the other is cancelled.
+
+    get_client: returns the LLM client for the index of the endpoint
+
+    Yields:
+        the chunks of the winning stream
+    """
+    index = group.select()
+    stream = get_client(index).astream(messages)
+    first = asyncio.ensure_future(stream.__anext__())
+    hedge_stream = None
+    hedge_first = None
+
+    # also if the consumer is cancelled (while waiting or reading),
+    # both streams are stopped
+    try:
+        delay = group.hedge_delay() if len(group) > 1 else None
+        hedge_index = None
+
+        if delay is not None:
+            done, _ = await asyncio.wait({first}, timeout=delay)
+
+            if not done:
+                hedge_index = group.select(exclude={index})
+
+        if hedge_index is not None:
+            group.n_hedged += 1
+            hedge_stream = get_client(hedge_index).astream(messages)
+            hedge_first = asyncio.ensure_future(hedge_stream.__anext__())
+
+            pending = {first, hedge_first}
+            winner = None
+            while pending and winner is None:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                # a stream that fails (or ends) before the first token can't win
+                # if the other one is still running
+                for task in done:
+                    if task.exception() is None or not pending:
+                        winner = task
+                        break
+
+            if winner is hedge_first:
+                group.n_hedge_wins += 1
+                stream, hedge_stream = hedge_stream, stream
+                first, hedge_first = hedge_first, first
+
+            # the losing stream
+            await _close_stream(hedge_stream, hedge_first)
+            hedge_stream = None
+
+        try:
+            chunk = await first
+        except StopAsyncIteration:
+            return
+
+        yield chunk
+        async for chunk in stream:
+            yield chunk
+    finally:
+        if hedge_stream is not None:
+            await _close_stream(hedge_stream, hedge_first)
+        await _close_stream(stream, first)
@@ -0,0 +1,214 @@
+"""
+File name: event_transport.py
+Author: Luigi Saetta
+Date last modified: 2026-10-19
+Python Version: 3.11
+
+Description:
+    The transport layer: encodes the stream of ChatEvent produced by the
+    handlers for the client.
+    Supported encodings:
+        * text (markdown), the original protocol of /streaming_chat
+        * Server-Sent Events, with typed events and timing metadata
+        * data only (NDJSON, CSV, Arrow), see result_encoders.py
+
+Inspired by:
+
+Usage:
+    Import this module into other scripts to use its functions.
+    Example:
+        StreamingResponse(encode_sse(with_lifecycle(events)), ...)
+        # to save the answer in the history
+        StreamingResponse(encode_sse(tee_answer(with_lifecycle(events), f)), ...)
+
+License:
+    This code is released under the MIT License.
+
+Notes:
+    This is a part of a set of demos showing how to build a SQL Agent
+    for Text2SQL tasks
+
+Warnings:
+    This module is in development, may change in future versions.
+"""
+
+import json
+from time import time
+
+from chat_events import EventType, done_event, error_event
+from markdown_table import (
+    MarkdownTableFormatter,
+    DEFAULT_SAMPLE_ROWS,
+    DEFAULT_MAX_COL_WIDTH,
+    DEFAULT_CHUNK_SIZE,
+)
+from result_encoders import ResultEncoder, to_json_value
+from utils import get_console_logger
+
+logger = get_console_logger()
+
+# media type for Server-Sent Events
+TEXT_EVENT_STREAM = "text/event-stream"
+# to avoid buffering in proxies
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+# appended to the answers saved in the history
+TRUNCATED_ANSWER_MARKER = "\n\n[answer truncated]"
+PARTIAL_ANSWER_MARKER = "\n\n[answer interrupted]"
+
+
+async def with_lifecycle(events):
+    """
+    Add the final done event, or an error event if the handler fails
+    """
+    try:
+        async for event in events:
+            yield event
+        yield done_event()
+    except TimeoutError as e:
+        # the handler is over its timeout (see dispatcher.py)
+        logger.error("Error while streaming the response: %s", e)
+        yield error_event(str(e))
+    except Exception as e:
+        logger.error("Error while streaming the response: %s", e)
+        yield error_event("Internal server error")
+
+
+async def tee_answer(events, on_answer, max_chars: int = 20000):
+    """
+    Pass the events through unchanged, collecting the text of the answer
+    (token events) to save it in the history.
+
+    The chunks are only referenced (joined once, at the end), up to max_chars.
+    At the end of the stream calls on_answer(answer, complete):
+    complete is False if the stream was interrupted (client disconnected,
+    or error), and the answer has a marker.
+    """
+    chunks = []
+    n_chars = 0
+    truncated = False
+    complete = False
+
+    try:
+        async for event in events:
+            if event.type == EventType.TOKEN and not truncated:
+                text = event.data["text"]
+                if n_chars + len(text) > max_chars:
+                    chunks.append(text[: max_chars - n_chars])
+                    truncated = True
+                else:
+                    chunks.append(text)
+                n_chars += len(text)
+            elif event.type == EventType.DONE:
+                complete = True
+
+            yield event
+    finally:
+        # also when the client disconnects (the generator is closed)
+        if chunks:
+            answer = "".join(chunks)
+            if truncated:
+                answer += TRUNCATED_ANSWER_MARKER
+            if not complete:
+                answer += PARTIAL_ANSWER_MARKER
+
+            try:
+                on_answer(answer, complete)
+            except Exception as e:
+                logger.error("Error saving the answer: %s", e)
+
+
+async def render_text(
+    events,
+    sample_rows: int = DEFAULT_SAMPLE_ROWS,
+    max_col_width: int = DEFAULT_MAX_COL_WIDTH,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+):
+    """
+    Encode the events as text, rows are rendered as a Markdown table
+    """
+    columns = None
+    formatter = None
+
+    async for event in events:
+        if event.type == EventType.ROWS:
+            rows = event.data["rows"]
+            if formatter is None:
+                formatter = MarkdownTableFormatter(
+                    columns or list(rows[0].keys()),
+                    rows[:sample_rows],
+                    max_col_width=max_col_width,
+                    chunk_size=chunk_size,
+                )
+                yield formatter.format_header()
+            for chunk in formatter.iter_chunks(rows):
+                yield chunk
+            continue
+
+        if formatter is not None:
+            # the table is complete
+            yield "\n"
+            formatter = None
+
+        if event.type == EventType.PROGRESS:
+            yield event.data["message"] + "\n\n"
+        elif event.type == EventType.SQL:
+            yield f"SQL🛢️✨:\n{event.data['sql']}\n\n"
+        elif event.type == EventType.COLUMNS:
+            columns = event.data["columns"]
+        elif event.type == EventType.TOKEN:
+            yield event.data["text"]
+        elif event.type == EventType.ERROR:
+            yield f"\n\nError: {event.data['message']}\n"
+
+
+async def encode_sse(events, time_start: float = None):
+    """
+    Encode the events as Server-Sent Events
+
+    Every event has: id (sequence number), event (the type) and
+    as data a JSON with the payload and the timing metadata:
+        elapsed_ms: since time_start (the arrival of the request, if provided)
+        delta_ms: since the previous event
+    """
+    if time_start is None:
+        time_start = time()
+    time_prev = time_start
+
+    seq = 0
+    async for event in events:
+        payload = dict(event.data)
+        payload["ts"] = event.ts
+        payload["elapsed_ms"] = round((event.ts - time_start) * 1000, 1)
+        payload["delta_ms"] = round((event.ts - time_prev) * 1000, 1)
+        time_prev = event.ts
+
+        data = json.dumps(payload, default=to_json_value, ensure_ascii=False)
+        yield f"id: {seq}\nevent: {event.type.value}\ndata: {data}\n\n"
+        seq += 1
+
+
+async def encode_data(events, encoder: ResultEncoder):
+    """
+    Encode only the rows, in a machine-readable format
+    (other events are not sent)
+    """
+    started = False
+
+    async for event in events:
+        if event.type == EventType.COLUMNS:
+            started = True
+            yield encoder.begin(event.data["columns"], event.data.get("types"))
+        elif event.type == EventType.ROWS:
+            if not started:
+                started = True
+                yield encoder.begin(list(event.data["rows"][0].keys()))
+            yield encoder.encode_batch(event.data["rows"])
+        elif event.type == EventType.DONE:
+            if not started:
+                yield encoder.begin([])
+            yield encoder.end()
+        elif event.type == EventType.ERROR:
+            # no way to signal it in the format, the stream is truncated
+            logger.error("Data stream truncated: %s", event.data["message"])
+            return
@@ -1,12 +1,14 @@
 """
 File name: handlers.py
 Author: Luigi Saetta
-Date last modified: 2024-11-26
+Date last modified: 2026-10-19
 Python Version: 3.11
 
 Description:
     Implements the handling logic for the various
-    routing options
+    routing options.
+    Handlers yield typed events (see chat_events.py), encoded
+    for the client by the transport layer (event_transport.py)
 
 Inspired by:
    
@@ -28,196 +30,470 @@ Warnings:
     This module is in development, may change in future versions.
 """
 
-import os
 import asyncio
+import threading
+from dataclasses import dataclass
 from time import time
-from typing import Any
+from typing import Any, Optional, Tuple
 
 from langchain_core.messages import HumanMessage, SystemMessage
-from config_reader import ConfigReader
+from langchain_core.prompts import PromptTemplate
+from config_reader import get_config
 from tracer_singleton import TracerSingleton
 from llm_manager import LLMManager
 from conversation_manager import ConversationManager
 from sql_agent_factory import sql_agent_factory
 from sql_cache import SQLCache
-from prompts_models import PREAMBLE_ANSWER_DIRECTLY, PREAMBLE_ANALYZE_DATA
-from config_private import COMPARTMENT_OCID
+from chat_events import (
+    progress_event,
+    sql_event,
+    columns_event,
+    rows_event,
+    token_event,
+)
+from result_summarizer import ResultStore, summarize_result
+from resource_classes import RESOURCE_DB
+from prompt_routing import AllowedValues
+from history_selector import HistorySelector
+from history_compactor import HistoryCompactor
+from response_cache import SemanticResponseCache, history_fingerprint, split_answer
+from analytics_engine import (
+    AnalyticsEngine,
+    frame_to_rows,
+    operation_json_schema,
+    OP_NONE,
+)
+from prompts_models import (
+    PREAMBLE_ANSWER_DIRECTLY,
+    PREAMBLE_ANALYZE_DATA,
+    PROMPT_ANALYTICS_PLAN,
+)
 from utils import get_console_logger
 
 logger = get_console_logger()
-current_dir = os.path.dirname(os.path.abspath(__file__))
-config_path = os.path.join(current_dir, "config.toml")
-config = ConfigReader(config_path)
+# shared by all the modules
+config = get_config()
 
-VERBOSE = bool(config.find_key("verbose"))
-MAX_MSGS = config.find_key("max_msgs")
+VERBOSE = config.find_key("verbose")
 TRACER_NAME = config.find_key("tracer_name")
 
-llm_manager = LLMManager(
-    config,
-    compartment_id=COMPARTMENT_OCID,
-    logger=logger,
-)
-# it is a singleton
-conversation_manager = ConversationManager(max_msgs=MAX_MSGS, verbose=VERBOSE)
+# the components used by the handlers: created at startup
+# by the AppContainer (see app_container.py), set with init_handlers
+llm_manager: LLMManager = None
+conversation_manager: ConversationManager = None
+sql_cache: SQLCache = None
+result_store: ResultStore = None
+analytics_engine: AnalyticsEngine = None
+response_cache: SemanticResponseCache = None
+history_selector: HistorySelector = None
+history_compactor: HistoryCompactor = None
+# the Dispatcher (not imported here, it imports the handlers):
+# the blocking work runs in the threads of its resource classes
+dispatcher = None
+
+
+def init_handlers(container):
+    """
+    set the components used by the handlers, from the AppContainer
+    """
+    # pylint: disable=global-statement
+    global llm_manager, conversation_manager, sql_cache, result_store
+    global analytics_engine, response_cache, history_selector, history_compactor
+    global dispatcher
+
+    llm_manager = container.llm_manager
+    conversation_manager = container.conversation_manager
+    sql_cache = container.sql_cache
+    result_store = container.result_store
+    analytics_engine = container.analytics_engine
+    response_cache = container.response_cache
+    history_selector = container.history_selector
+    history_compactor = container.history_compactor
+    dispatcher = container.dispatcher
 
-# it is a singleton
-sql_cache = SQLCache(max_size=1000)
 
 # 0.1 sec
 SMALL_STIME = 0.1
+
+# the prompt to plan the analytics operation, built once
+ANALYTICS_PLAN_PROMPT = PromptTemplate.from_template(PROMPT_ANALYTICS_PLAN)
+# LLM client id -> (client, chain to plan the analytics operation), built
+# once for every client (the client, by endpoint, is chosen for every request)
+_plan_chains = {}
 # to integrate with OCI APM
 TRACER = TracerSingleton.get_instance()
 
 
-def calculate_column_widths(rows):
+@dataclass
+class SQLPrefetch:
     """
-    compute column widts for the table
+    The result of the speculative work done while classifying
     """
-    # Get headers and calculate maximum column widths
-    headers = rows[0].keys()
-    column_widths = {key: len(key) for key in headers}
-    # Update column widths based on row contents
-    for row in rows:
-        for key, value in row.items():
-            column_widths[key] = max(column_widths[key], len(str(value)))
-    return column_widths
+
+    # the SQL, None if not found (and not generated)
+    sql: Optional[str] = None
+    # the SQL cache has already been checked
+    cache_checked: bool = False
+    # if the SQL has been generated: the time (sec.) taken
+    # (it is added to the cache only when generate_sql is confirmed)
+    generation_time: Optional[float] = None
 
 
-async def stream_markdown_table(rows):
+def _find_sql_in_cache(request_text: str) -> Optional[str]:
     """
-    Stream rows of data as a Markdown table with padded columns.
+    Look for the SQL in the cache: exact match or very close request
     """
-    if not rows:
-        return
+    # the threshold for distance. Below two req are considered the same
+    zero_distance = config.find_key("zero_distance")
+
+    # check if the request is already in cache
+    _sql_from_cache, _ = sql_cache.get(request_text)
+
+    if _sql_from_cache is not None:
+        # exact match
+        logger.info("Find request in cache, exact match...")
+        return _sql_from_cache
+
+    # try to find one very close
+    return sql_cache.find_closer_with_threshold(request_text, zero_distance)
+
+
+def _generate_sql(request_text: str, sql_agent) -> Tuple[str, float]:
+    """
+    Generate the SQL with the SQL agent
+
+    Returns:
+        the SQL and the time taken (sec.)
+    """
+    time_start = time()
+    gen_sql = sql_agent.generate_sql(request_text)
+    return gen_sql, round(time() - time_start, 1)
+
+
+def _get_sql(request_text: str, sql_agent, prefetch: Optional[SQLPrefetch] = None):
+    """
+    Get the SQL for the request: from the cache (exact match or
+    very close request) or generating it with the SQL agent
+
+    prefetch: the result of the speculative work, if any
+    """
+    if prefetch is not None and prefetch.sql is not None:
+        if prefetch.generation_time is not None:
+            # generated speculatively: now it is a generate_sql request
+            sql_cache.set(request_text, prefetch.sql, prefetch.generation_time)
+        return prefetch.sql
+
+    if prefetch is None or not prefetch.cache_checked:
+        _sql_from_cache = _find_sql_in_cache(request_text)
+
+        if _sql_from_cache is not None:
+            # found in cache
+            return _sql_from_cache
+
+    gen_sql, time_elapsed = _generate_sql(request_text, sql_agent)
 
-    headers = rows[0].keys()
-    column_widths = calculate_column_widths(rows)
+    # add in cache
+    sql_cache.set(request_text, gen_sql, time_elapsed)
 
-    # Generate the header row with padding
-    header_row = (
-        "| " + " | ".join(f"{key:<{column_widths[key]}}" for key in headers) + " |"
+    return gen_sql
+
+
+def prefetch_sql(
+    request_text: str, generate: bool = False, cancel_event: threading.Event = None
+) -> SQLPrefetch:
+    """
+    Speculative work for generate_sql, done while the request is classified
+    (it is blocking, to be run in a thread)
+
+    generate: if the SQL is not in the cache, generate it with the SQL agent
+    cancel_event: if set, the generation is not started
+        (the classification is not generate_sql)
+
+    The SQL generated is not added to the cache here (see _get_sql).
+    """
+    _sql_from_cache = _find_sql_in_cache(request_text)
+
+    if _sql_from_cache is not None:
+        return SQLPrefetch(sql=_sql_from_cache, cache_checked=True)
+
+    if not generate or (cancel_event is not None and cancel_event.is_set()):
+        return SQLPrefetch(sql=None, cache_checked=True)
+
+    gen_sql, time_elapsed = _generate_sql(request_text, sql_agent_factory(config))
+
+    return SQLPrefetch(sql=gen_sql, cache_checked=True, generation_time=time_elapsed)
+
+
+def _add_data_to_history(
+    user_request: Any, rows: list, n_rows: Optional[int] = None
+) -> SystemMessage:
+    """
+    add the data retrieved in the conversation, as system message
+
+    Large results are summarized (stats + sample) within a token budget,
+    the full result is kept in the result store
+
+    n_rows: the n. of rows of the result, if rows are only the first ones
+        (then the result is not kept in the result store)
+
+    Returns:
+        the message added
+    """
+    complete = n_rows is None or n_rows == len(rows)
+    ref_id = result_store.add(rows) if complete else None
+
+    msg_text = summarize_result(
+        user_request.request_text,
+        rows,
+        ref_id,
+        token_budget=config.find_key("result_token_budget"),
+        max_sample_rows=config.find_key("result_sample_rows"),
+        top_n=config.find_key("result_top_values"),
+        n_rows=n_rows,
     )
-    separator_row = (
-        "| " + " | ".join(f"{'-' * column_widths[key]}" for key in headers) + " |"
+
+    # data retrieved are added to the conversation history as a SYSTEM message
+    data_msg = SystemMessage(content=msg_text)
+    conversation_manager.add_message(user_request.conv_id, data_msg)
+
+    # and kept, as a DataFrame, for local analytics
+    analytics_engine.set_result(user_request.conv_id, user_request.request_text, rows)
+
+    return data_msg
+
+
+def _get_plan_chain(llm):
+    """
+    the chain to plan the analytics operation with the LLM client
+    """
+    entry = _plan_chains.get(id(llm))
+    if entry is None or entry[0] is not llm:
+        entry = (
+            llm,
+            ANALYTICS_PLAN_PROMPT | llm.with_structured_output(operation_json_schema),
+        )
+        _plan_chains[id(llm)] = entry
+    return entry[1]
+
+
+async def _plan_analytics(user_request: Any):
+    """
+    Ask the LLM to translate the request in an operation on the
+    last result set of the conversation (see analytics_engine.py)
+
+    Returns:
+        the operation (dict), or None if the request can't be
+        answered with an operation on the data
+    """
+    data_description = analytics_engine.describe_frame(user_request.conv_id)
+
+    if data_description is None:
+        # no data for the conversation
+        return None
+
+    plan_chain = _get_plan_chain(
+        llm_manager.get_llm_model(config.find_key("index_model_analytics"))
     )
-    yield header_row + "\n"
-    yield separator_row + "\n"
-
-    # Stream each row with padded columns
-    for row in rows:
-        await asyncio.sleep(0.1)  # Simulate delay
-        data_row = (
-            "| "
-            + " | ".join(
-                f"{str(row.get(key, '')):<{column_widths[key]}}" for key in headers
-            )
-            + " |"
+
+    try:
+        operation = await plan_chain.ainvoke(
+            {
+                "data_description": data_description,
+                "request": user_request.request_text,
+            }
         )
-        yield data_row + "\n"
+    except Exception as e:
+        logger.error("Error planning the analytics operation: %s", e)
+        return None
+
+    if VERBOSE:
+        logger.info("Analytics operation: %s", operation)
+
+    if not operation or operation.get("operation", OP_NONE) == OP_NONE:
+        return None
+    return operation
+
+
+def _execute_analytics(user_request: Any, operation: dict):
+    """
+    Execute the operation locally
+
+    Returns:
+        the result as a list of dict, None if the operation is not valid
+    """
+    try:
+        result_df = analytics_engine.execute(user_request.conv_id, operation)
+    except Exception as e:
+        logger.warning("Analytics operation not executed: %s", e)
+        return None
+
+    return frame_to_rows(result_df)
 
 
 @TRACER.start_as_current_span("handle_generate_sql")
-async def handle_generate_sql(user_request: Any):
+async def handle_generate_sql(
+    user_request: Any, prefetch: Optional[SQLPrefetch] = None
+):
     """
     Handle SQL generation requests.
 
     user_request: request in NL
+    prefetch: the SQL found (or generated) speculatively, during the routing
+
+    Yields:
+        ChatEvent: progress, sql, columns and rows (in batches)
     """
     # if we want to return the txt of the generated SQL
-    return_sql = bool(config.find_key("return_sql"))
-    # the threshold for distance. Below two req are considered the same
-    zero_distance = float(config.find_key("zero_distance"))
+    return_sql = config.find_key("return_sql")
+    batch_size = config.find_key("data_batch_size")
 
     # get the SQL agent defined by config
     sql_agent = sql_agent_factory(config)
 
     # send a first progress update to the client
-    yield f"✨ Generating SQL for: {user_request.request_text} ✨\n\n"
+    yield progress_event(f"✨ Generating SQL for: {user_request.request_text} ✨")
 
-    # check if the request is already in cache
-    _sql_from_cache, _ = sql_cache.get(user_request.request_text)
-
-    if _sql_from_cache is not None:
-        # exact match
-        logger.info("Find request in cache, exact match...")
-        gen_sql = _sql_from_cache
-    else:
-        # try to find one very close
-        _sql_from_cache = sql_cache.find_closer_with_threshold(
-            user_request.request_text, zero_distance
-        )
-
-        if _sql_from_cache is not None:
-            # found in cache
-            gen_sql = _sql_from_cache
-        else:
-            # generate the SQL
-            time_start = time()
-            gen_sql = sql_agent.generate_sql(user_request.request_text)
-            time_elapsed = round(time() - time_start, 1)
-
-            # add in cache
-            sql_cache.set(user_request.request_text, gen_sql, time_elapsed)
+    # the DB calls run in the threads of the db resource class,
+    # without blocking the event loop (see dispatcher.py)
+    gen_sql = await dispatcher.run_blocking(
+        RESOURCE_DB, _get_sql, user_request.request_text, sql_agent, prefetch
+    )
 
     if return_sql:
         # return the text of SQL
-        yield f"SQL🛢️✨:\n{gen_sql}\n\n"
-
-    # execute the sql and return results
-    # result must be a list of dict
-    yield "SQL results: \n\n"
-    rows = sql_agent.execute_sql(gen_sql)
-
-    # add the data retrieved in the conversation, as system message
-    rows_as_str = "\n".join(str(item) for item in rows)
-    msg_text = (
-        f"Data retrieved for request: {user_request.request_text}:\n{rows_as_str}"
-    )
-
-    # data retrieved are added to the conversation history as a SYSTEM message
-    conversation_manager.add_message(
-        user_request.conv_id, SystemMessage(content=msg_text)
+        yield sql_event(gen_sql)
+
+    # execute the sql and return results, in batches
+    yield progress_event("SQL results:")
+
+    # the rows kept for the history, the analytics and the result store:
+    # the first result_max_rows, the others are only streamed
+    max_rows = config.find_key("result_max_rows")
+    rows = []
+    n_rows = 0
+    # the types in the DB, for the typed formats (Arrow)
+    column_types = {}
+    batches = sql_agent.execute_sql_batches(
+        gen_sql, batch_size=batch_size, column_types=column_types
     )
-
-    # streaming, results are sent as markdown
-    async for markdown_line in stream_markdown_table(rows):
-        yield markdown_line
-    yield "\n"
+    try:
+        while True:
+            batch = await dispatcher.run_blocking(RESOURCE_DB, next, batches, None)
+            if batch is None:
+                break
+
+            if not n_rows:
+                yield columns_event(batch[0].keys(), column_types)
+
+            n_rows += len(batch)
+            if len(rows) < max_rows:
+                rows.extend(batch[: max_rows - len(rows)])
+            yield rows_event(batch)
+    finally:
+        try:
+            batches.close()
+        except ValueError:
+            # still running in a thread (cancelled): closed when collected
+            pass
+
+    if not n_rows:
+        yield columns_event(column_types.keys(), column_types)
+
+    if n_rows > len(rows):
+        logger.info("Result of %d rows, the first %d kept", n_rows, len(rows))
+
+    # summary, stats and DataFrame: not in the event loop
+    data_msg = await asyncio.to_thread(_add_data_to_history, user_request, rows, n_rows)
+    # embedded in background, for the selection of the history
+    history_selector.schedule([data_msg])
 
 
 async def handle_analyze_data(user_request: Any):
     """
     Handle text analysis requests.
+
+    If the request can be translated in an operation on the last result set
+    (group by, sort, filter...), it is computed locally and only
+    the output is sent to the model (or directly to the client).
     """
     # the model to be used
     model_index = config.find_key("index_model_analyze_data")
 
-    # Start with preamble
-    all_messages = [SystemMessage(content=PREAMBLE_ANALYZE_DATA)]
-    message_history = conversation_manager.get_conversation(user_request.conv_id)
-    for msg in message_history:
-        all_messages.append(msg)
-    all_messages.append(HumanMessage(content=user_request.request_text))
+    result_rows = None
+    # without a result set in the conversation there is nothing to plan
+    if config.find_key("analytics_enable") and analytics_engine.has_result(
+        user_request.conv_id
+    ):
+        operation = await _plan_analytics(user_request)
+
+        if operation is not None:
+            result_rows = _execute_analytics(user_request, operation)
+
+    await asyncio.sleep(SMALL_STIME)
+    yield progress_event(f"Request: {user_request.request_text}")
+
+    if result_rows is not None:
+        result_text = summarize_result(
+            user_request.request_text,
+            result_rows,
+            result_store.add(result_rows),
+            token_budget=config.find_key("result_token_budget"),
+            max_sample_rows=config.find_key("result_sample_rows"),
+            top_n=config.find_key("result_top_values"),
+        )
+
+        if config.find_key("analytics_direct_answer"):
+            # no LLM, the result of the operation is the answer
+            yield columns_event(result_rows[0].keys() if result_rows else [])
+            if result_rows:
+                yield rows_event(result_rows)
+
+            result_msg = SystemMessage(content=result_text)
+            await conversation_manager.aadd_message(user_request.conv_id, result_msg)
+            history_selector.schedule([result_msg])
+            return
+
+        # only the output of the operation is sent to the model
+        all_messages = [
+            SystemMessage(content=PREAMBLE_ANALYZE_DATA),
+            SystemMessage(content=result_text),
+            HumanMessage(content=user_request.request_text),
+        ]
+    else:
+        message_history = await _select_history(
+            user_request,
+            await conversation_manager.aget_conversation(user_request.conv_id),
+        )
+        # preamble, history (the shared messages, not copied), request
+        all_messages = [
+            SystemMessage(content=PREAMBLE_ANALYZE_DATA),
+            *message_history,
+            HumanMessage(content=user_request.request_text),
+        ]
+
+    # the model, from the cheapest suitable (if the cascade is enabled)
+    model_indexes = llm_manager.select_models(
+        AllowedValues.ANALYZE_DATA.value,
+        user_request.request_text,
+        model_index,
+        data_chars=sum(len(msg.content) for msg in all_messages[1:-1]),
+    )
 
     if VERBOSE:
         logger.info(
             "calling Model %s...",
-            llm_manager.get_llm_model_name(model_index),
+            llm_manager.get_llm_model_name(model_indexes[0]),
         )
         logger.info("")
 
     await asyncio.sleep(SMALL_STIME)
-    yield f"Request: {user_request.request_text}\n"
-    await asyncio.sleep(SMALL_STIME)
-    yield "Answer in preparation...\n\n"
-
-    # call the model
-    generator = llm_manager.get_llm_model(model_index).stream(all_messages)
+    yield progress_event("Answer in preparation...")
 
-    # need to correctly manage async response
-    async for chunk in _wrap_generator(generator):
-        yield str(chunk.content)
+    # call the model, streaming
+    async for text in _astream_tokens(
+        AllowedValues.ANALYZE_DATA.value, model_indexes, all_messages
+    ):
+        yield token_event(text)
 
 
 @TRACER.start_as_current_span("handle_not_allowed")
@@ -226,54 +502,121 @@ async def handle_not_allowed(user_request: Any):
     Handle response for not allowed requests.
     """
     await asyncio.sleep(SMALL_STIME)
-    yield f"Request: {user_request.request_text} is not allowed !!!\n"
+    yield progress_event(f"Request: {user_request.request_text} is not allowed !!!")
     await asyncio.sleep(SMALL_STIME)
-    yield "DDL/DML request are not allowed! \n"
+    yield progress_event("DDL/DML request are not allowed!")
 
 
-async def _wrap_generator(generator):
+async def _select_history(user_request: Any, message_history, query_embedding=None):
     """
-    Convert a normal generator in an asynch generator
-    to be used bu answer directly
+    Select the recent and relevant messages of the history, within the budget
+    (the whole history, if the selection is disabled or fails)
 
-    Args:
-        generator: Generatore normale.
+    query_embedding: the embedding of the request, if already computed
+    """
+    if not config.find_key("history_selection_enable"):
+        return message_history
+
+    try:
+        return await history_selector.aselect(
+            message_history, user_request.request_text, query_embedding
+        )
+    except Exception as e:
+        logger.error("Error in history selection: %s", e)
+        return message_history
+
+
+async def _astream_tokens(route, model_indexes, messages):
+    """
+    Stream the answer of the model as an async generator of text chunks.
+
+    Uses the async streaming of the model (astream): the wait for the next
+    token doesn't block the event loop, so concurrent streams don't stall
+    each other (for models without native async support LangChain
+    reads the sync stream in a thread).
+    The endpoint is chosen (and the request hedged) by the LLMManager;
+    if the first model fails before the first token, the next one is used.
 
     Yields:
-        Value from generator
+        the text of every chunk
     """
-    for item in generator:
-        # make the cycle cooperative
-        await asyncio.sleep(0)
-        yield item
+    time_start = time()
+    first = True
+
+    async for chunk in llm_manager.astream_cascade(route, model_indexes, messages):
+        if first:
+            # prompts with and without a summary of the history
+            history_compactor.record_prompt(messages, time() - time_start)
+            first = False
+        yield chunk.content
 
 
 async def handle_answer_directly(user_request: Any):
     """
     Handle direct request to Chat model.
     """
-    verbose = bool(config.find_key("verbose"))
+    verbose = config.find_key("verbose")
     model_index = config.find_key("index_model_answer_directly")
 
-    # Start with preamble
-    all_messages = [SystemMessage(content=PREAMBLE_ANSWER_DIRECTLY)]
-    message_history = conversation_manager.get_conversation(user_request.conv_id)
-    for msg in message_history:
-        all_messages.append(msg)
-    all_messages.append(HumanMessage(content=user_request.request_text))
+    message_history = await conversation_manager.aget_conversation(user_request.conv_id)
+
+    yield progress_event("Answer in preparation...")
+
+    # the answer can be reused only with the same history
+    fingerprint = history_fingerprint(message_history)
+    try:
+        cached_answer, embedding = await response_cache.aget(
+            user_request.request_text, fingerprint
+        )
+    except Exception as e:
+        logger.error("Error in response cache: %s", e)
+        cached_answer, embedding = None, None
+
+    if cached_answer is not None:
+        if verbose:
+            logger.info("Answer from response cache...")
+
+        # replayed as a stream, same protocol for the client
+        for text in split_answer(
+            cached_answer, config.find_key("response_cache_chunk_size")
+        ):
+            yield token_event(text)
+            await asyncio.sleep(0)
+        return
+
+    # only the recent and relevant part of the history
+    message_history = await _select_history(user_request, message_history, embedding)
+    # preamble, history (the shared messages, not copied), request
+    all_messages = [
+        SystemMessage(content=PREAMBLE_ANSWER_DIRECTLY),
+        *message_history,
+        HumanMessage(content=user_request.request_text),
+    ]
+
+    # the model, from the cheapest suitable (if the cascade is enabled)
+    model_indexes = llm_manager.select_models(
+        AllowedValues.ANSWER_DIRECTLY.value,
+        user_request.request_text,
+        model_index,
+        data_chars=sum(len(msg.content) for msg in message_history),
+    )
 
     if verbose:
         logger.info(
             "Calling model %s...",
-            llm_manager.get_llm_model_name(model_index),
+            llm_manager.get_llm_model_name(model_indexes[0]),
         )
         logger.info("")
 
-    yield "Answer in preparation...\n\n"
-
-    # call the model
-    generator = llm_manager.get_llm_model(model_index).stream(all_messages)
-
-    # need to correctly manage async response
-    async for chunk in _wrap_generator(generator):
-        yield str(chunk.content)
+    # call the model, streaming
+    answer = []
+    async for text in _astream_tokens(
+        AllowedValues.ANSWER_DIRECTLY.value, model_indexes, all_messages
+    ):
+        answer.append(text)
+        yield token_event(text)
+
+    # only complete answers are cached
+    response_cache.set(
+        user_request.request_text, fingerprint, "".join(answer), embedding
+    )
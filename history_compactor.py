@@ -0,0 +1,277 @@
+"""
+File name: history_compactor.py
+Author: Luigi Saetta
+Date last modified: 2026-10-19
+Python Version: 3.11
+
+Description:
+    Rolling compaction of long conversations.
+    When the history of a conversation exceeds a token threshold (or is
+    close to max_msgs, where the oldest messages would be dropped),
+    the older messages are summarized by a small model, in background
+    (off the request path), in a single system message that replaces them.
+    The last messages are kept as they are, as the most recent data
+    retrieved from the DB (the user could still be analysing it).
+    The older data messages are sent to the summarizer truncated
+    (the beginning: request, columns and stats).
+    If the conversation changes during the summarization, nothing is
+    replaced (it will be compacted at the next turn).
+
+    Stats: tokens saved by compaction, and prompt size and time to first
+    token of the prompts with and without a summary.
+
+Inspired by:
+
+Usage:
+    Import this module into other scripts to use its functions.
+    Example:
+        compactor = HistoryCompactor(conversation_manager, llm_manager)
+        # at the end of a turn, in the event loop
+        compactor.schedule(conv_id)
+
+License:
+    This code is released under the MIT License.
+
+Notes:
+    This is a part of a set of demos showing how to build a SQL Agent
+    for Text2SQL tasks
+
+Warnings:
+    This module is in development, may change in future versions.
+"""
+
+import asyncio
+from time import time
+from typing import Sequence
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from langchain_core.prompts import PromptTemplate
+
+from conversation_manager import DATA_MSG_PREFIX, SUMMARY_MSG_PREFIX
+from prompts_models import PROMPT_SUMMARIZE_HISTORY
+from result_summarizer import estimate_tokens
+from utils import get_console_logger
+
+logger = get_console_logger()
+
+
+def is_summary(msg: BaseMessage) -> bool:
+    """
+    True if the message is the summary of older messages
+    """
+    return isinstance(msg, SystemMessage) and msg.content.startswith(SUMMARY_MSG_PREFIX)
+
+
+def _is_data(msg: BaseMessage) -> bool:
+    return isinstance(msg, SystemMessage) and msg.content.startswith(DATA_MSG_PREFIX)
+
+
+def _count_tokens(messages: Sequence[BaseMessage]) -> int:
+    return sum(estimate_tokens(msg.content) for msg in messages)
+
+
+def _to_prompt_text(msg: BaseMessage, data_max_chars: int) -> str:
+    """
+    the message in the prompt of the summarizer (data truncated)
+    """
+    content = msg.content
+    if _is_data(msg) and len(content) > data_max_chars:
+        content = content[:data_max_chars] + "\n... (data truncated)"
+    return f"{msg.type}: {content}"
+
+
+class HistoryCompactor:
+    """
+    Summarize the older messages of long conversations, in background
+
+    It is a singleton
+    """
+
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(
+        self,
+        conversation_manager=None,
+        llm_manager=None,
+        model_index: int = 0,
+        token_threshold: int = 4000,
+        n_recent: int = 4,
+        msgs_margin: int = 2,
+        data_max_chars: int = 1000,
+        enabled: bool = True,
+    ):
+        """
+        model_index: the model used to summarize (a small one)
+        token_threshold: conversations longer (tokens, estimated) are compacted
+        n_recent: the last messages, never summarized
+        msgs_margin: conversations with more than max_msgs - msgs_margin
+            messages are compacted (before the oldest are dropped)
+        data_max_chars: max length of a data message sent to the summarizer
+        enabled: if False, conversations are never compacted
+        """
+        # Only initialize attributes if they haven't been initialized yet
+        if not hasattr(self, "tasks"):
+            self.conversation_manager = conversation_manager
+            self.llm_manager = llm_manager
+            self.model_index = model_index
+            self.token_threshold = token_threshold
+            self.n_recent = n_recent
+            self.msgs_margin = msgs_margin
+            self.data_max_chars = data_max_chars
+            self.enabled = enabled
+
+            # conv_id -> compaction running
+            self.tasks = {}
+
+            # stats
+            self.n_compactions = 0
+            self.n_conflicts = 0
+            self.n_errors = 0
+            self.tokens_before = 0
+            self.tokens_after = 0
+            self.compaction_time = 0.0
+            # with/without summary: [n. of prompts, sum of tokens, sum of TTFT]
+            self.prompts = {True: [0, 0, 0.0], False: [0, 0, 0.0]}
+
+    def needs_compaction(self, messages: Sequence[BaseMessage]) -> bool:
+        """
+        True if the conversation is too long (tokens or n. of messages)
+        """
+        if len(messages) <= self.n_recent + 1:
+            return False
+
+        max_msgs = self.conversation_manager.max_msgs
+        return (
+            len(messages) > max_msgs - self.msgs_margin
+            or _count_tokens(messages) > self.token_threshold
+        )
+
+    def schedule(self, conv_id: str):
+        """
+        start the compaction of the conversation in background, if needed
+        (to be called in the event loop, at the end of a turn)
+        """
+        if not self.enabled or conv_id in self.tasks:
+            return
+
+        task = asyncio.get_running_loop().create_task(self._acheck(conv_id))
+        self.tasks[conv_id] = task
+        task.add_done_callback(lambda _: self.tasks.pop(conv_id, None))
+
+    async def _acheck(self, conv_id: str):
+        """
+        compact the conversation, if needed
+        """
+        # the store (if any) is read in a thread
+        messages = await self.conversation_manager.aget_conversation(conv_id)
+        if self.needs_compaction(messages):
+            await self._acompact(conv_id, messages)
+
+    async def _acompact(self, conv_id: str, messages: Sequence[BaseMessage]):
+        """
+        summarize the older messages and replace them in the conversation
+        """
+        time_start = time()
+
+        older = messages[: -self.n_recent]
+        # the last data retrieved is kept as is
+        data_msgs = [msg for msg in older if _is_data(msg)][-1:]
+        to_summarize = [
+            msg for msg in older if not data_msgs or msg is not data_msgs[0]
+        ]
+
+        if len(to_summarize) < 2:
+            return
+
+        try:
+            prompt = PromptTemplate(
+                input_variables=["messages"], template=PROMPT_SUMMARIZE_HISTORY
+            ).format(
+                messages="\n\n".join(
+                    _to_prompt_text(msg, self.data_max_chars) for msg in to_summarize
+                )
+            )
+            llm = self.llm_manager.get_llm_model(self.model_index)
+            response = await llm.ainvoke([HumanMessage(content=prompt)])
+
+            summary = SystemMessage(
+                content=f"{SUMMARY_MSG_PREFIX}:\n{response.content}"
+            )
+            new_messages = [summary, *data_msgs]
+
+            # the conversation manager uses locks, and can write to the store
+            compacted = await asyncio.to_thread(
+                self.conversation_manager.compact, conv_id, older, new_messages
+            )
+        except Exception as e:
+            self.n_errors += 1
+            logger.error("Error compacting conversation %s: %s", conv_id, e)
+            return
+
+        if not compacted:
+            # changed in the meantime, retried at the next turn
+            self.n_conflicts += 1
+            return
+
+        tokens_before = _count_tokens(older)
+        tokens_after = _count_tokens(new_messages)
+        self.n_compactions += 1
+        self.tokens_before += tokens_before
+        self.tokens_after += tokens_after
+        self.compaction_time += time() - time_start
+
+        logger.info(
+            "Compacted conversation %s: %d messages, %d -> %d tokens",
+            conv_id,
+            len(older),
+            tokens_before,
+            tokens_after,
+        )
+
+    def record_prompt(self, messages: Sequence[BaseMessage], ttft: float):
+        """
+        record size and time to first token of a prompt,
+        to compare prompts with and without a summary
+        """
+        stats = self.prompts[any(is_summary(msg) for msg in messages)]
+        stats[0] += 1
+        stats[1] += _count_tokens(messages)
+        stats[2] += ttft
+
+    def get_stats(self):
+        """
+        returns the stats: tokens saved, prompts with/without summary
+        """
+
+        def prompt_stats(n_prompts, sum_tokens, sum_ttft):
+            return {
+                "n_prompts": n_prompts,
+                "avg_tokens": round(sum_tokens / n_prompts) if n_prompts else 0,
+                "avg_ttft": round(sum_ttft / n_prompts, 3) if n_prompts else 0.0,
+            }
+
+        n_compactions = self.n_compactions
+
+        return {
+            "enabled": self.enabled,
+            "n_compactions": n_compactions,
+            "n_conflicts": self.n_conflicts,
+            "n_errors": self.n_errors,
+            "n_running": len(self.tasks),
+            # saved in every following prompt of the conversation
+            "avg_tokens_saved": (
+                round((self.tokens_before - self.tokens_after) / n_compactions)
+                if n_compactions
+                else 0
+            ),
+            "avg_compaction_time": (
+                round(self.compaction_time / n_compactions, 3) if n_compactions else 0.0
+            ),
+            "prompts_with_summary": prompt_stats(*self.prompts[True]),
+            "prompts_without_summary": prompt_stats(*self.prompts[False]),
+        }
@@ -0,0 +1,268 @@
+"""
+File name: history_selector.py
+Author: Luigi Saetta
+Date last modified: 2026-10-19
+Python Version: 3.11
+
+Description:
+    Select the part of the conversation history to send to the LLM,
+    within a token budget:
+        * the most recent messages
+        * the top-k older messages most relevant (embeddings) to the request
+    in chronological order.
+    Every message is embedded only once (embeddings are cached by content),
+    in background, when it is added to the history (schedule): the
+    selection only looks them up. Messages not yet embedded are not
+    candidates as relevant (they are embedded for the next requests).
+    If the whole history fits in the budget, it is used as is.
+
+Inspired by:
+
+Usage:
+    Import this module into other scripts to use its functions.
+    Example:
+        selector = HistorySelector(llm_manager.get_embed_model())
+        selector.schedule([new_message])
+        messages = await selector.aselect(history, request_text)
+
+Dependencies:
+    numpy
+
+License:
+    This code is released under the MIT License.
+
+Notes:
+    This is a part of a set of demos showing how to build a SQL Agent
+    for Text2SQL tasks
+
+Warnings:
+    This module is in development, may change in future versions.
+"""
+
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from langchain_core.messages import BaseMessage
+
+from result_summarizer import estimate_tokens
+from utils import get_console_logger
+
+logger = get_console_logger()
+
+# only the beginning of long messages (e.g. data) is embedded
+EMBED_MAX_CHARS = 2000
+
+
+def _message_key(msg: BaseMessage) -> str:
+    return hashlib.sha1(f"{msg.type}:{msg.content}".encode("utf-8")).hexdigest()
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+class HistorySelector:
+    """
+    Select recent + relevant messages within a token budget
+
+    It is a singleton
+    """
+
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(
+        self,
+        embed_model=None,
+        token_budget: int = 3000,
+        n_recent: int = 4,
+        top_k: int = 4,
+        min_similarity: float = 0.3,
+        max_embeddings: int = 10000,
+        enabled: bool = True,
+    ):
+        """
+        token_budget: max tokens (estimated) of the history sent
+        n_recent: the last messages, always included (if in budget)
+        top_k: max n. of older messages included, by relevance
+        min_similarity: older messages less similar are never included
+        max_embeddings: max n. of embeddings of messages kept in memory
+        enabled: if False, the messages are not embedded
+        """
+        # Only initialize attributes if they haven't been initialized yet
+        if not hasattr(self, "embeddings"):
+            self.embed_model = embed_model
+            self.token_budget = token_budget
+            self.n_recent = n_recent
+            self.top_k = top_k
+            self.min_similarity = min_similarity
+            self.max_embeddings = max_embeddings
+            self.enabled = enabled
+
+            # hash of the message -> normalized embedding
+            self.embeddings = OrderedDict()
+            # hashes of the messages being embedded
+            self.in_progress = set()
+            # the background tasks (a reference is kept until done)
+            self.tasks = set()
+            self.lock = threading.Lock()
+
+            # stats
+            self.n_selections = 0
+            self.tokens_in = 0
+            self.tokens_out = 0
+            self.n_embedded = 0
+            self.n_not_embedded = 0
+
+    def schedule(self, messages: Sequence[BaseMessage]):
+        """
+        embed the messages (the ones not yet embedded) in background
+        (to be called in the event loop, when they are added to the history)
+        """
+        if not self.enabled or self.embed_model is None:
+            return
+
+        with self.lock:
+            missing = {}
+            for msg in messages:
+                key = _message_key(msg)
+                if key not in self.embeddings and key not in self.in_progress:
+                    missing[key] = msg.content[:EMBED_MAX_CHARS]
+            self.in_progress.update(missing)
+
+        if not missing:
+            return
+
+        task = asyncio.get_running_loop().create_task(self._aembed(missing))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _aembed(self, missing: Dict[str, str]):
+        """
+        embed the texts and keep the embeddings (hash -> text)
+        """
+        try:
+            vectors = await self.embed_model.aembed_documents(list(missing.values()))
+            vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+
+            with self.lock:
+                for key, vector in zip(missing.keys(), vectors):
+                    self.embeddings[key] = vector
+                while len(self.embeddings) > self.max_embeddings:
+                    self.embeddings.popitem(last=False)
+                self.n_embedded += len(missing)
+        except Exception as e:
+            logger.error("Error embedding the history: %s", e)
+        finally:
+            with self.lock:
+                self.in_progress.difference_update(missing)
+
+    def _lookup(self, messages: List[BaseMessage]) -> Tuple[List[int], np.ndarray]:
+        """
+        the embeddings of the messages already embedded
+        (the others are scheduled)
+
+        Returns:
+            the positions of the messages found and their embeddings
+        """
+        keys = [_message_key(msg) for msg in messages]
+
+        with self.lock:
+            found = [j for j, key in enumerate(keys) if key in self.embeddings]
+            for j in found:
+                self.embeddings.move_to_end(keys[j])
+            vectors = [self.embeddings[keys[j]] for j in found]
+
+        if len(found) < len(messages):
+            self.n_not_embedded += len(messages) - len(found)
+            self.schedule(messages)
+
+        return found, np.vstack(vectors) if vectors else None
+
+    async def aselect(
+        self, messages: List[BaseMessage], request_text: str, query_embedding=None
+    ) -> List[BaseMessage]:
+        """
+        select the messages of the history to send with the request
+
+        query_embedding: the embedding of the request, if already computed
+
+        Returns:
+            the messages selected, in chronological order
+        """
+        tokens = [estimate_tokens(msg.content) for msg in messages]
+        total_tokens = sum(tokens)
+
+        if total_tokens <= self.token_budget:
+            # all fit, no selection
+            return messages
+
+        selected = set()
+        used = 0
+
+        # the most recent, newest first
+        n_recent = min(self.n_recent, len(messages))
+        for i in range(len(messages) - 1, len(messages) - 1 - n_recent, -1):
+            if used + tokens[i] <= self.token_budget:
+                selected.add(i)
+                used += tokens[i]
+
+        older = list(range(len(messages) - n_recent))
+
+        # the older messages already embedded
+        found, matrix = [], None
+        if older and self.top_k > 0:
+            found, matrix = self._lookup([messages[i] for i in older])
+
+        if found:
+            if query_embedding is None:
+                query_embedding = await self.embed_model.aembed_query(request_text)
+            query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+
+            similarities = matrix @ query
+
+            n_added = 0
+            for j in np.argsort(-similarities, kind="stable"):
+                if n_added >= self.top_k or similarities[j] < self.min_similarity:
+                    break
+                i = older[found[j]]
+                if used + tokens[i] <= self.token_budget:
+                    selected.add(i)
+                    used += tokens[i]
+                    n_added += 1
+
+        self.n_selections += 1
+        self.tokens_in += total_tokens
+        self.tokens_out += used
+
+        logger.info(
+            "History: %d of %d messages, %d of %d tokens",
+            len(selected),
+            len(messages),
+            used,
+            total_tokens,
+        )
+
+        return [messages[i] for i in sorted(selected)]
+
+    def get_stats(self):
+        """
+        returns the stats: tokens of the history before and after the selection
+        """
+        return {
+            "n_selections": self.n_selections,
+            "n_embeddings": len(self.embeddings),
+            "n_embedded": self.n_embedded,
+            "n_not_embedded": self.n_not_embedded,
+            "tokens_in": self.tokens_in,
+            "tokens_out": self.tokens_out,
+        }
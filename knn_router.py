@@ -0,0 +1,336 @@
+"""
+File name: knn_router.py
+Author: Luigi Saetta
+Date last modified: 2026-10-19
+Python Version: 3.11
+
+Description:
+    A local classifier used by the Router before calling the LLM.
+    Labelled examples (the few-shot examples in the routing prompt,
+    the classifications confirmed in production) are embedded
+    in a matrix; a request is classified with kNN (cosine similarity)
+    and the LLM is called only if the kNN is not confident.
+
+    The kNN never decides near not_allowed examples, or for requests
+    that look like DDL/DML: they are always checked by the LLM.
+    The test set (tests/test_router.json) must not be used as examples,
+    otherwise the accuracy measured on it is inflated.
+
+Inspired by:
+
+Usage:
+    Import this module into other scripts to use its functions.
+    Example:
+        knn = KNNRoutingClassifier(llm_manager.get_embed_model())
+        knn.add_examples(parse_prompt_examples(PROMPT_ROUTING_TEMPLATE))
+        prediction = knn.predict(request)
+
+Dependencies:
+    numpy
+
+License:
+    This code is released under the MIT License.
+
+Notes:
+    This is a part of a set of demos showing how to build a SQL Agent
+    for Text2SQL tasks
+
+Warnings:
+    This module is in development, may change in future versions.
+"""
+
+import json
+import re
+import threading
+from collections import deque
+from typing import Any, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from prompt_routing import ALLOWED_VALUES, AllowedValues
+from utils import get_console_logger
+
+logger = get_console_logger()
+
+# to extract the few-shot examples from the routing prompt
+EXAMPLE_PATTERN = re.compile(
+    r"User [Qq]uery:\s*(.+?)\s*\nClassification:\s*(\w+)", re.MULTILINE
+)
+
+
+# requests that could modify the DB: the kNN never classifies them
+DDL_DML_PATTERN = re.compile(
+    r"\b(drop|delete|insert|update|truncate|alter|create|grant|revoke|merge"
+    r"|rename|remove|modify|replace|purge)\b",
+    re.IGNORECASE,
+)
+
+
+def may_be_not_allowed(text: str) -> bool:
+    """
+    True if the request could be classified not_allowed (DDL/DML):
+    it must be checked by the LLM
+    """
+    return DDL_DML_PATTERN.search(text) is not None
+
+
+class KNNPrediction(NamedTuple):
+    """
+    The result of the kNN
+    """
+
+    # the label, None if not confident (the LLM must be used)
+    label: Optional[str]
+    # the best label, even if not confident (None if no neighbour voted)
+    candidate: Optional[str]
+    # the embedding of the request
+    embedding: Any
+
+
+def parse_prompt_examples(template: str) -> List[Tuple[str, str]]:
+    """
+    extract (query, classification) from the examples in the prompt
+    """
+    return [
+        (query, label)
+        for query, label in EXAMPLE_PATTERN.findall(template)
+        if label in ALLOWED_VALUES
+    ]
+
+
+def load_examples_file(file_path: str) -> List[Tuple[str, str]]:
+    """
+    read examples from a JSON file, with the format of tests/test_router.json:
+        [{"query": "...", "expected": "..."}, ...]
+    """
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        logger.warning("Examples file %s not found.", file_path)
+        return []
+    except json.JSONDecodeError:
+        logger.error("Error: The file %s is not a valid JSON.", file_path)
+        return []
+
+    return [
+        (item["query"], item["expected"])
+        for item in data
+        if item.get("expected") in ALLOWED_VALUES
+    ]
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+class KNNRoutingClassifier:
+    """
+    kNN classifier on the embeddings of labelled examples
+
+    Among the k nearest examples, only the ones with similarity >= min_similarity
+    vote (weighted by similarity). A request is classified only if
+        * the best label has at least min_votes votes
+        * the margin between the best and the second label (normalized,
+          over all the k neighbours) is >= min_margin
+        * no neighbour is a not_allowed example
+    otherwise the label is None and the LLM must be used.
+    """
+
+    def __init__(
+        self,
+        embed_model,
+        k: int = 5,
+        min_similarity: float = 0.8,
+        min_margin: float = 0.5,
+        max_examples: int = 10000,
+        min_votes: int = 2,
+    ):
+        self.embed_model = embed_model
+        self.k = k
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+        self.min_votes = min_votes
+        self.max_examples = max_examples
+
+        self.texts = []
+        self.known_texts = set()
+        self.labels = []
+        # normalized embeddings, one row per example
+        self.matrix = None
+        # examples added online (confirmed classifications),
+        # the last max_examples (as the index)
+        self.learned = deque(maxlen=max_examples)
+        self.lock = threading.Lock()
+
+        # stats
+        self.n_requests = 0
+        self.n_hits = 0
+
+    def __len__(self):
+        return len(self.texts)
+
+    def _add_embeddings(self, texts, labels, embeddings):
+        embeddings = _normalize(np.asarray(embeddings, dtype=np.float32))
+
+        with self.lock:
+            self.texts.extend(texts)
+            self.known_texts.update(texts)
+            self.labels.extend(labels)
+            if self.matrix is None:
+                self.matrix = embeddings
+            else:
+                self.matrix = np.vstack([self.matrix, embeddings])
+
+            # keep the index bounded, removing the oldest examples
+            excess = len(self.texts) - self.max_examples
+            if excess > 0:
+                self.known_texts.difference_update(self.texts[:excess])
+                self.texts = self.texts[excess:]
+                self.labels = self.labels[excess:]
+                self.matrix = self.matrix[excess:]
+
+    def add_examples(self, examples: List[Tuple[str, str]]):
+        """
+        embed and add a list of (text, label)
+        """
+        # remove duplicates
+        examples = [
+            (t, l) for t, l in dict(examples).items() if t not in self.known_texts
+        ]
+
+        if not examples:
+            return
+
+        texts = [text for text, _ in examples]
+        labels = [label for _, label in examples]
+
+        self._add_embeddings(texts, labels, self.embed_model.embed_documents(texts))
+
+        logger.info("kNN router: %d examples in index.", len(self.texts))
+
+    def add_example(self, text: str, label: str, embedding=None):
+        """
+        add a single example (for example a classification confirmed in
+        production). If the embedding is already available it is not recomputed.
+        """
+        if label not in ALLOWED_VALUES or text in self.known_texts:
+            return
+
+        if embedding is None:
+            embedding = self.embed_model.embed_query(text)
+
+        self._add_embeddings([text], [label], [embedding])
+        with self.lock:
+            self.learned.append((text, label))
+
+    def _classify_embedding(self, embedding):
+        """
+        the kNN
+
+        Returns:
+            (label or None if not confident, best label or None)
+        """
+        with self.lock:
+            matrix = self.matrix
+            labels = self.labels
+
+        if matrix is None:
+            return None, None
+
+        query = _normalize(np.asarray(embedding, dtype=np.float32))
+        similarities = matrix @ query
+
+        k = min(self.k, len(similarities))
+        top_idx = np.argpartition(-similarities, k - 1)[:k]
+
+        # near a not_allowed example: the LLM decides
+        if any(labels[i] == AllowedValues.NOT_ALLOWED.value for i in top_idx):
+            return None, None
+
+        # only the neighbours close enough can vote
+        voting_idx = top_idx[similarities[top_idx] >= self.min_similarity]
+
+        if len(voting_idx) == 0:
+            return None, None
+
+        # similarity-weighted votes
+        votes = {}
+        n_votes = {}
+        for i in voting_idx:
+            votes[labels[i]] = votes.get(labels[i], 0.0) + float(similarities[i])
+            n_votes[labels[i]] = n_votes.get(labels[i], 0) + 1
+
+        best_label, best_score = max(votes.items(), key=lambda item: item[1])
+
+        # the margin against all the other neighbours, also the ones
+        # not close enough to vote
+        others_score = sum(
+            max(float(similarities[i]), 0.0) for i in top_idx if labels[i] != best_label
+        )
+        margin = (best_score - others_score) / max(best_score, 1e-12)
+
+        if n_votes[best_label] < self.min_votes or margin < self.min_margin:
+            return None, best_label
+        return best_label, best_label
+
+    def _update_stats(self, label):
+        self.n_requests += 1
+        if label is not None:
+            self.n_hits += 1
+
+    def predict(self, text: str) -> KNNPrediction:
+        """
+        classify the request
+        """
+        embedding = self.embed_model.embed_query(text)
+        label, candidate = self._classify_embedding(embedding)
+        self._update_stats(label)
+        return KNNPrediction(label, candidate, embedding)
+
+    async def apredict(self, text: str) -> KNNPrediction:
+        """
+        async version of predict
+        """
+        embedding = await self.embed_model.aembed_query(text)
+        label, candidate = self._classify_embedding(embedding)
+        self._update_stats(label)
+        return KNNPrediction(label, candidate, embedding)
+
+    def save_learned_examples(self, file_path: str):
+        """
+        save the examples added online, with the format of tests/test_router.json
+        (the file keeps the last max_examples)
+        """
+        with self.lock:
+            learned = list(self.learned)
+
+        if not learned:
+            return
+
+        examples = load_examples_file(file_path)
+        known = {query for query, _ in examples}
+        examples += [(t, l) for t, l in learned if t not in known]
+        examples = examples[-self.max_examples :]
+
+        with open(file_path, "w", encoding="utf-8") as f:
+            json.dump(
+                [{"query": query, "expected": label} for query, label in examples],
+                f,
+                indent=2,
+            )
+
+    def get_stats(self):
+        """
+        returns the stats of the classifier
+        """
+        return {
+            "n_examples": len(self.texts),
+            "n_learned": len(self.learned),
+            "n_requests": self.n_requests,
+            "n_hits": self.n_hits,
+            "hit_rate": (
+                round(self.n_hits / self.n_requests, 3) if self.n_requests else 0.0
+            ),
+        }
@@ -1,7 +1,7 @@
 """
 File name: llm_manager.py
 Author: Luigi Saetta
-Date last modified: 2024-10-25
+Date last modified: 2026-10-19
 Python Version: 3.11
 
 Description:
@@ -27,12 +27,31 @@ Warnings:
     This module is in development, may change in future versions.
 """
 
+import threading
+from time import time
+
+from langchain_core.messages import HumanMessage
 from langchain_community.chat_models.oci_generative_ai import ChatOCIGenAI
+from langchain_community.embeddings import OCIGenAIEmbeddings
+
+from endpoint_group import EndpointCallbackHandler, EndpointGroup, hedged_astream
+from model_cascade import ModelCascade
 
 
 class LLMManager:
     """
     The class handle all the LLM-related tasks
+
+    Clients are created once for every (model index, endpoint, params)
+    and reused (thread-safe), to avoid re-creating the OCI signer and
+    client and to keep HTTP connections alive.
+
+    A model can have several endpoints (an endpoint group, see
+    endpoint_group.py): every request goes to an endpoint chosen on latency,
+    excluding the ones with repeated errors.
+
+    With the cascade enabled, a request starts on the cheapest suitable model
+    (see model_cascade.py).
     """
 
     def __init__(self, config, compartment_id, logger):
@@ -41,6 +60,22 @@ class LLMManager:
         self.compartment_id = compartment_id
         self.logger = logger
 
+        # (model_index, endpoint index, temperature, max_tokens) -> client
+        self._clients = {}
+        # model_index -> EndpointGroup
+        self._groups = {}
+        self._embed_model = None
+        # reentrant: the group can be created while creating a client
+        self._lock = threading.RLock()
+
+        self.cascade = None
+        if self.config.find_key("cascade_enable"):
+            self.cascade = ModelCascade(
+                models=self.config.find_key("cascade_models"),
+                thresholds=self.config.find_key("cascade_thresholds"),
+                verbose=self.config.find_key("verbose"),
+            )
+
     def get_llm_model_name(self, model_index):
         """
         get the name of a model (see config.toml)
@@ -49,20 +84,54 @@ class LLMManager:
 
         return models_list[model_index]
 
+    def get_llm_model_endpoints(self, model_index):
+        """
+        get the list of endpoints of a model (see config.toml,
+        every entry is a list)
+        """
+        return list(self.config.find_key("models_endpoints")[model_index])
+
     def get_llm_model_endpoint(self, model_index):
         """
-        get the endpoint of a model (see config.toml)
+        get the (first) endpoint of a model (see config.toml)
         """
-        models_endpoints = self.config.find_key("models_endpoints")
+        return self.get_llm_model_endpoints(model_index)[0]
 
-        return models_endpoints[model_index]
+    def get_endpoint_group(self, model_index) -> EndpointGroup:
+        """
+        return the endpoint group of the model, created on first use
+        """
+        group = self._groups.get(model_index)
+        if group is None:
+            with self._lock:
+                group = self._groups.get(model_index)
+                if group is None:
+                    group = EndpointGroup(
+                        self.get_llm_model_name(model_index),
+                        self.get_llm_model_endpoints(model_index),
+                        ewma_alpha=self.config.find_key("endpoint_ewma_alpha"),
+                        failure_threshold=int(
+                            self.config.find_key("endpoint_failure_threshold")
+                        ),
+                        open_time=self.config.find_key("endpoint_open_time"),
+                        hedge_min_delay=self.config.find_key("hedge_min_delay"),
+                        hedge_min_samples=int(
+                            self.config.find_key("hedge_min_samples")
+                        ),
+                    )
+                    self._groups[model_index] = group
 
-    def get_llm_model(self, model_index):
+        return group
+
+    def _create_llm_model(self, model_index, endpoint_index, temperature, max_tokens):
         """
-        added to see if it solves the problem with connections
+        create a new client for the model, on one of its endpoints
         """
         model_name = self.get_llm_model_name(model_index)
-        endpoint = self.get_llm_model_endpoint(model_index)
+        group = self.get_endpoint_group(model_index)
+        endpoint = group.states[endpoint_index].endpoint
+
+        self.logger.info("Creating client for model %s (%s)...", model_name, endpoint)
 
         chat = ChatOCIGenAI(
             # modified to support non-default auth (inst_princ..)
@@ -71,9 +140,182 @@ class LLMManager:
             service_endpoint=endpoint,
             compartment_id=self.compartment_id,
             model_kwargs={
-                "temperature": self.config.find_key("temperature"),
-                "max_tokens": self.config.find_key("max_tokens"),
+                "temperature": temperature,
+                "max_tokens": max_tokens,
             },
+            # to collect latency and errors of the endpoint
+            callbacks=[EndpointCallbackHandler(group, endpoint_index)],
         )
 
         return chat
+
+    def get_llm_model(
+        self, model_index, temperature=None, max_tokens=None, endpoint_index=None
+    ):
+        """
+        return the client for the model, created on first use and then reused
+
+        temperature and max_tokens, if not provided, are read from config
+        endpoint_index: if not provided, the endpoint is chosen by the group
+        """
+        if temperature is None:
+            temperature = self.config.find_key("temperature")
+        if max_tokens is None:
+            max_tokens = self.config.find_key("max_tokens")
+        if endpoint_index is None:
+            endpoint_index = self.get_endpoint_group(model_index).select()
+
+        key = (model_index, endpoint_index, temperature, max_tokens)
+
+        chat = self._clients.get(key)
+        if chat is None:
+            with self._lock:
+                # double check, another thread could have created it
+                chat = self._clients.get(key)
+                if chat is None:
+                    chat = self._create_llm_model(
+                        model_index, endpoint_index, temperature, max_tokens
+                    )
+                    self._clients[key] = chat
+
+        return chat
+
+    async def astream(self, model_index, messages):
+        """
+        stream the answer of the model (async)
+
+        If hedging is enabled and the model has more endpoints, a slow
+        first token triggers a second request to another endpoint
+
+        Yields:
+            the chunks of the answer
+        """
+        if not self.config.find_key("hedge_enable"):
+            async for chunk in self.get_llm_model(model_index).astream(messages):
+                yield chunk
+            return
+
+        async for chunk in hedged_astream(
+            self.get_endpoint_group(model_index),
+            lambda i: self.get_llm_model(model_index, endpoint_index=i),
+            messages,
+        ):
+            yield chunk
+
+    def select_models(self, route, request_text, default_index, data_chars=0):
+        """
+        the models to use for a request (from the cascade, if enabled)
+
+        Returns:
+            the indexes of the models, in order: the first is used,
+            the others only if the previous one fails
+        """
+        if self.cascade is None:
+            return [default_index]
+
+        # the model configured for the route is the largest one used
+        return self.cascade.select(
+            route, request_text, data_chars, max_model=default_index
+        )
+
+    async def astream_cascade(self, route, model_indexes, messages):
+        """
+        stream the answer from the first model in model_indexes,
+        escalating to the next one if it fails before the first token
+
+        Yields:
+            the chunks of the answer
+        """
+        for position, model_index in enumerate(model_indexes):
+            time_start = time()
+            ttft = None
+
+            try:
+                async for chunk in self.astream(model_index, messages):
+                    if ttft is None:
+                        ttft = time() - time_start
+                    yield chunk
+            except Exception as e:
+                if ttft is None and position < len(model_indexes) - 1:
+                    if self.cascade is not None:
+                        self.cascade.record_fallback(route, model_index, e)
+                    continue
+                raise
+
+            if self.cascade is not None and ttft is not None:
+                self.cascade.record_latency(model_index, ttft, time() - time_start)
+            return
+
+    def get_embed_model(self):
+        """
+        return the client for the embedding model (see config.toml),
+        created on first use and then reused
+        """
+        if self._embed_model is None:
+            with self._lock:
+                if self._embed_model is None:
+                    self._embed_model = OCIGenAIEmbeddings(
+                        auth_type=self.config.find_key("auth_type"),
+                        model_id=self.config.find_key("embed_model"),
+                        service_endpoint=self.config.find_key("embed_endpoint"),
+                        compartment_id=self.compartment_id,
+                    )
+
+        return self._embed_model
+
+    def warmup(self, model_indexes=None, send_request=False):
+        """
+        create in advance the clients for the models
+
+        model_indexes: if not provided, all the models in config
+        send_request: if True, send a minimal request to every model,
+            to open the connection (TLS handshake) before the first user request
+        """
+        if model_indexes is None:
+            model_indexes = range(len(self.config.find_key("models_list")))
+
+        for model_index in model_indexes:
+            # all the endpoints of the model
+            for endpoint_index in range(len(self.get_endpoint_group(model_index))):
+                chat = self.get_llm_model(model_index, endpoint_index=endpoint_index)
+
+                if send_request:
+                    try:
+                        chat.invoke([HumanMessage(content="Hi")])
+                    except Exception as e:
+                        self.logger.error(
+                            "Error in warmup of model %s: %s",
+                            self.get_llm_model_name(model_index),
+                            e,
+                        )
+
+    def reset_clients(self):
+        """
+        remove all the clients: they will be re-created on next use
+        (for example, after credentials rotation)
+
+        Returns:
+            the number of clients removed
+        """
+        with self._lock:
+            n_clients = len(self._clients)
+            self._clients = {}
+            self._embed_model = None
+
+        self.logger.info("Removed %d LLM clients.", n_clients)
+        return n_clients
+
+    def get_stats(self):
+        """
+        returns the stats of the endpoint groups, by model name,
+        and of the cascade
+        """
+        stats = {
+            "endpoints": {
+                self.get_llm_model_name(model_index): group.get_stats()
+                for model_index, group in self._groups.items()
+            }
+        }
+        if self.cascade is not None:
+            stats["cascade"] = self.cascade.get_stats()
+        return stats
@@ -0,0 +1,194 @@
+"""
+File name: markdown_table.py
+Author: Luigi Saetta
+Date last modified: 2026-10-19
+Python Version: 3.11
+
+Description:
+    Stream rows returned from a query as a Markdown table.
+    Column widths are estimated from the first rows only (no full scan)
+    and rows are sent to the client in size-bounded chunks.
+
+Inspired by:
+
+Usage:
+    Import this module into other scripts to use its functions.
+    Example:
+        async for chunk in stream_markdown_table(rows):
+            ...
+
+License:
+    This code is released under the MIT License.
+
+Notes:
+    This is a part of a set of demos showing how to build a SQL Agent
+    for Text2SQL tasks
+
+Warnings:
+    This module is in development, may change in future versions.
+"""
+
+import asyncio
+from itertools import chain, islice
+from typing import Iterable, List, Optional
+
+# number of rows used to estimate column widths
+DEFAULT_SAMPLE_ROWS = 50
+# cells longer than this are truncated
+DEFAULT_MAX_COL_WIDTH = 60
+# max number of chars in a chunk sent to the client
+DEFAULT_CHUNK_SIZE = 4096
+
+ELLIPSIS = "…"
+
+
+def _cell_to_str(value) -> str:
+    """
+    render a single cell, keeping the table on one line per row
+    """
+    if value is None:
+        return ""
+    return str(value).replace("\n", " ").replace("|", "\\|")
+
+
+def calculate_column_widths(rows, headers=None, max_width: Optional[int] = None):
+    """
+    compute column widths for the table
+
+    rows: the rows used for the estimate (normally only a sample)
+    headers: if not provided, taken from the first row
+    max_width: if provided, no column is wider than this
+    """
+    if headers is None:
+        headers = list(rows[0].keys())
+
+    column_widths = {key: len(str(key)) for key in headers}
+    # Update column widths based on row contents
+    for row in rows:
+        for key in headers:
+            column_widths[key] = max(
+                column_widths[key], len(_cell_to_str(row.get(key, "")))
+            )
+
+    if max_width is not None:
+        column_widths = {
+            key: min(width, max(max_width, len(str(key))))
+            for key, width in column_widths.items()
+        }
+    return column_widths
+
+
+class MarkdownTableFormatter:
+    """
+    Format rows as Markdown table lines, with widths estimated
+    from a sample of the rows.
+
+    Cells wider than the estimated width are expanded (the row is simply
+    longer, Markdown doesn't need alignment), cells wider than
+    max_col_width are truncated.
+    """
+
+    def __init__(
+        self,
+        headers: List[str],
+        sample_rows: List[dict],
+        max_col_width: int = DEFAULT_MAX_COL_WIDTH,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ):
+        self.headers = list(headers)
+        self.max_col_width = max_col_width
+        self.chunk_size = chunk_size
+        self.column_widths = calculate_column_widths(
+            sample_rows, self.headers, max_width=max_col_width
+        )
+
+    def _fit(self, text: str, key: str) -> str:
+        """
+        pad, or truncate, the text of a cell
+        """
+        if len(text) > self.max_col_width:
+            text = text[: self.max_col_width - 1] + ELLIPSIS
+        return f"{text:<{self.column_widths[key]}}"
+
+    def format_header(self) -> str:
+        """
+        return header and separator rows
+        """
+        header_row = (
+            "| "
+            + " | ".join(f"{key:<{self.column_widths[key]}}" for key in self.headers)
+            + " |"
+        )
+        separator_row = (
+            "| "
+            + " | ".join("-" * self.column_widths[key] for key in self.headers)
+            + " |"
+        )
+        return header_row + "\n" + separator_row + "\n"
+
+    def format_row(self, row: dict) -> str:
+        """
+        return a single data row
+        """
+        return (
+            "| "
+            + " | ".join(
+                self._fit(_cell_to_str(row.get(key, "")), key) for key in self.headers
+            )
+            + " |\n"
+        )
+
+    def iter_chunks(self, rows: Iterable[dict]):
+        """
+        Format rows and group them in chunks of at most chunk_size chars
+        (a single row longer than chunk_size is sent alone)
+        """
+        buffer = []
+        buffer_len = 0
+
+        for row in rows:
+            line = self.format_row(row)
+
+            if buffer and buffer_len + len(line) > self.chunk_size:
+                yield "".join(buffer)
+                buffer = []
+                buffer_len = 0
+
+            buffer.append(line)
+            buffer_len += len(line)
+
+        if buffer:
+            yield "".join(buffer)
+
+
+async def stream_markdown_table(
+    rows: Iterable[dict],
+    sample_rows: int = DEFAULT_SAMPLE_ROWS,
+    max_col_width: int = DEFAULT_MAX_COL_WIDTH,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+):
+    """
+    Stream rows of data as a Markdown table with padded columns.
+
+    rows can be a list or any iterable of dict: only the first sample_rows
+    are read before the header is sent.
+    """
+    rows_iter = iter(rows)
+    sample = list(islice(rows_iter, sample_rows))
+
+    if not sample:
+        return
+
+    formatter = MarkdownTableFormatter(
+        list(sample[0].keys()),
+        sample,
+        max_col_width=max_col_width,
+        chunk_size=chunk_size,
+    )
+
+    yield formatter.format_header()
+
+    for chunk in formatter.iter_chunks(chain(sample, rows_iter)):
+        yield chunk
+        # make the cycle cooperative
+        await asyncio.sleep(0)
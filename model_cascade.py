@@ -0,0 +1,223 @@
+"""
+File name: model_cascade.py
+Author: Luigi Saetta
+Date last modified: 2026-10-19
+Python Version: 3.11
+
+Description:
+    Cheap-model-first cascade.
+    The models are ordered from the cheapest (and fastest) to the largest.
+    A lightweight scorer (request length, size of the data in the context,
+    keywords, route) decides from which model to start; if a model fails
+    before the first token, the request escalates to the next one.
+    The model configured for the route (e.g. index_model_answer_directly)
+    is the largest one used for its requests.
+    Decisions (logged if verbose), per-model latency and escalation rate
+    are exposed as stats, to tune the cost/latency tradeoff.
+
+Inspired by:
+    FrugalGPT (Chen, Zaharia, Zou)
+
+Usage:
+    Import this module into other scripts to use its functions.
+    Example:
+        cascade = ModelCascade(models=[0, 2], thresholds=[0.5], verbose=True)
+        model_indexes = cascade.select(route, request_text, data_chars, max_model=2)
+
+License:
+    This code is released under the MIT License.
+
+Notes:
+    This is a part of a set of demos showing how to build a SQL Agent
+    for Text2SQL tasks
+
+Warnings:
+    This module is in development, may change in future versions.
+"""
+
+import re
+import threading
+from collections import defaultdict
+from typing import List
+
+from prompt_routing import AllowedValues
+from utils import get_console_logger
+
+logger = get_console_logger()
+
+# requests that need reasoning
+COMPLEX_KEYWORDS = re.compile(
+    r"\b(why|explain\w*|reason\w*|trend\w*|compar\w*|correlat\w*|forecast\w*|"
+    r"predict\w*|insight\w*|analy[sz]\w*|cause\w*|recommend\w*|perch[eé])\b",
+    re.IGNORECASE,
+)
+# requests about formatting and simple manipulations
+TRIVIAL_KEYWORDS = re.compile(
+    r"\b(table|format|list|sort|order|bullet\w*|translate|rename|"
+    r"uppercase|lowercase|json|csv|tabella)\b",
+    re.IGNORECASE,
+)
+
+# a request this long (in words) gets the max length score
+LONG_REQUEST_WORDS = 60
+# data in context this large (in chars) gets the max data score
+LARGE_DATA_CHARS = 20000
+
+# base score of every route
+ROUTE_SCORES = {
+    AllowedValues.ANSWER_DIRECTLY.value: 0.0,
+    AllowedValues.ANALYZE_DATA.value: 0.1,
+}
+
+
+def score_request(request_text: str, data_chars: int = 0, route: str = None) -> float:
+    """
+    estimate (0..1) how much the request needs a large model
+    """
+    n_words = len(request_text.split())
+
+    score = ROUTE_SCORES.get(route, 0.0)
+    score += 0.3 * min(n_words / LONG_REQUEST_WORDS, 1.0)
+    score += 0.3 * min(data_chars / LARGE_DATA_CHARS, 1.0)
+
+    if COMPLEX_KEYWORDS.search(request_text):
+        score += 0.4
+    elif TRIVIAL_KEYWORDS.search(request_text):
+        score -= 0.3
+
+    return min(max(score, 0.0), 1.0)
+
+
+class ModelCascade:
+    """
+    Choose the model for a request, from the cheapest
+    """
+
+    def __init__(
+        self, models: List[int], thresholds: List[float], verbose: bool = False
+    ):
+        """
+        models: indexes of the models (see config.toml), from the cheapest
+        thresholds: scores to start from the next model
+            (len(thresholds) == len(models) - 1)
+        verbose: log every decision
+        """
+        if len(thresholds) != len(models) - 1:
+            raise ValueError("The cascade needs one threshold less than models.")
+
+        self.models = list(models)
+        self.thresholds = sorted(thresholds)
+        self.verbose = verbose
+        self.lock = threading.Lock()
+
+        # stats, by route
+        self.n_requests = defaultdict(int)
+        # started above the cheapest model (by the score)
+        self.n_larger_start = defaultdict(int)
+        # escalated to the next model, after a failure
+        self.n_fallbacks = defaultdict(int)
+        # by route and model index
+        self.n_selected = defaultdict(lambda: defaultdict(int))
+        # by model index: [n. of calls, sum of TTFT, sum of total time]
+        self.latencies = defaultdict(lambda: [0, 0.0, 0.0])
+
+    def select(
+        self,
+        route: str,
+        request_text: str,
+        data_chars: int = 0,
+        max_model: int = None,
+    ) -> List[int]:
+        """
+        choose the model from which to start
+
+        max_model: the model configured for the route, the largest one used
+            (the models after it in the cascade are not used; if it isn't in
+            the cascade, it is the only one used)
+
+        Returns:
+            the indexes of the models to try, in order
+            (the first is the one chosen, the others for escalation)
+        """
+        models = self.models
+        if max_model is not None:
+            if max_model not in models:
+                return [max_model]
+            models = models[: models.index(max_model) + 1]
+
+        score = score_request(request_text, data_chars, route)
+        tier = sum(1 for threshold in self.thresholds if score >= threshold)
+        tier = min(tier, len(models) - 1)
+
+        with self.lock:
+            self.n_requests[route] += 1
+            self.n_selected[route][models[tier]] += 1
+            if tier > 0:
+                self.n_larger_start[route] += 1
+
+        if self.verbose:
+            logger.info(
+                "Cascade %s: score %.2f (words: %d, data chars: %d) -> model %d",
+                route,
+                score,
+                len(request_text.split()),
+                data_chars,
+                models[tier],
+            )
+
+        return models[tier:]
+
+    def record_fallback(self, route: str, model_index: int, error: Exception):
+        """
+        the model failed before the first token, the next one is used
+        """
+        with self.lock:
+            self.n_fallbacks[route] += 1
+
+        logger.warning(
+            "Cascade %s: model %d failed (%s), escalating...", route, model_index, error
+        )
+
+    def record_latency(self, model_index: int, ttft: float, total: float):
+        """
+        record time to first token and total time of a call
+        """
+        with self.lock:
+            stats = self.latencies[model_index]
+            stats[0] += 1
+            stats[1] += ttft
+            stats[2] += total
+
+    def get_stats(self):
+        """
+        returns the stats: decisions, larger start and escalation rate by route,
+        latency by model
+        """
+        with self.lock:
+            routes = {
+                route: {
+                    "n_requests": n_requests,
+                    "n_by_model": dict(self.n_selected[route]),
+                    "larger_start_rate": round(
+                        self.n_larger_start[route] / n_requests, 3
+                    ),
+                    "escalation_rate": round(self.n_fallbacks[route] / n_requests, 3),
+                    "n_fallbacks": self.n_fallbacks[route],
+                }
+                for route, n_requests in self.n_requests.items()
+            }
+            models = {
+                model_index: {
+                    "n_calls": n_calls,
+                    "avg_ttft": round(sum_ttft / n_calls, 3),
+                    "avg_total": round(sum_total / n_calls, 3),
+                }
+                for model_index, (
+                    n_calls,
+                    sum_ttft,
+                    sum_total,
+                ) in self.latencies.items()
+                if n_calls
+            }
+
+        return {"routes": routes, "models": models}
@@ -12,3 +12,39 @@ Your task is to analyze the data provided as part of the message history.
 Base your answers strictly on the question, the provided data 
 and prior messages in the conversation.
 If you don't find any data, reply asking to provide the data."""
+
+PROMPT_ANALYTICS_PLAN = """You are an AI assistant that translates a request on a dataset
+into a single operation on the data, to be executed with pandas.
+
+The data available:
+{data_description}
+
+Instructions:
+- your answer must be in JSON format with key: operation, and the other keys needed
+- operation can be: group_by, sort, filter, pivot, describe, top_n, none
+- use only the columns listed above, with the exact names
+- aggregation functions can be: sum, mean, min, max, count, median, nunique
+- filter operators can be: ==, !=, >, >=, <, <=, contains, in
+- for pivot, group_by contains the rows and pivot_columns the column whose values become columns
+- for top_n, provide sort_by and limit
+- if the request can't be satisfied with a single operation on these data
+  (for example: a textual summary, an explanation, the code for a plot), the operation must be: none
+- provide only the JSON result. Don't add other comments.
+
+===Request
+{request}
+"""
+
+PROMPT_SUMMARIZE_HISTORY = """You are an AI assistant that compacts the history of a conversation
+between a user and an AI assistant on data from a database.
+
+Summarize the messages below in a short text that keeps:
+- the questions of the user and the conclusions reached
+- the names of tables, columns, filters and the key numbers mentioned
+- what the user is still working on
+If the messages start with a previous summary, merge it in the new one.
+Provide only the summary. Don't add other comments.
+
+===Messages
+{messages}
+"""
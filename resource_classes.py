@@ -0,0 +1,192 @@
+"""
+File name: resource_classes.py
+Author: Luigi Saetta
+Date last modified: 2026-10-19
+Python Version: 3.11
+
+Description:
+    The classes of resources used by the handlers (LLM, DB, local).
+    Every class has a limit on the handlers running (global and per route),
+    a priority queue for the handlers waiting and its own threads
+    for the blocking work (e.g. the DB calls), so that a class
+    saturated doesn't slow down the others.
+
+Inspired by:
+
+Usage:
+    Import this module into other scripts to use its functions.
+    Example:
+        db = ResourceClass(RESOURCE_DB, max_concurrent=16, max_workers=16)
+        await db.acquire("generate_sql", priority=10, timeout=60)
+        rows = await db.run_blocking(execute_sql, sql)
+        db.release("generate_sql")
+
+License:
+    This code is released under the MIT License.
+
+Notes:
+    This is a part of a set of demos showing how to build a SQL Agent
+    for Text2SQL tasks
+
+Warnings:
+    This module is in development, may change in future versions.
+"""
+
+import asyncio
+import bisect
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from time import monotonic
+from typing import Dict, Optional
+
+# resource classes
+RESOURCE_LLM = "llm"
+RESOURCE_DB = "db"
+# no external resources: never waits
+RESOURCE_LOCAL = "local"
+
+
+class ResourceClass:
+    """
+    A class of resources used by the handlers: a limit on the handlers
+    running (global for the class and per route), a priority queue
+    for the waiting ones and a thread pool for the blocking work
+    """
+
+    def __init__(
+        self, name: str, max_concurrent: Optional[int] = None, max_workers: int = 0
+    ):
+        """
+        max_concurrent: max n. of handlers running, None for no limit
+        max_workers: threads for the blocking work (0 to use the default executor)
+        """
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_workers = max_workers
+        self.executor = None
+
+        # route -> max n. of handlers of the route running
+        self.route_caps: Dict[str, Optional[int]] = {}
+
+        self.n_active = 0
+        # route -> n. of handlers running
+        self.active_by_route: Dict[str, int] = {}
+        # sorted by (priority, arrival): (priority, seq, route, future)
+        self.waiters = []
+        self._seq = itertools.count()
+
+        # stats
+        self.n_started = 0
+        self.n_queued = 0
+        self.max_queue_depth = 0
+        self.total_wait_time = 0.0
+
+    def add_route(self, route: str, max_concurrent: Optional[int] = None):
+        """
+        a route whose handler uses the class
+        """
+        self.route_caps[route] = max_concurrent
+        self.active_by_route.setdefault(route, 0)
+
+    def _has_capacity(self, route: str) -> bool:
+        if self.max_concurrent is not None and self.n_active >= self.max_concurrent:
+            return False
+
+        cap = self.route_caps.get(route)
+        return cap is None or self.active_by_route.get(route, 0) < cap
+
+    def _start(self, route: str):
+        self.n_active += 1
+        self.active_by_route[route] = self.active_by_route.get(route, 0) + 1
+        self.n_started += 1
+
+    async def acquire(self, route: str, priority: int, timeout: Optional[float]):
+        """
+        wait until the handler of the route can run
+
+        Raises:
+            TimeoutError if it can't start within timeout (sec.)
+        """
+        # the waiting handlers, if any, are blocked by the cap of their route
+        # (the others are started as soon as there is capacity, see release)
+        if self._has_capacity(route):
+            self._start(route)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = (priority, next(self._seq), route, future)
+        bisect.insort(self.waiters, waiter, key=lambda w: w[:2])
+        self.n_queued += 1
+        self.max_queue_depth = max(self.max_queue_depth, len(self.waiters))
+
+        time_start = monotonic()
+        try:
+            await asyncio.wait_for(future, timeout=timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            if future.done() and not future.cancelled():
+                # started in the meantime: the slot is passed on
+                self.release(route)
+            raise
+        finally:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+            self.total_wait_time += monotonic() - time_start
+
+    def release(self, route: str):
+        """
+        the handler of the route has ended: start the waiting ones, by priority
+        """
+        self.n_active -= 1
+        self.active_by_route[route] -= 1
+
+        for waiter in list(self.waiters):
+            if self.max_concurrent is not None and self.n_active >= self.max_concurrent:
+                break
+
+            _, _, waiting_route, future = waiter
+            if future.done() or not self._has_capacity(waiting_route):
+                continue
+
+            self.waiters.remove(waiter)
+            self._start(waiting_route)
+            future.set_result(None)
+
+    async def run_blocking(self, func, *args, **kwargs):
+        """
+        run blocking work (e.g. DB calls) in the threads of the class,
+        without blocking the event loop
+        """
+        if self.max_workers > 0 and self.executor is None:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix=f"{self.name}-"
+            )
+
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, partial(func, *args, **kwargs)
+        )
+
+    def close(self):
+        """
+        stop the threads of the class
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def get_stats(self):
+        """
+        returns the stats of the class
+        """
+        return {
+            "max_concurrent": self.max_concurrent,
+            "active": self.n_active,
+            "active_by_route": dict(self.active_by_route),
+            "queue_depth": len(self.waiters),
+            "max_queue_depth": self.max_queue_depth,
+            "n_started": self.n_started,
+            "n_queued": self.n_queued,
+            "avg_wait_time": (
+                round(self.total_wait_time / self.n_queued, 3) if self.n_queued else 0.0
+            ),
+        }
@@ -0,0 +1,215 @@
+"""
+File name: response_cache.py
+Author: Luigi Saetta
+Date last modified: 2026-10-19
+Python Version: 3.11
+
+Description:
+    A semantic cache of the answers given by the LLM for answer_directly
+    requests (general knowledge, not depending on our data).
+    The key is the embedding of the request plus a fingerprint of the
+    conversation history: an answer is reused for a similar request
+    (cosine similarity >= threshold) only with the same history
+    (in practice: in new conversations, or with the same previous messages).
+    Bounded in size (LRU), with TTL.
+
+Inspired by:
+
+Usage:
+    Import this module into other scripts to use its functions.
+    Example:
+        cache = SemanticResponseCache(llm_manager.get_embed_model())
+        fingerprint = history_fingerprint(messages)
+        answer, embedding = await cache.aget(request, fingerprint)
+
+Dependencies:
+    numpy
+
+License:
+    This code is released under the MIT License.
+
+Notes:
+    This is a part of a set of demos showing how to build a SQL Agent
+    for Text2SQL tasks
+
+Warnings:
+    This module is in development, may change in future versions.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from time import time
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.messages import BaseMessage
+
+from routing_cache import canonicalize
+
+
+def history_fingerprint(messages: List[BaseMessage]) -> str:
+    """
+    a short hash of the conversation history (empty string if no history)
+    """
+    if not messages:
+        return ""
+
+    sha = hashlib.sha1()
+    for msg in messages:
+        sha.update(f"{msg.type}:{msg.content}\n".encode("utf-8"))
+    return sha.hexdigest()
+
+
+def split_answer(answer: str, chunk_size: int = 20) -> List[str]:
+    """
+    split a cached answer in chunks (on word boundaries),
+    to replay it as a stream of tokens
+    """
+    chunks = []
+    current = ""
+    for word in answer.split(" "):
+        if current and len(current) + len(word) + 1 > chunk_size:
+            chunks.append(current + " ")
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class SemanticResponseCache:
+    """
+    Cache of the answers, with similarity search on the embeddings
+    of the requests
+
+    It is a singleton
+    """
+
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(
+        self,
+        embed_model=None,
+        threshold: float = 0.95,
+        ttl: float = 86400,
+        max_size: int = 1000,
+        enabled: bool = True,
+    ):
+        """
+        threshold: min cosine similarity to reuse an answer
+        ttl: time to live of an answer, in sec.
+        max_size: max n. of answers
+        enabled: if False, no answer is cached
+        """
+        # Only initialize attributes if they haven't been initialized yet
+        if not hasattr(self, "entries"):
+            self.embed_model = embed_model
+            self.threshold = threshold
+            self.ttl = ttl
+            self.max_size = max_size
+            self.enabled = enabled
+
+            # (fingerprint, canonicalized request) ->
+            #       (normalized embedding, answer, time of insertion)
+            self.entries = OrderedDict()
+            self.lock = threading.Lock()
+
+            # stats
+            self.n_hits = 0
+            self.n_misses = 0
+
+    def _lookup(self, fingerprint: str, embedding) -> Optional[str]:
+        """
+        the most similar request with the same history, if above threshold
+        """
+        now = time()
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / max(np.linalg.norm(query), 1e-12)
+
+        with self.lock:
+            # remove the expired answers
+            expired = [
+                key
+                for key, (_, _, created) in self.entries.items()
+                if now - created > self.ttl
+            ]
+            for key in expired:
+                del self.entries[key]
+
+            keys = [key for key in self.entries if key[0] == fingerprint]
+
+            if keys:
+                matrix = np.vstack([self.entries[key][0] for key in keys])
+                similarities = matrix @ query
+                best = int(np.argmax(similarities))
+
+                if similarities[best] >= self.threshold:
+                    self.entries.move_to_end(keys[best])
+                    self.n_hits += 1
+                    return self.entries[keys[best]][1]
+
+            self.n_misses += 1
+            return None
+
+    async def aget(self, request_text: str, fingerprint: str):
+        """
+        look for an answer to a similar request, with the same history
+
+        Returns:
+            (answer or None, embedding of the request, to be used in set)
+        """
+        if not self.enabled:
+            return None, None
+
+        embedding = await self.embed_model.aembed_query(canonicalize(request_text))
+
+        return self._lookup(fingerprint, embedding), embedding
+
+    def set(self, request_text: str, fingerprint: str, answer: str, embedding):
+        """
+        add the answer to the cache
+        """
+        if not self.enabled or embedding is None or not answer:
+            return
+
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector = vector / max(np.linalg.norm(vector), 1e-12)
+
+        with self.lock:
+            key = (fingerprint, canonicalize(request_text))
+            self.entries[key] = (vector, answer, time())
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        """
+        remove all the answers
+        """
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get_stats(self):
+        """
+        returns the stats of the cache
+        """
+        n_lookups = self.n_hits + self.n_misses
+
+        return {
+            "enabled": self.enabled,
+            "size": len(self.entries),
+            "n_hits": self.n_hits,
+            "n_misses": self.n_misses,
+            "hit_rate": round(self.n_hits / n_lookups, 3) if n_lookups else 0.0,
+        }
@@ -0,0 +1,381 @@
+"""
+File name: result_encoders.py
+Author: Luigi Saetta
+Date last modified: 2026-10-19
+Python Version: 3.11
+
+Description:
+    Encoders to stream the rows returned by a query in
+    machine-readable formats: NDJSON, CSV and Arrow IPC (stream format).
+    Rows are encoded batch by batch, as they are fetched from the DB.
+    For Arrow the schema comes from the types of the columns in the DB.
+
+Inspired by:
+
+Usage:
+    Import this module into other scripts to use its functions.
+    Example:
+        encoder = get_encoder("ndjson")
+        yield encoder.begin(columns)
+        for batch in batches:
+            yield encoder.encode_batch(batch)
+        yield encoder.end()
+
+Dependencies:
+    pyarrow (optional, only for the Arrow format)
+
+License:
+    This code is released under the MIT License.
+
+Notes:
+    This is a part of a set of demos showing how to build a SQL Agent
+    for Text2SQL tasks
+
+Warnings:
+    This module is in development, may change in future versions.
+"""
+
+import csv
+import io
+import json
+from abc import ABC, abstractmethod
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# names of the supported formats
+FORMAT_MARKDOWN = "markdown"
+FORMAT_NDJSON = "ndjson"
+FORMAT_CSV = "csv"
+FORMAT_ARROW = "arrow"
+
+# media types
+MEDIA_TYPES = {
+    FORMAT_MARKDOWN: "text/plain",
+    FORMAT_NDJSON: "application/x-ndjson",
+    FORMAT_CSV: "text/csv",
+    FORMAT_ARROW: "application/vnd.apache.arrow.stream",
+}
+
+# other media types accepted in the Accept header
+MEDIA_TYPE_ALIASES = {
+    "application/jsonl": FORMAT_NDJSON,
+    "application/json-lines": FORMAT_NDJSON,
+    "application/vnd.apache.arrow.file": FORMAT_ARROW,
+    # the rows, one JSON object per line
+    "application/json": FORMAT_NDJSON,
+    "text/markdown": FORMAT_MARKDOWN,
+}
+
+
+def to_json_value(value):
+    """
+    convert values returned from the DB that json can't handle
+    """
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+class ResultEncoder(ABC):
+    """
+    Base class for the encoders
+
+    begin() is called once with the column names (and their types in the DB,
+    if known), then encode_batch() for every batch of rows (list of dict),
+    and end() at the end.
+    Every method returns the bytes to send to the client.
+    """
+
+    format_name = None
+
+    def __init__(self):
+        self.columns = []
+        # column -> type in the DB (see SQLAgent.execute_sql_batches)
+        self.column_types = {}
+
+    @property
+    def media_type(self) -> str:
+        """
+        the media type of the encoded stream
+        """
+        return MEDIA_TYPES[self.format_name]
+
+    def begin(
+        self, columns: List[str], column_types: Optional[Dict[str, str]] = None
+    ) -> bytes:
+        """
+        start the stream
+        """
+        self.columns = list(columns)
+        self.column_types = dict(column_types or {})
+        return b""
+
+    @abstractmethod
+    def encode_batch(self, rows: List[dict]) -> bytes:
+        """
+        encode a batch of rows
+        """
+
+    def end(self) -> bytes:
+        """
+        close the stream
+        """
+        return b""
+
+
+class NDJSONEncoder(ResultEncoder):
+    """
+    One JSON object per row, separated by newline
+    """
+
+    format_name = FORMAT_NDJSON
+
+    def encode_batch(self, rows: List[dict]) -> bytes:
+        lines = [
+            json.dumps(row, default=to_json_value, ensure_ascii=False) for row in rows
+        ]
+        if not lines:
+            return b""
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+class CSVEncoder(ResultEncoder):
+    """
+    CSV with a header row
+    """
+
+    format_name = FORMAT_CSV
+
+    def __init__(self):
+        super().__init__()
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+
+    def _drain(self) -> bytes:
+        """
+        get what has been written so far and reset the buffer
+        """
+        text = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return text.encode("utf-8")
+
+    def begin(
+        self, columns: List[str], column_types: Optional[Dict[str, str]] = None
+    ) -> bytes:
+        super().begin(columns, column_types)
+        self.writer.writerow(self.columns)
+        return self._drain()
+
+    def encode_batch(self, rows: List[dict]) -> bytes:
+        self.writer.writerows([row.get(col) for col in self.columns] for row in rows)
+        return self._drain()
+
+
+def _to_float(value):
+    return None if value is None else float(value)
+
+
+def _to_int(value):
+    return None if value is None else int(value)
+
+
+def _to_str(value):
+    if value is None or isinstance(value, str):
+        return value
+    return to_json_value(value)
+
+
+class ArrowIPCEncoder(ResultEncoder):
+    """
+    Arrow IPC stream format, one record batch for every batch of rows
+
+    The schema is built from the types of the columns in the DB.
+    Columns without a type are inferred from the first batch, widened
+    so that the next batches fit: numbers as float64, nulls as string.
+    Values are converted to the type of their column.
+    """
+
+    format_name = FORMAT_ARROW
+
+    def __init__(self):
+        if pa is None:
+            raise ImportError("pyarrow is required for the Arrow format.")
+        super().__init__()
+        self.sink = io.BytesIO()
+        self.writer = None
+        self.schema = None
+        # column -> function converting the values
+        self.converters = {}
+
+    def _drain(self) -> bytes:
+        data = self.sink.getvalue()
+        self.sink.seek(0)
+        self.sink.truncate()
+        return data
+
+    @staticmethod
+    def _db_type_to_arrow(type_name: str):
+        return {
+            "integer": pa.int64(),
+            "float": pa.float64(),
+            "timestamp": pa.timestamp("us"),
+            "binary": pa.binary(),
+            "boolean": pa.bool_(),
+        }.get(type_name, pa.string())
+
+    @staticmethod
+    def _widen(arrow_type):
+        """
+        a type for the values of the next batches too
+        """
+        if (
+            pa.types.is_integer(arrow_type)
+            or pa.types.is_floating(arrow_type)
+            or pa.types.is_decimal(arrow_type)
+        ):
+            return pa.float64()
+        if pa.types.is_null(arrow_type):
+            return pa.string()
+        return arrow_type
+
+    def _build_schema(self, rows: List[dict]):
+        fields = []
+        for col in self.columns:
+            if col in self.column_types:
+                arrow_type = self._db_type_to_arrow(self.column_types[col])
+            else:
+                values = pa.array([row.get(col) for row in rows], from_pandas=True)
+                arrow_type = self._widen(values.type)
+            fields.append(pa.field(col, arrow_type))
+
+            if pa.types.is_floating(arrow_type):
+                self.converters[col] = _to_float
+            elif pa.types.is_integer(arrow_type):
+                self.converters[col] = _to_int
+            elif pa.types.is_string(arrow_type):
+                self.converters[col] = _to_str
+
+        self.schema = pa.schema(fields)
+        self.writer = pa.ipc.new_stream(self.sink, self.schema)
+
+    def _to_batch(self, rows: List[dict]):
+        arrays = []
+        for field in self.schema:
+            values = [row.get(field.name) for row in rows]
+            converter = self.converters.get(field.name)
+            if converter is not None:
+                values = [converter(value) for value in values]
+            arrays.append(pa.array(values, type=field.type))
+        return pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+    def encode_batch(self, rows: List[dict]) -> bytes:
+        if not rows:
+            return b""
+
+        if self.writer is None:
+            if not self.columns:
+                self.columns = list(rows[0].keys())
+            self._build_schema(rows)
+
+        self.writer.write_batch(self._to_batch(rows))
+        return self._drain()
+
+    def end(self) -> bytes:
+        if self.writer is None:
+            # no rows: send a stream with the schema only
+            self._build_schema([])
+        self.writer.close()
+        return self._drain()
+
+
+ENCODERS = {
+    FORMAT_NDJSON: NDJSONEncoder,
+    FORMAT_CSV: CSVEncoder,
+    FORMAT_ARROW: ArrowIPCEncoder,
+}
+
+
+def get_supported_formats() -> List[str]:
+    """
+    return the list of formats that can be used
+    """
+    formats = [FORMAT_MARKDOWN, FORMAT_NDJSON, FORMAT_CSV]
+    if pa is not None:
+        formats.append(FORMAT_ARROW)
+    return formats
+
+
+def get_encoder(format_name: str) -> ResultEncoder:
+    """
+    return a new encoder for the format
+    """
+    if format_name not in ENCODERS:
+        raise ValueError(f"No encoder for format: {format_name}")
+    return ENCODERS[format_name]()
+
+
+def encode_rows(rows: List[dict], encoder: ResultEncoder, batch_size: int = 500):
+    """
+    Encode rows already in memory, batch by batch
+    """
+    yield encoder.begin(list(rows[0].keys()) if rows else [])
+    for start in range(0, len(rows), batch_size):
+        yield encoder.encode_batch(rows[start : start + batch_size])
+    yield encoder.end()
+
+
+def negotiate_format(
+    accept_header: Optional[str], requested: Optional[str] = None
+) -> Optional[str]:
+    """
+    Choose the output format.
+
+    The format in the request (if provided) has precedence on the Accept header.
+    Without both, or with a generic Accept, the format is markdown.
+
+    Returns None if no supported format is acceptable.
+    """
+    supported = get_supported_formats()
+
+    if requested:
+        requested = requested.strip().lower()
+        return requested if requested in supported else None
+
+    if not accept_header:
+        return FORMAT_MARKDOWN
+
+    # parse media types with their q value
+    candidates = []
+    for position, item in enumerate(accept_header.split(",")):
+        parts = [p.strip() for p in item.split(";")]
+        media_type = parts[0].lower()
+        quality = 1.0
+        for param in parts[1:]:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            candidates.append((-quality, position, media_type))
+
+    for _, _, media_type in sorted(candidates):
+        if media_type in ("*/*", "text/*"):
+            return FORMAT_MARKDOWN
+        for format_name, format_media_type in MEDIA_TYPES.items():
+            if media_type == format_media_type and format_name in supported:
+                return format_name
+        format_name = MEDIA_TYPE_ALIASES.get(media_type)
+        if format_name in supported:
+            return format_name
+
+    return None
@@ -0,0 +1,333 @@
+"""
+File name: result_summarizer.py
+Author: Luigi Saetta
+Date last modified: 2026-10-19
+Python Version: 3.11
+
+Description:
+    Summarize the rows returned by a query, to add them to the
+    conversation history within a token budget.
+    The summary contains:
+        * a header with the reference id of the full result, row count, columns
+        * per-column statistics (min/max/mean, distinct, top values), with NumPy
+        * a representative sample of the rows
+    If the whole result fits in the budget, all the rows are kept.
+
+    The full result is kept in the ResultStore, by reference id,
+    and can be retrieved with GET /results/{result_id} (api_main.py).
+
+Inspired by:
+
+Usage:
+    Import this module into other scripts to use its functions.
+    Example:
+        ref_id = result_store.add(rows)
+        text = summarize_result(request_text, rows, ref_id, token_budget=2000)
+
+Dependencies:
+    numpy
+
+License:
+    This code is released under the MIT License.
+
+Notes:
+    This is a part of a set of demos showing how to build a SQL Agent
+    for Text2SQL tasks
+
+Warnings:
+    This module is in development, may change in future versions.
+"""
+
+import threading
+import uuid
+from collections import OrderedDict
+from decimal import Decimal
+from typing import List, Optional
+
+import numpy as np
+
+from conversation_manager import DATA_MSG_PREFIX
+
+# rough estimate, good enough for the budget
+CHARS_PER_TOKEN = 4
+
+# n. of rows used to estimate the size of a result
+SIZE_SAMPLE_ROWS = 100
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    estimate the number of tokens in a text
+    """
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+class ResultStore:
+    """
+    Keep the full results of the last queries, by reference id,
+    so that they can be retrieved even if only a summary
+    is in the conversation history.
+
+    It is a singleton, bounded in n. of results and in size (estimated):
+    the oldest results are removed.
+    """
+
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self, max_size: int = 100, max_bytes: int = 200_000_000):
+        """
+        max_size: max n. of results
+        max_bytes: max size of all the results (estimated)
+        """
+        # Only initialize attributes if they haven't been initialized yet
+        if not hasattr(self, "results"):
+            # ref_id -> (rows, size), from the oldest
+            self.results = OrderedDict()
+            self.max_size = max_size
+            self.max_bytes = max_bytes
+            self.total_bytes = 0
+            self.lock = threading.Lock()
+
+            # stats
+            self.n_added = 0
+            self.n_too_large = 0
+            self.n_hits = 0
+            self.n_misses = 0
+
+    @staticmethod
+    def estimate_size(rows: List[dict]) -> int:
+        """
+        estimate the size (bytes) of the rows, from a sample
+        """
+        if not rows:
+            return 0
+
+        indexes = _sample_indexes(len(rows), SIZE_SAMPLE_ROWS)
+        sample_size = sum(len(str(rows[i])) for i in indexes)
+        return sample_size * len(rows) // len(indexes)
+
+    def add(self, rows: List[dict]) -> str:
+        """
+        store the rows, return the reference id
+
+        A result larger than max_bytes is not kept
+        (its reference id will not be found).
+        """
+        ref_id = uuid.uuid4().hex[:12]
+        size = self.estimate_size(rows)
+
+        with self.lock:
+            self.n_added += 1
+            if size > self.max_bytes:
+                self.n_too_large += 1
+                return ref_id
+
+            self.results[ref_id] = (rows, size)
+            self.total_bytes += size
+            while (
+                len(self.results) > self.max_size or self.total_bytes > self.max_bytes
+            ):
+                _, (_, removed_size) = self.results.popitem(last=False)
+                self.total_bytes -= removed_size
+        return ref_id
+
+    def get(self, ref_id: str) -> Optional[List[dict]]:
+        """
+        return the rows for the reference id, None if not (more) available
+        """
+        with self.lock:
+            entry = self.results.get(ref_id)
+            if entry is None:
+                self.n_misses += 1
+                return None
+            self.n_hits += 1
+            return entry[0]
+
+    def get_stats(self):
+        """
+        returns the stats of the store
+        """
+        with self.lock:
+            return {
+                "results": len(self.results),
+                "total_bytes": self.total_bytes,
+                "n_added": self.n_added,
+                "n_too_large": self.n_too_large,
+                "n_hits": self.n_hits,
+                "n_misses": self.n_misses,
+            }
+
+    def __len__(self):
+        return len(self.results)
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float, Decimal)) and not isinstance(value, bool)
+
+
+def _format_value(value) -> str:
+    if isinstance(value, float):
+        return f"{value:.6g}"
+    return str(value)
+
+
+def compute_column_stats(rows: List[dict], columns: List[str], top_n: int = 3):
+    """
+    compute statistics for every column of the result
+
+    Returns:
+        a list of dict, one for every column
+    """
+    stats = []
+
+    for col in columns:
+        values = [row.get(col) for row in rows]
+        not_null = [v for v in values if v is not None]
+        col_stats = {"name": col, "nulls": len(values) - len(not_null)}
+
+        if not not_null:
+            col_stats["type"] = "empty"
+            stats.append(col_stats)
+            continue
+
+        if all(_is_number(v) for v in not_null):
+            arr = np.asarray(not_null, dtype=np.float64)
+            col_stats["type"] = "number"
+            col_stats["min"] = float(arr.min())
+            col_stats["max"] = float(arr.max())
+            col_stats["mean"] = float(arr.mean())
+            uniques, counts = np.unique(arr, return_counts=True)
+        else:
+            arr = np.asarray([str(v) for v in not_null])
+            col_stats["type"] = "text"
+            uniques, counts = np.unique(arr, return_counts=True)
+            col_stats["min"] = str(uniques[0])
+            col_stats["max"] = str(uniques[-1])
+
+        col_stats["distinct"] = int(len(uniques))
+
+        # top values, only if there are repetitions
+        if len(uniques) < len(arr):
+            order = np.argsort(-counts, kind="stable")[:top_n]
+            col_stats["top"] = [
+                (uniques[i].item(), int(counts[i])) for i in order if counts[i] > 1
+            ]
+        stats.append(col_stats)
+
+    return stats
+
+
+def _format_stats(stats) -> str:
+    lines = []
+    for col in stats:
+        if col["type"] == "empty":
+            lines.append(f"- {col['name']}: all null")
+            continue
+
+        text = (
+            f"- {col['name']} ({col['type']}): "
+            f"min={_format_value(col['min'])}, max={_format_value(col['max'])}"
+        )
+        if "mean" in col:
+            text += f", mean={_format_value(col['mean'])}"
+        text += f", distinct={col['distinct']}"
+        if col["nulls"]:
+            text += f", nulls={col['nulls']}"
+        if col.get("top"):
+            top = ", ".join(f"{_format_value(v)} ({c})" for v, c in col["top"])
+            text += f", top: {top}"
+        lines.append(text)
+    return "\n".join(lines)
+
+
+def _sample_indexes(n_rows: int, n_sample: int):
+    """
+    indexes of n_sample rows, evenly spaced (first and last included)
+    """
+    if n_sample >= n_rows:
+        return list(range(n_rows))
+    if n_sample <= 1:
+        return [0]
+    return np.unique(np.linspace(0, n_rows - 1, n_sample).astype(int)).tolist()
+
+
+def summarize_result(
+    request_text: str,
+    rows: List[dict],
+    ref_id: Optional[str],
+    token_budget: int = 2000,
+    max_sample_rows: int = 50,
+    top_n: int = 3,
+    n_rows: Optional[int] = None,
+) -> str:
+    """
+    Build the text describing the result, to be added to the history,
+    within token_budget tokens (approx.)
+
+    If all the rows fit in the budget, no stats are computed
+    and all rows are included.
+
+    ref_id: the id in the result store, None if the result is not kept
+    n_rows: the n. of rows of the result, if rows are only the first ones
+        (stats and sample are computed on them)
+    """
+    n_kept = len(rows)
+    if n_rows is None:
+        n_rows = n_kept
+    header = f"{DATA_MSG_PREFIX}: {request_text}:\n"
+
+    # check if all the rows fit, stopping as soon as the budget is exceeded
+    max_chars = token_budget * CHARS_PER_TOKEN - len(header)
+    rows_as_str = []
+    n_chars = 0
+    for row in rows:
+        row_str = str(row)
+        n_chars += len(row_str) + 1
+        if n_chars > max_chars:
+            break
+        rows_as_str.append(row_str)
+    else:
+        if n_kept == n_rows:
+            # small result, no need to summarize
+            return header + "\n".join(rows_as_str)
+
+    columns = list(rows[0].keys())
+    stats_on = "all the rows" if n_kept == n_rows else f"the first {n_kept} rows"
+    header += (
+        f"(result_id: {ref_id or 'not kept'}, rows: {n_rows}, "
+        f"columns: {', '.join(columns)})\n"
+        f"Column statistics (on {stats_on}):\n"
+        f"{_format_stats(compute_column_stats(rows, columns, top_n))}\n"
+    )
+
+    # the sample, with the budget left
+    budget_left = token_budget - estimate_tokens(header)
+    candidates = _sample_indexes(n_kept, max_sample_rows)
+
+    if candidates and budget_left > 0:
+        avg_tokens = np.mean([estimate_tokens(str(rows[i])) for i in candidates])
+        n_sample = int(min(len(candidates), budget_left // max(avg_tokens, 1)))
+        candidates = _sample_indexes(n_kept, n_sample) if n_sample > 0 else []
+    else:
+        candidates = []
+
+    sample_lines = []
+    used = 0
+    for i in candidates:
+        row_str = str(rows[i])
+        row_tokens = estimate_tokens(row_str)
+        if used + row_tokens > budget_left:
+            break
+        sample_lines.append(row_str)
+        used += row_tokens
+
+    return (
+        header
+        + f"Sample rows ({len(sample_lines)} of {n_rows}):\n"
+        + "\n".join(sample_lines)
+    )
@@ -1,7 +1,7 @@
 """
 File name: router.py
 Author: Luigi Saetta
-Date last modified: 2024-11-16
+Date last modified: 2026-10-19
 Python Version: 3.11
 
 Description:
@@ -28,9 +28,14 @@ Warnings:
     This module is in development, may change in future versions.
 """
 
+import threading
+from typing import Optional
+
 from langchain_core.prompts import PromptTemplate
 
 from llm_manager import LLMManager
+from knn_router import KNNRoutingClassifier, may_be_not_allowed
+from routing_cache import RoutingCache, RoutingContext
 from prompt_routing import ALLOWED_VALUES, generate_prompt_routing
 from prompt_routing import AllowedValues
 
@@ -60,16 +65,40 @@ class Router:
     what is the type of user request
     """
 
-    def __init__(self, config, llm_manager: LLMManager):
+    def __init__(
+        self,
+        config,
+        llm_manager: LLMManager,
+        knn_classifier: Optional[KNNRoutingClassifier] = None,
+        routing_cache: Optional[RoutingCache] = None,
+    ):
         """
         Initialize the Router class.
 
         Args:
             llm_manager (LLMManager): Manager for handling LLM models.
+            knn_classifier (KNNRoutingClassifier): if provided, used before
+                the LLM; the LLM is called only if the kNN is not confident.
+            routing_cache (RoutingCache): if provided, cache of the
+                classifications, checked first.
         """
         self.llm_manager = llm_manager
         self.config = config
         self.logger = get_console_logger()
+        self.knn_classifier = knn_classifier
+        self.routing_cache = routing_cache
+
+        # stats
+        self.n_requests = 0
+        self.n_llm_calls = 0
+
+        # the prompt doesn't change, built once
+        self.classify_prompt = PromptTemplate.from_template(generate_prompt_routing())
+
+        # the chains are built on first use and then reused
+        # id of the LLM client (one for every endpoint) -> (client, chain)
+        self._classification_chains = {}
+        self._chain_lock = threading.Lock()
 
     def _is_request_valid(self, request):
         """
@@ -83,62 +112,243 @@ class Router:
 
     def _get_classification_chain(self):
         """
-        create the chain
+        return the chain for the LLM client, built only once
+
+        The LLM manager can return a different client (endpoint) on every call;
+        a chain is re-built only if the client has changed
+        (for example, after llm_manager.reset_clients())
         """
-        prompt_routing = generate_prompt_routing()
+        llm = self.llm_manager.get_llm_model(
+            self.config.find_key("index_model_for_routing")
+        )
 
-        classify_prompt = PromptTemplate.from_template(prompt_routing)
+        entry = self._classification_chains.get(id(llm))
+        if entry is None or entry[0] is not llm:
+            with self._chain_lock:
+                entry = self._classification_chains.get(id(llm))
+                if entry is None or entry[0] is not llm:
+                    llm_c = llm.with_structured_output(json_schema)
 
-        llm_c = self.llm_manager.get_llm_model(
-            self.config.find_key("index_model_for_routing")
-        ).with_structured_output(json_schema)
+                    entry = (llm, self.classify_prompt | llm_c)
+                    self._classification_chains[id(llm)] = entry
+
+        return entry[1]
+
+    def _check_classification(self, result) -> str:
+        """
+        get the classification from the output of the chain,
+        and check that the value is in enum
+        """
+        if result is None:
+            # error in the call to the LLM, already logged
+            return AllowedValues.NOT_DEFINED.value
+
+        try:
+            classification_value = result["classification"]
+        except (KeyError, TypeError) as e:
+            self.logger.error(
+                "KeyError in Router:classify: Missing key in result: %s", e
+            )
+            classification_value = None
+
+        if classification_value not in ALLOWED_VALUES:
+            self.logger.warning(
+                "Classification value not in allowed values: %s", classification_value
+            )
+            return AllowedValues.NOT_DEFINED.value
 
-        return classify_prompt | llm_c
+        return classification_value
 
-    def classify(self, user_request: str) -> str:
+    def _get_from_cache(self, cache_key):
+        """
+        returns the classification from the cache, None if not found
+        """
+        if self.routing_cache is None:
+            return None
+
+        classification = self.routing_cache.get(cache_key)
+
+        if classification is not None and self.config.find_key("verbose"):
+            self.logger.info("Router, from cache: %s", classification)
+        return classification
+
+    def _add_to_cache(self, cache_key, classification: str):
+        """
+        not_defined is not cached: it can be due to an error
+        """
+        if (
+            self.routing_cache is not None
+            and classification != AllowedValues.NOT_DEFINED.value
+        ):
+            self.routing_cache.set(cache_key, classification)
+
+    def classify(
+        self, user_request: str, context: Optional[RoutingContext] = None
+    ) -> str:
         """
         classify in one of this categories:
             generate_sql
             analyze_text
             ...
             defined in AllowedValues in prompt_routing
+
+        context: state of the conversation, part of the key of the cache
         """
-        verbose = bool(self.config.find_key("verbose"))
+        verbose = self.config.find_key("verbose")
 
         if not self._is_request_valid(user_request):
             return AllowedValues.NOT_DEFINED.value
 
-        # the chain
-        classification_chain = self._get_classification_chain()
+        self.n_requests += 1
+
+        cache_key = RoutingCache.make_key(user_request, context)
+        classification = self._get_from_cache(cache_key)
+        if classification is not None:
+            return classification
+
+        classification = self._classify_no_cache(user_request, verbose)
+        self._add_to_cache(cache_key, classification)
+
+        return classification
+
+    def _classify_no_cache(self, user_request: str, verbose: bool) -> str:
+        """
+        classify with kNN (if available) and the LLM
+        """
+        prediction = None
+        # DDL/DML requests are always checked by the LLM
+        if self.knn_classifier is not None and not may_be_not_allowed(user_request):
+            try:
+                prediction = self.knn_classifier.predict(user_request)
+            except Exception as e:
+                self.logger.error("Error in kNN classifier: %s", e)
+
+        if prediction is not None and prediction.label is not None:
+            if verbose:
+                self.logger.info("Router:classify, kNN: %s", prediction.label)
+            return prediction.label
 
         try:
             if verbose:
                 self.logger.info("Request: %s", user_request)
 
             # invoke the LLM, output is a dict
-            result = classification_chain.invoke({"question": user_request})
+            self.n_llm_calls += 1
+            result = self._get_classification_chain().invoke({"question": user_request})
 
             if verbose:
                 self.logger.info("Router:classify, JSON: %s", result)
-
-            classification_value = result["classification"]
-        except KeyError as e:
-            self.logger.error(
-                "KeyError in Router:classify: Missing key in result: %s", e
-            )
-            classification_value = None
         except Exception as e:
             self.logger.error("Unexpected error in Router:classify %s", e)
-            classification_value = None
+            result = None
 
-        # check that the value is in enum
-        if classification_value not in ALLOWED_VALUES:
-            self.logger.warning(
-                "Classification value not in allowed values: %s", classification_value
-            )
+        classification = self._check_classification(result)
+        self._learn(user_request, classification, prediction)
+
+        return classification
+
+    async def aclassify(
+        self, user_request: str, context: Optional[RoutingContext] = None
+    ) -> str:
+        """
+        async version of classify: the call to the LLM
+        doesn't block the event loop
+        """
+        verbose = self.config.find_key("verbose")
+
+        if not self._is_request_valid(user_request):
             return AllowedValues.NOT_DEFINED.value
 
-        return classification_value
+        self.n_requests += 1
+
+        cache_key = RoutingCache.make_key(user_request, context)
+        classification = self._get_from_cache(cache_key)
+        if classification is not None:
+            return classification
+
+        classification = await self._aclassify_no_cache(user_request, verbose)
+        self._add_to_cache(cache_key, classification)
+
+        return classification
+
+    async def _aclassify_no_cache(self, user_request: str, verbose: bool) -> str:
+        """
+        async version of _classify_no_cache
+        """
+        prediction = None
+        # DDL/DML requests are always checked by the LLM
+        if self.knn_classifier is not None and not may_be_not_allowed(user_request):
+            try:
+                prediction = await self.knn_classifier.apredict(user_request)
+            except Exception as e:
+                self.logger.error("Error in kNN classifier: %s", e)
+
+        if prediction is not None and prediction.label is not None:
+            if verbose:
+                self.logger.info("Router:aclassify, kNN: %s", prediction.label)
+            return prediction.label
+
+        try:
+            if verbose:
+                self.logger.info("Request: %s", user_request)
+
+            # invoke the LLM, output is a dict
+            self.n_llm_calls += 1
+            result = await self._get_classification_chain().ainvoke(
+                {"question": user_request}
+            )
+
+            if verbose:
+                self.logger.info("Router:aclassify, JSON: %s", result)
+        except Exception as e:
+            self.logger.error("Unexpected error in Router:aclassify %s", e)
+            result = None
+
+        classification = self._check_classification(result)
+        self._learn(user_request, classification, prediction)
+
+        return classification
+
+    def _learn(self, user_request: str, classification: str, prediction):
+        """
+        add the classification made by the LLM to the kNN examples,
+        only if confirmed: the LLM agrees with the best label of the kNN
+        (not confident), so that a misroute doesn't reinforce itself.
+        not_allowed and not_defined are never learned (always the LLM)
+        """
+        if (
+            self.knn_classifier is None
+            or prediction is None
+            or prediction.candidate != classification
+            or classification
+            in (AllowedValues.NOT_DEFINED.value, AllowedValues.NOT_ALLOWED.value)
+            or not self.config.find_key("knn_learn_online")
+        ):
+            return
+
+        self.knn_classifier.add_example(
+            user_request, classification, prediction.embedding
+        )
+
+    def get_stats(self):
+        """
+        returns the routing stats, with the fraction of
+        requests classified without calling the LLM
+        """
+        n_without_llm = self.n_requests - self.n_llm_calls
+
+        stats = {
+            "n_requests": self.n_requests,
+            "n_llm_calls": self.n_llm_calls,
+            "fraction_without_llm": (
+                round(n_without_llm / self.n_requests, 3) if self.n_requests else 0.0
+            ),
+        }
+        if self.knn_classifier is not None:
+            stats["knn"] = self.knn_classifier.get_stats()
+        if self.routing_cache is not None:
+            stats["cache"] = self.routing_cache.get_stats()
+        return stats
 
     def get_classification_list(self):
         """
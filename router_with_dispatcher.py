@@ -1,7 +1,7 @@
 """
 File name: router_with_disptacher.py
 Author: Luigi Saetta
-Date last modified: 2024-11-29
+Date last modified: 2026-10-19
 Python Version: 3.11
 
 Description:
@@ -27,11 +27,19 @@ Warnings:
     This module is in development, may change in future versions.
 """
 
-from typing import Any
+import asyncio
+import threading
+from time import time
+from typing import Any, Optional
 from dispatcher import Dispatcher
+from handlers import prefetch_sql
 from llm_manager import LLMManager
 from router import Router
+from knn_router import KNNRoutingClassifier
+from conversation_manager import ConversationManager
+from routing_cache import RoutingCache, RoutingContext
 from prompt_routing import AllowedValues
+from chat_events import classification_event, progress_event
 
 
 class RouterWithDispatcher(Router):
@@ -39,9 +47,164 @@ class RouterWithDispatcher(Router):
     Extension of the router to use the dispatcher
     """
 
-    def __init__(self, config, llm_manager: LLMManager, dispatcher: Dispatcher):
-        super().__init__(config, llm_manager)
+    def __init__(
+        self,
+        config,
+        llm_manager: LLMManager,
+        dispatcher: Dispatcher,
+        knn_classifier: Optional[KNNRoutingClassifier] = None,
+        conversation_manager: Optional[ConversationManager] = None,
+        routing_cache: Optional[RoutingCache] = None,
+    ):
+        super().__init__(config, llm_manager, knn_classifier, routing_cache)
         self.dispatcher = dispatcher
+        # to get the state of the conversation (for the routing cache)
+        self.conversation_manager = conversation_manager
+
+        # stats of the speculative mode
+        self.n_speculations = 0
+        self.n_speculations_used = 0
+        self.n_speculations_cancelled = 0
+        # sec. of speculative work overlapped with the classification (used)
+        self.speculation_saved_time = 0.0
+        # sec. of speculative work thrown away (cancelled), until its real end
+        self.speculation_wasted_time = 0.0
+        # the work ends in a thread
+        self._speculation_lock = threading.Lock()
+
+    async def _aget_context(self, conv_id: str) -> Optional[RoutingContext]:
+        """
+        the state of the conversation that can change the classification
+        """
+        if self.conversation_manager is None:
+            return None
+
+        return RoutingContext(
+            has_data=await self.conversation_manager.ahas_data(conv_id),
+            last_classification=self.conversation_manager.get_last_classification(
+                conv_id
+            ),
+        )
+
+    async def _classify_in_conversation(self, user_request: Any) -> str:
+        """
+        classify, using (and then updating) the state of the conversation
+        """
+        conv_id = user_request.conv_id
+
+        classification = await self.aclassify(
+            user_request.request_text, await self._aget_context(conv_id)
+        )
+
+        if (
+            self.conversation_manager is not None
+            and classification != AllowedValues.NOT_DEFINED.value
+        ):
+            self.conversation_manager.set_last_classification(conv_id, classification)
+
+        return classification
+
+    def _prefetch(
+        self,
+        request_text: str,
+        generate: bool,
+        cancel_event: threading.Event,
+        speculation: dict,
+    ):
+        """
+        the speculative work for generate_sql (in a thread of the db class),
+        recording when it really ends
+        """
+        try:
+            return prefetch_sql(request_text, generate, cancel_event)
+        finally:
+            with self._speculation_lock:
+                speculation["time_end"] = time()
+                if speculation["wasted"]:
+                    self.speculation_wasted_time += (
+                        speculation["time_end"] - speculation["time_start"]
+                    )
+
+    def _waste(self, speculation: dict):
+        """
+        the speculative work is not needed: its time is wasted,
+        until it ends (a generation already started can't be interrupted)
+        """
+        with self._speculation_lock:
+            speculation["wasted"] = True
+            if speculation["time_end"] is not None:
+                self.speculation_wasted_time += (
+                    speculation["time_end"] - speculation["time_start"]
+                )
+
+    async def _classify_with_speculation(self, user_request: Any):
+        """
+        Classify the request. In speculative mode, the work for generate_sql
+        (SQL cache lookup and, optionally, generation) runs concurrently
+        with the classification and is cancelled if not needed.
+
+        Returns:
+            (classification, args for the handler)
+        """
+        if not self.config.find_key("speculative_enable"):
+            return await self._classify_in_conversation(user_request), {}
+
+        self.n_speculations += 1
+        cancel_event = threading.Event()
+        # time_end: when the thread ends (None if not started or running)
+        speculation = {"time_start": time(), "time_end": None, "wasted": False}
+
+        # in the db class: it counts against max_concurrent_db
+        spec_task = asyncio.create_task(
+            self.dispatcher.run_speculative(
+                self._prefetch,
+                user_request.request_text,
+                self.config.find_key("speculative_generate_sql"),
+                cancel_event,
+                speculation,
+            )
+        )
+
+        try:
+            classification = await self._classify_in_conversation(user_request)
+        except BaseException:
+            cancel_event.set()
+            spec_task.cancel()
+            self._waste(speculation)
+            raise
+        time_classified = time()
+
+        if classification != AllowedValues.GENERATE_SQL.value:
+            # not needed: stop it (no new generation is started, and if
+            # still waiting for the db class it doesn't start)
+            cancel_event.set()
+            if spec_task.done():
+                if not spec_task.cancelled():
+                    spec_task.exception()
+            else:
+                spec_task.cancel()
+
+            self.n_speculations_cancelled += 1
+            self._waste(speculation)
+            return classification, {}
+
+        try:
+            prefetch = await spec_task
+        except Exception as e:
+            self.logger.error("Error in speculative SQL prefetch: %s", e)
+            return classification, {}
+
+        # the part of the work done while classifying
+        saved = (
+            min(speculation["time_end"], time_classified) - speculation["time_start"]
+        )
+        self.n_speculations_used += 1
+        self.speculation_saved_time += saved
+
+        if self.config.find_key("verbose"):
+            self.logger.info("Speculative prefetch, saved: %.3f sec.", saved)
+
+        return classification, {"prefetch": prefetch}
 
     async def route_request(self, user_request: Any):
         """
@@ -51,11 +214,68 @@ class RouterWithDispatcher(Router):
             user_request (str): User's input request.
 
         Returns:
-            Stream: Streaming response from the dispatcher.
+            Stream: stream of ChatEvent, starting with the classification.
         """
-        classification = self.classify(user_request.request_text)
+        classification, handler_args = await self._classify_with_speculation(
+            user_request
+        )
 
         if classification == AllowedValues.NOT_DEFINED.value:
-            return "Unable to classify the request."
+            handler_events = None
+        else:
+            handler_events = await self.dispatcher.dispatch(
+                classification, user_request, **handler_args
+            )
+
+        return self._stream_events(classification, handler_events)
+
+    async def route_data_request(self, user_request: Any):
+        """
+        Route the user request, for clients asking only data
+        in a machine-readable format.
+
+        Args:
+            user_request (str): User's input request.
+
+        Returns:
+            Stream: stream of ChatEvent, or None if the request
+            doesn't produce data.
+        """
+        classification, handler_args = await self._classify_with_speculation(
+            user_request
+        )
+
+        if classification not in self.dispatcher.get_data_values():
+            return None
+
+        return await self.dispatcher.dispatch(
+            classification, user_request, **handler_args
+        )
+
+    def get_stats(self):
+        """
+        the routing stats, with the latency saved and wasted
+        by the speculative mode
+        """
+        stats = super().get_stats()
+        stats["speculation"] = {
+            "n_speculations": self.n_speculations,
+            "n_used": self.n_speculations_used,
+            "n_cancelled": self.n_speculations_cancelled,
+            "saved_time": round(self.speculation_saved_time, 3),
+            "wasted_time": round(self.speculation_wasted_time, 3),
+        }
+        return stats
+
+    async def _stream_events(self, classification: str, handler_events):
+        """
+        Send the classification, then the events from the handler
+        """
+        yield classification_event(classification)
+
+        if handler_events is None:
+            yield progress_event("Unable to classify the request.")
+            return
 
-        return await self.dispatcher.dispatch(classification, user_request)
+        async for event in handler_events:
+            yield event
@@ -0,0 +1,164 @@
+"""
+File name: routing_cache.py
+Author: Luigi Saetta
+Date last modified: 2026-10-19
+Python Version: 3.11
+
+Description:
+    A bounded LRU cache, with TTL, of the classifications made by the Router.
+    The key is the canonicalized request text plus a small fingerprint of the
+    conversation: if it already holds data and the last classification.
+    (follow-ups like "Ok, create a summary" depend on them)
+
+Inspired by:
+
+Usage:
+    Import this module into other scripts to use its functions.
+    Example:
+        key = routing_cache.make_key(request, RoutingContext(has_data, last_class))
+        classification = routing_cache.get(key)
+
+License:
+    This code is released under the MIT License.
+
+Notes:
+    This is a part of a set of demos showing how to build a SQL Agent
+    for Text2SQL tasks
+
+Warnings:
+    This module is in development, may change in future versions.
+"""
+
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from time import time
+from typing import NamedTuple, Optional
+
+WHITESPACE = re.compile(r"\s+")
+
+
+def canonicalize(text: str) -> str:
+    """
+    normalize the text of the request: unicode, case, blanks
+    and punctuation at the end
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = WHITESPACE.sub(" ", text).strip()
+    return text.rstrip(" .!?;")
+
+
+class RoutingContext(NamedTuple):
+    """
+    The part of the conversation state that can change the classification
+    """
+
+    # the conversation already holds data retrieved from the DB
+    has_data: bool = False
+    # the last classification in the conversation
+    last_classification: Optional[str] = None
+
+
+class RoutingCache:
+    """
+    LRU cache, with TTL, of the results of the classification
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 3600, enabled: bool = True):
+        """
+        max_size: max n. of entries
+        ttl: time to live of an entry, in sec.
+        enabled: if False, get always returns None (for A/B runs)
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.enabled = enabled
+
+        # key -> (classification, time of insertion)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        # stats
+        self.n_hits = 0
+        self.n_misses = 0
+        # entries found, but expired
+        self.n_stale = 0
+
+    @staticmethod
+    def make_key(request_text: str, context: Optional[RoutingContext] = None):
+        """
+        the key: canonicalized text + context fingerprint
+        """
+        if context is None:
+            context = RoutingContext()
+
+        return (
+            canonicalize(request_text),
+            bool(context.has_data),
+            context.last_classification or "",
+        )
+
+    def get(self, key) -> Optional[str]:
+        """
+        returns the classification, None if not in cache (or expired)
+        """
+        if not self.enabled:
+            return None
+
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is None:
+                self.n_misses += 1
+                return None
+
+            classification, created = entry
+            if time() - created > self.ttl:
+                del self.entries[key]
+                self.n_stale += 1
+                self.n_misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.n_hits += 1
+            return classification
+
+    def set(self, key, classification: str):
+        """
+        add (or refresh) an entry
+        """
+        if not self.enabled:
+            return
+
+        with self.lock:
+            self.entries[key] = (classification, time())
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        """
+        remove all the entries
+        """
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get_stats(self):
+        """
+        returns the stats of the cache
+        """
+        n_lookups = self.n_hits + self.n_misses
+
+        return {
+            "enabled": self.enabled,
+            "size": len(self.entries),
+            "n_hits": self.n_hits,
+            "n_misses": self.n_misses,
+            "n_stale": self.n_stale,
+            "hit_rate": round(self.n_hits / n_lookups, 3) if n_lookups else 0.0,
+        }
@@ -7,6 +7,8 @@ A very good guide is this one:
     
 """
 
+import threading
+
 import oracledb
 
 # removed to simplify dependencies, for now
@@ -28,6 +30,96 @@ CONNECT_ARGS = {
 
 logger = get_console_logger()
 
+# types of the columns (see SQLAgent.execute_sql_batches), by Oracle type
+# the others are string
+ORACLE_COLUMN_TYPES = {
+    "DB_TYPE_BINARY_INTEGER": "integer",
+    "DB_TYPE_BINARY_FLOAT": "float",
+    "DB_TYPE_BINARY_DOUBLE": "float",
+    "DB_TYPE_DATE": "timestamp",
+    "DB_TYPE_TIMESTAMP": "timestamp",
+    "DB_TYPE_TIMESTAMP_TZ": "timestamp",
+    "DB_TYPE_TIMESTAMP_LTZ": "timestamp",
+    "DB_TYPE_RAW": "binary",
+    "DB_TYPE_LONG_RAW": "binary",
+    "DB_TYPE_BOOLEAN": "boolean",
+}
+# max precision of a NUMBER with scale 0 read as integer (int64)
+MAX_INTEGER_PRECISION = 18
+
+
+def get_column_types(description) -> dict:
+    """
+    the types of the columns, from cursor.description
+    """
+    column_types = {}
+
+    for name, type_code, _, _, precision, scale, _ in description:
+        type_name = getattr(type_code, "name", str(type_code))
+
+        if type_name == "DB_TYPE_NUMBER":
+            # a NUMBER without precision returns int and float values
+            is_integer = scale == 0 and 0 < (precision or 0) <= MAX_INTEGER_PRECISION
+            column_types[name] = "integer" if is_integer else "float"
+        else:
+            column_types[name] = ORACLE_COLUMN_TYPES.get(type_name, "string")
+    return column_types
+
+
+# the pool of DB connections, shared by all the agents (created on first use)
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(config: ConfigReader):
+    """
+    the pool of connections to the data DB, created on first use
+    with db_pool_min connections
+
+    When all the connections are in use, acquire waits at most
+    db_pool_wait_timeout sec., then fails (instead of waiting forever).
+    """
+    global _pool
+
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool_max = config.find_key("db_pool_max")
+                # the DB calls of the dispatcher, plus the ones outside it
+                # (warmup replay, readiness probe)
+                n_needed = (config.find_key("max_concurrent_db") or 0) + 2
+                if pool_max < n_needed:
+                    logger.warning(
+                        "db_pool_max (%d) is lower than max_concurrent_db + 2 (%d)",
+                        pool_max,
+                        n_needed,
+                    )
+
+                _pool = oracledb.create_pool(
+                    **CONNECT_ARGS,
+                    min=config.find_key("db_pool_min"),
+                    max=pool_max,
+                    increment=config.find_key("db_pool_increment"),
+                    getmode=oracledb.POOL_GETMODE_TIMEDWAIT,
+                    # in ms
+                    wait_timeout=int(config.find_key("db_pool_wait_timeout") * 1000),
+                )
+                logger.info("Created DB pool, %d connections", _pool.opened)
+    return _pool
+
+
+def close_pool():
+    """
+    close the pool of connections, if created
+    """
+    global _pool
+
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close(force=True)
+            _pool = None
+
+
 # to integrate with APM
 # TRACER = TracerSingleton.get_instance()
 
@@ -47,10 +139,27 @@ class SelectAISQLAgent(SQLAgent):
         """
         get a connection to data DB
         """
+        if self.config.find_key("db_pool_enable"):
+            # released to the pool when closed
+            return get_pool(self.config).acquire()
+
         conn = oracledb.connect(**CONNECT_ARGS)
 
         return conn
 
+    def warmup(self):
+        """
+        open the connections to the DB (the pool, if enabled)
+        """
+        self.ping()
+
+    def ping(self):
+        """
+        check that the DB is reachable, with a connection of the pool
+        """
+        with self.get_db_connection() as conn:
+            conn.ping()
+
     # @TRACER.start_as_current_span("generate_sql")
     def generate_sql(self, nl_request: str) -> str:
         """
@@ -144,3 +253,46 @@ class SelectAISQLAgent(SQLAgent):
         else:
             logger.warning("SQL validation failed. Execution skipped.")
         return results
+
+    def execute_sql_batches(
+        self, sql: str, batch_size: int = 500, column_types: dict = None
+    ):
+        """
+        Execute the provided SQL and yield results in batches,
+        using fetchmany, without reading all the rows in memory.
+
+        Args:
+            sql (str): SQL query to execute.
+            batch_size (int): max number of rows in a batch.
+            column_types (dict): if provided, filled with the type
+                of every column, from cursor.description.
+
+        Yields:
+            list[dict]: a batch of rows, each one represented as a dictionary.
+        """
+        if not self.check_sql(sql):
+            logger.warning("SQL validation failed. Execution skipped.")
+            return
+
+        logger.info("SQL validated. Executing...")
+        n_rows = 0
+        try:
+            with self.get_db_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.arraysize = batch_size
+                    cursor.execute(sql)
+                    columns = [col[0] for col in cursor.description]
+                    if column_types is not None:
+                        column_types.update(get_column_types(cursor.description))
+
+                    while True:
+                        batch = cursor.fetchmany(batch_size)
+                        if not batch:
+                            break
+                        n_rows += len(batch)
+                        yield [dict(zip(columns, row)) for row in batch]
+
+            logger.info("Executed successfully. Rows fetched: %d", n_rows)
+        except Exception as e:
+            logger.error("Error executing SQL: %s", sql)
+            logger.error(e)
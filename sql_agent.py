@@ -23,6 +23,21 @@ class SQLAgent(ABC):
         get a DB connection
         """
 
+    def warmup(self):
+        """
+        prepare the resources, before the first request
+        (by default: open and close a connection)
+        """
+        with self.get_db_connection():
+            pass
+
+    def ping(self):
+        """
+        check that the DB is reachable (raises if not),
+        for the readiness probe
+        """
+        self.warmup()
+
     @abstractmethod
     def generate_sql(self, nl_request: str) -> str:
         """
@@ -40,3 +55,23 @@ class SQLAgent(ABC):
         """
         Execute the given SQL query and return the result as a list of dictionaries.
         """
+
+    def execute_sql_batches(
+        self, sql: str, batch_size: int = 500, column_types: dict = None
+    ):
+        """
+        Execute the given SQL query and yield the result in batches
+        (list of dictionaries, at most batch_size rows each).
+
+        column_types: if provided, filled (before the first batch) with
+            column -> type of the column in the DB: integer, float, string,
+            timestamp, binary, boolean (not filled if not known)
+
+        Default implementation fetches all the rows (the types are not known),
+        implementations should override it to fetch incrementally.
+        """
+        # pylint: disable=unused-argument
+        rows = self.execute_sql(sql)
+
+        for i in range(0, len(rows), batch_size):
+            yield rows[i : i + batch_size]
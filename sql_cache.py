@@ -1,13 +1,16 @@
 """
 File name: sql_cache.py
 Author: Luigi Saetta
-Date last modified: 2024-12-02
+Date last modified: 2026-10-19
 Python Version: 3.11
 
 Description:
     This file provide a class to handle a cache with all the requests
     more frequently made, in NL, and the resulting SQL code
 
+    The cache can be saved to a JSON file (with the embeddings) and
+    loaded at startup, so that a new instance starts warm.
+
 
 Inspired by:
    
@@ -28,23 +31,22 @@ Warnings:
     This module is in development, may change in future versions.
 """
 
-import os
 import hashlib
+import json
+import os
 from collections import defaultdict
 import numpy as np
 
 from langchain_community.embeddings import OCIGenAIEmbeddings
-from config_reader import ConfigReader
+from config_reader import get_config
 from utils import get_console_logger
 
 from config_private import COMPARTMENT_OCID
 
-current_dir = os.path.dirname(os.path.abspath(__file__))
-config_path = os.path.join(current_dir, "config.toml")
-config = ConfigReader(config_path)
+config = get_config()
 logger = get_console_logger()
 
-VERBOSE = bool(config.find_key("verbose"))
+VERBOSE = config.find_key("verbose")
 
 
 class SQLCache:
@@ -76,17 +78,22 @@ class SQLCache:
         # Maximum cache size
         self.max_size = max_size
 
-        auth_type = config.find_key("auth_type")
-        embed_model = config.find_key("embed_model")
-        embed_endpoint = config.find_key("embed_endpoint")
+        # the embedding model for similarity search, created on first use
+        self._embed_model = None
 
-        # the embedding model for similarity search
-        self.embed_model = OCIGenAIEmbeddings(
-            auth_type=auth_type,
-            model_id=embed_model,
-            service_endpoint=embed_endpoint,
-            compartment_id=COMPARTMENT_OCID,
-        )
+    @property
+    def embed_model(self):
+        """
+        the client of the embedding model (created on first use)
+        """
+        if self._embed_model is None:
+            self._embed_model = OCIGenAIEmbeddings(
+                auth_type=config.find_key("auth_type"),
+                model_id=config.find_key("embed_model"),
+                service_endpoint=config.find_key("embed_endpoint"),
+                compartment_id=COMPARTMENT_OCID,
+            )
+        return self._embed_model
 
     def _hash_request(self, nl_request):
         """Generates a hash for the NL request."""
@@ -155,6 +162,73 @@ class SQLCache:
             for i in range(entries_to_remove):
                 self._remove_entry(sorted_entries[i][0])
 
+    def get_top_requests(self, n: int):
+        """
+        Returns the n most requested entries with SQL, as (request, SQL).
+        """
+        ranked = sorted(
+            (
+                (count, nl_hash)
+                for nl_hash, count in self.access_count.items()
+                if self.cache.get(nl_hash) is not None
+            ),
+            reverse=True,
+        )
+        return [
+            (self.user_requests[nl_hash], self.cache[nl_hash])
+            for _, nl_hash in ranked[:n]
+        ]
+
+    def save(self, file_path: str):
+        """
+        Saves the cache (with the embeddings) to a JSON file.
+        """
+        entries = [
+            {
+                "request": self.user_requests[nl_hash],
+                "sql": sql_query,
+                "count": self.access_count[nl_hash],
+                "generation_time": self.generation_times.get(nl_hash),
+                "embedding": [float(x) for x in self.embedding[nl_hash]],
+            }
+            for nl_hash, sql_query in self.cache.items()
+        ]
+
+        # written to a temp file and renamed: never a partial file
+        tmp_path = file_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, file_path)
+
+        logger.info("Saved %d entries of the SQL cache in %s", len(entries), file_path)
+
+    def load(self, file_path: str) -> int:
+        """
+        Loads the cache saved with save (no embedding is computed).
+
+        Returns:
+            the n. of entries loaded
+        """
+        if not os.path.exists(file_path):
+            return 0
+
+        with open(file_path, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+
+        for entry in entries:
+            nl_hash = self._hash_request(entry["request"])
+            self.cache[nl_hash] = entry["sql"]
+            self.user_requests[nl_hash] = entry["request"]
+            self.generation_times[nl_hash] = entry.get("generation_time")
+            self.embedding[nl_hash] = entry["embedding"]
+            self.access_count[nl_hash] = entry.get("count", 1)
+        self._maintain_size()
+
+        logger.info(
+            "Loaded %d entries of the SQL cache from %s", len(entries), file_path
+        )
+        return len(entries)
+
     def get_failed_requests(self):
         """
         Returns a list of user requests for which SQL generation failed
@@ -0,0 +1,155 @@
+"""
+Benchmark the inter-token latency of concurrent streams, on one worker
+(one event loop), with a fake streaming model that blocks on every token
+(as a network read does).
+
+Compares:
+    * sync stream wrapped in an async generator (the old _wrap_generator)
+    * async streaming (astream), as used now in handlers
+    * astream, with the default executor sized as in api_main
+      (the fake model, as ChatOCIGenAI, has no native async and
+      LangChain reads the sync stream in the default executor)
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter, sleep
+from typing import Any, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from utils import get_console_logger, create_banner
+
+N_CONVERSATIONS = [1, 10, 50]
+N_TOKENS = 20
+# time to wait for every token
+TOKEN_DELAY = 0.02
+# as executor_max_workers in config.toml
+EXECUTOR_MAX_WORKERS = 64
+
+
+class FakeStreamingModel(BaseChatModel):
+    """
+    Fake chat model: returns N_TOKENS tokens, blocking TOKEN_DELAY sec. on each
+    """
+
+    n_tokens: int = N_TOKENS
+    token_delay: float = TOKEN_DELAY
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-streaming"
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        text = "".join(
+            chunk.message.content for chunk in self._stream(messages, stop, **kwargs)
+        )
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        for i in range(self.n_tokens):
+            # the blocking read of the next token
+            sleep(self.token_delay)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=f"tok{i} "))
+
+
+async def wrap_generator(generator):
+    """
+    the old way: the sync stream in an async generator
+    """
+    for item in generator:
+        await asyncio.sleep(0)
+        yield item
+
+
+async def consume_sync(llm, gaps):
+    """
+    one conversation, with the sync stream
+    """
+    time_last = perf_counter()
+    async for _ in wrap_generator(llm.stream("Hello")):
+        now = perf_counter()
+        gaps.append(now - time_last)
+        time_last = now
+
+
+async def consume_async(llm, gaps):
+    """
+    one conversation, with astream
+    """
+    time_last = perf_counter()
+    async for _ in llm.astream("Hello"):
+        now = perf_counter()
+        gaps.append(now - time_last)
+        time_last = now
+
+
+async def run(consumer, llm, n_conversations, max_workers=None):
+    """
+    run n_conversations streams concurrently
+
+    Returns:
+        inter-token gaps (sec.), total elapsed time (sec.)
+    """
+    if max_workers is not None:
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=max_workers)
+        )
+
+    gaps = []
+    time_start = perf_counter()
+    await asyncio.gather(*[consumer(llm, gaps) for _ in range(n_conversations)])
+    return np.asarray(gaps), perf_counter() - time_start
+
+
+def report(label, gaps, elapsed):
+    """
+    print the stats
+    """
+    logger.info(
+        "%-12s avg: %7.1f ms, p95: %7.1f ms, max: %7.1f ms, total: %6.2f sec.",
+        label,
+        gaps.mean() * 1000,
+        np.percentile(gaps, 95) * 1000,
+        gaps.max() * 1000,
+        elapsed,
+    )
+
+
+#
+# Main
+#
+logger = get_console_logger()
+
+create_banner("Benchmark async streaming")
+
+logger.info("Fake model: %d tokens, %.0f ms per token", N_TOKENS, TOKEN_DELAY * 1000)
+logger.info("")
+
+model = FakeStreamingModel()
+
+for n_conv in N_CONVERSATIONS:
+    logger.info("Concurrent conversations: %d", n_conv)
+
+    report("sync stream", *asyncio.run(run(consume_sync, model, n_conv)))
+    report("astream", *asyncio.run(run(consume_async, model, n_conv)))
+    report(
+        "astream+pool",
+        *asyncio.run(run(consume_async, model, n_conv, EXECUTOR_MAX_WORKERS)),
+    )
+    logger.info("")
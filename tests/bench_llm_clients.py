@@ -0,0 +1,79 @@
+"""
+Benchmark time-to-first-token (TTFT) with cold LLM clients
+(created for every request) vs pooled clients (reused)
+"""
+
+from time import perf_counter
+from langchain_core.messages import HumanMessage
+
+from config_reader import ConfigReader
+from llm_manager import LLMManager
+from utils import get_console_logger, create_banner
+
+from config_private import COMPARTMENT_OCID
+
+N_REQUESTS = 5
+MESSAGES = [HumanMessage(content="Who is Larry Ellison? Answer in one sentence.")]
+
+
+def time_to_first_token(chat):
+    """
+    wait for the first chunk
+    """
+    for _ in chat.stream(MESSAGES):
+        break
+
+
+def report(label, times):
+    """
+    print the stats
+    """
+    times = sorted(times)
+    logger.info("%s:", label)
+    logger.info("   avg TTFT: %.3f sec.", sum(times) / len(times))
+    logger.info("   min TTFT: %.3f sec.", times[0])
+    logger.info("   max TTFT: %.3f sec.", times[-1])
+    logger.info("")
+
+
+#
+# Main
+#
+logger = get_console_logger()
+
+# read the configuration
+config = ConfigReader("../config.toml")
+
+create_banner("Benchmark LLM clients")
+
+llm_manager = LLMManager(
+    config,
+    compartment_id=COMPARTMENT_OCID,
+    logger=logger,
+)
+
+for model_index in range(len(config.find_key("models_list"))):
+    logger.info("Model: %s", llm_manager.get_llm_model_name(model_index))
+    logger.info("")
+
+    # cold: a new client for every request
+    # (TTFT includes the creation of the client)
+    cold_times = []
+    for _ in range(N_REQUESTS):
+        llm_manager.reset_clients()
+        time_start = perf_counter()
+        chat = llm_manager.get_llm_model(model_index)
+        time_to_first_token(chat)
+        cold_times.append(perf_counter() - time_start)
+
+    # pooled: warmup, then reuse
+    llm_manager.warmup([model_index], send_request=True)
+    pooled_times = []
+    for _ in range(N_REQUESTS):
+        time_start = perf_counter()
+        chat = llm_manager.get_llm_model(model_index)
+        time_to_first_token(chat)
+        pooled_times.append(perf_counter() - time_start)
+
+    report("Cold clients", cold_times)
+    report("Pooled clients", pooled_times)
@@ -0,0 +1,69 @@
+"""
+Benchmark the streaming of a result set as Markdown table
+
+reports throughput in rows/sec
+"""
+
+import asyncio
+import random
+import string
+from time import perf_counter
+
+from markdown_table import stream_markdown_table
+from utils import get_console_logger, create_banner
+
+N_ROWS_LIST = [1_000, 10_000, 100_000]
+
+
+def make_rows(n_rows):
+    """
+    generate n_rows synthetic rows, similar to the ones from a sales query
+    """
+    rnd = random.Random(42)
+    countries = ["Italy", "France", "Germany", "Spain", "United States of America"]
+
+    return [
+        {
+            "ID": i,
+            "CUSTOMER": "".join(
+                rnd.choices(string.ascii_uppercase, k=rnd.randint(5, 30))
+            ),
+            "COUNTRY": rnd.choice(countries),
+            "AMOUNT": round(rnd.uniform(10, 10_000), 2),
+            "NOTES": "x" * rnd.randint(0, 120),
+        }
+        for i in range(n_rows)
+    ]
+
+
+async def consume(rows):
+    """
+    consume the stream, return n. of chunks and n. of chars
+    """
+    n_chunks = 0
+    n_chars = 0
+    async for chunk in stream_markdown_table(rows):
+        n_chunks += 1
+        n_chars += len(chunk)
+    return n_chunks, n_chars
+
+
+#
+# Main
+#
+logger = get_console_logger()
+
+create_banner("Benchmark markdown table")
+
+for n_rows in N_ROWS_LIST:
+    rows = make_rows(n_rows)
+
+    time_start = perf_counter()
+    N_CHUNKS, N_CHARS = asyncio.run(consume(rows))
+    time_elapsed = perf_counter() - time_start
+
+    logger.info("N. rows: %d", n_rows)
+    logger.info("   Elapsed: %.3f sec.", time_elapsed)
+    logger.info("   Throughput: %.0f rows/sec", n_rows / time_elapsed)
+    logger.info("   N. chunks: %d, avg chunk size: %d", N_CHUNKS, N_CHARS // N_CHUNKS)
+    logger.info("")
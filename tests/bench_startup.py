@@ -0,0 +1,116 @@
+"""
+Benchmark the startup of the API process:
+    * import time of api_main (python -X importtime), with the slowest
+      modules, checked against a budget: nothing heavy must be created
+      at import time (see app_container.py)
+    * optionally (--startup), the time of the lifespan startup
+      (components and clients created by the AppContainer),
+      it needs the credentials for OCI
+
+Run from the tests directory:
+    python bench_startup.py [--budget-ms 3000] [--top 15] [--startup]
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import subprocess
+import sys
+from time import perf_counter
+
+from utils import get_console_logger, create_banner
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# import time: self [us] | cumulative | imported package
+IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure_import(module: str):
+    """
+    import the module in a new process, with -X importtime
+
+    Returns:
+        (wall time in sec., list of (cumulative us, module) of every import)
+    """
+    time_start = perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT_DIR,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    elapsed = perf_counter() - time_start
+
+    if result.returncode != 0:
+        logger.error("Import of %s failed:\n%s", module, result.stderr[-2000:])
+        sys.exit(2)
+
+    imports = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            imports.append((int(match.group(2)), match.group(4)))
+
+    return elapsed, imports
+
+
+def measure_startup():
+    """
+    time of the lifespan startup of the API (and shutdown)
+    """
+    sys.path.insert(0, ROOT_DIR)
+    os.chdir(ROOT_DIR)
+
+    # pylint: disable=import-outside-toplevel
+    from api_main import container
+
+    async def start_stop():
+        await container.astart()
+        await container.astop()
+
+    time_start = perf_counter()
+    asyncio.run(start_stop())
+    return perf_counter() - time_start, container.startup_times
+
+
+#
+# Main
+#
+logger = get_console_logger()
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--module", default="api_main")
+parser.add_argument("--budget-ms", type=float, default=3000)
+parser.add_argument("--top", type=int, default=15)
+parser.add_argument("--startup", action="store_true")
+args = parser.parse_args()
+
+create_banner("Benchmark startup")
+
+wall_time, module_times = measure_import(args.module)
+import_ms = max((cumulative for cumulative, _ in module_times), default=0) / 1000
+
+logger.info(
+    "Import of %s: %.0f ms (process: %.0f ms)", args.module, import_ms, wall_time * 1000
+)
+logger.info("")
+logger.info("Slowest imports (cumulative):")
+for cumulative, name in sorted(module_times, reverse=True)[: args.top]:
+    logger.info("    %8.1f ms  %s", cumulative / 1000, name)
+logger.info("")
+
+if args.startup:
+    startup_time, steps = measure_startup()
+    logger.info("Startup (lifespan): %.2f sec.", startup_time)
+    for step, step_time in steps.items():
+        logger.info("    %-22s %.3f sec.", step, step_time)
+    logger.info("")
+
+if import_ms > args.budget_ms:
+    logger.error("Import time over budget: %.0f > %.0f ms", import_ms, args.budget_ms)
+    sys.exit(1)
+
+logger.info("Import time within budget (%.0f ms)", args.budget_ms)
@@ -0,0 +1,228 @@
+"""
+A local stand-in for a Redis server, in memory, with the subset of the
+redis-py API used by RedisConversationStore (conversation_store.py):
+strings, counters, lists, TTL and pipelines (MULTI/EXEC, WATCH).
+
+Used to test the store without a Redis server:
+    store = RedisConversationStore(client=RedisStandIn())
+
+advance(sec) moves the clock forward, to test the expiry of the keys.
+"""
+
+import threading
+from time import time
+
+
+class WatchError(Exception):
+    """
+    a watched key has changed (as redis.exceptions.WatchError)
+    """
+
+
+class RedisStandIn:
+    """
+    In memory Redis, thread safe (commands are atomic)
+    """
+
+    def __init__(self):
+        self.data = {}
+        # key -> expiry time
+        self.expiry = {}
+        # key -> n. of changes (for WATCH)
+        self.changes = {}
+        self.offset = 0.0
+        self.lock = threading.RLock()
+
+    def advance(self, seconds: float):
+        """
+        move the clock forward (keys expire)
+        """
+        self.offset += seconds
+
+    def _now(self):
+        return time() + self.offset
+
+    def _expire_key(self, key):
+        expiry = self.expiry.get(key)
+        if expiry is not None and expiry <= self._now():
+            self.data.pop(key, None)
+            del self.expiry[key]
+            self._changed(key)
+
+    def _get(self, key):
+        self._expire_key(key)
+        return self.data.get(key)
+
+    def _changed(self, key):
+        self.changes[key] = self.changes.get(key, 0) + 1
+
+    def _set(self, key, value):
+        self.data[key] = value
+        self.expiry.pop(key, None)
+        self._changed(key)
+
+    @staticmethod
+    def _encode(value):
+        return value if isinstance(value, bytes) else str(value).encode("utf-8")
+
+    # strings and counters
+    def get(self, key):
+        with self.lock:
+            return self._get(key)
+
+    def set(self, key, value):
+        with self.lock:
+            self._set(key, self._encode(value))
+            return True
+
+    def getset(self, key, value):
+        with self.lock:
+            old = self._get(key)
+            self._set(key, self._encode(value))
+            return old
+
+    def incrby(self, key, amount):
+        with self.lock:
+            value = int(self._get(key) or 0) + amount
+            expiry = self.expiry.get(key)
+            self._set(key, self._encode(value))
+            if expiry is not None:
+                self.expiry[key] = expiry
+            return value
+
+    def incr(self, key):
+        return self.incrby(key, 1)
+
+    def delete(self, *keys):
+        with self.lock:
+            n_deleted = 0
+            for key in keys:
+                if self._get(key) is not None:
+                    del self.data[key]
+                    self.expiry.pop(key, None)
+                    self._changed(key)
+                    n_deleted += 1
+            return n_deleted
+
+    def expire(self, key, seconds):
+        with self.lock:
+            if self._get(key) is None:
+                return False
+            self.expiry[key] = self._now() + seconds
+            return True
+
+    # lists
+    def rpush(self, key, *values):
+        with self.lock:
+            values_list = list(self._get(key) or [])
+            values_list.extend(self._encode(value) for value in values)
+            self._set(key, values_list)
+            return len(values_list)
+
+    @staticmethod
+    def _range(values, start, end):
+        n_values = len(values)
+        start = max(n_values + start, 0) if start < 0 else start
+        end = n_values + end if end < 0 else end
+        return values[start : end + 1]
+
+    def lrange(self, key, start, end):
+        with self.lock:
+            return self._range(list(self._get(key) or []), start, end)
+
+    def ltrim(self, key, start, end):
+        with self.lock:
+            values = self._get(key)
+            if values is not None:
+                expiry = self.expiry.get(key)
+                self._set(key, self._range(values, start, end))
+                if expiry is not None:
+                    self.expiry[key] = expiry
+            return True
+
+    def pipeline(self, transaction: bool = True):
+        """
+        a pipeline: commands are buffered and executed atomically by execute
+        (after watch and before multi they are executed immediately)
+        """
+        return StandInPipeline(self, transaction)
+
+    def close(self):
+        """
+        nothing to release
+        """
+
+
+class StandInPipeline:
+    """
+    The pipeline of RedisStandIn
+    """
+
+    def __init__(self, client: RedisStandIn, transaction: bool):
+        self.client = client
+        self.transaction = transaction
+        self.commands = []
+        # key -> n. of changes when watched
+        self.watched = {}
+        self.immediate = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.reset()
+
+    def reset(self):
+        """
+        discard the commands and unwatch
+        """
+        self.commands = []
+        self.watched = {}
+        self.immediate = False
+
+    def watch(self, *keys):
+        """
+        the transaction fails if the keys change
+        """
+        with self.client.lock:
+            for key in keys:
+                self.client._expire_key(key)
+                self.watched[key] = self.client.changes.get(key, 0)
+        self.immediate = True
+
+    def multi(self):
+        """
+        start buffering the commands
+        """
+        self.immediate = False
+
+    def __getattr__(self, name):
+        command = getattr(self.client, name)
+
+        def call(*args, **kwargs):
+            if self.immediate:
+                return command(*args, **kwargs)
+            self.commands.append((command, args, kwargs))
+            return self
+
+        return call
+
+    def execute(self):
+        """
+        execute the buffered commands, atomically
+
+        Raises:
+            WatchError if a watched key has changed
+        """
+        with self.client.lock:
+            try:
+                for key, n_changes in self.watched.items():
+                    self.client._expire_key(key)
+                    if self.client.changes.get(key, 0) != n_changes:
+                        raise WatchError(f"Watched key {key} changed")
+
+                return [
+                    command(*args, **kwargs) for command, args, kwargs in self.commands
+                ]
+            finally:
+                self.reset()
@@ -0,0 +1,156 @@
+"""
+Test the conversation stores (memory, SQLite and Redis, with the local
+stand-in) and two workers sharing the history through the store
+
+no server needed: run with PYTHONPATH=.:.. (see set_pythonpath.sh)
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+from langchain_core.messages import AIMessage, HumanMessage
+from conversation_manager import ConversationManager
+from conversation_store import (
+    InMemoryConversationStore,
+    RedisConversationStore,
+    SQLiteConversationStore,
+)
+from redis_stand_in import RedisStandIn
+from utils import get_console_logger, create_banner
+
+MAX_MSGS = 4
+VERSION_TTL = 0.2
+
+# n. of checks, n. passed
+results = {"n_tests": 0, "n_ok": 0}
+
+
+def msg(i):
+    return {"role": "human", "content": f"message {i}"}
+
+
+def check(condition, description):
+    results["n_tests"] += 1
+    if condition:
+        results["n_ok"] += 1
+    else:
+        logger.info("FAILED: %s", description)
+
+
+def test_store(name, store):
+    create_banner(f"Test {name} store")
+
+    before, after = store.append("c1", [msg(1), msg(2)])
+    check(before == 0 and after > 0, "first append")
+
+    _, after2 = store.append("c1", [msg(i) for i in range(3, 7)])
+    messages, version = store.load("c1", MAX_MSGS)
+    check(after2 > after and version == after2, "versions increase")
+    check(
+        [m["content"] for m in messages] == [f"message {i}" for i in range(3, 7)],
+        "trim",
+    )
+
+    # replace (compaction) only if the version hasn't changed
+    check(store.replace("c1", [msg(0)], version), "replace")
+    check(not store.replace("c1", [msg(0)], version), "replace with an old version")
+
+    # a deleted conversation, re-used: the version must never be re-used
+    last_version = store.version("c1")
+    store.delete("c1")
+    check(store.version("c1") == 0, "deleted")
+    _, after3 = store.append("c1", [msg(1)])
+    check(after3 > last_version, "version after delete")
+
+    # other conversations are independent
+    store.append("c2", [msg(1)])
+    check(len(store.load("c2", MAX_MSGS)[0]) == 1, "other conversation")
+
+    logger.info("Versions: %d -> %d (after delete)", last_version, after3)
+
+
+def new_worker(store):
+    """
+    a worker with its own ConversationManager (the singleton is reset)
+    """
+    ConversationManager._instance = None
+    manager = ConversationManager(MAX_MSGS, store=store, version_ttl=VERSION_TTL)
+    ConversationManager._instance = None
+    return manager
+
+
+async def test_workers(name, store):
+    create_banner(f"Test two workers, {name} store")
+
+    worker_a = new_worker(store)
+    worker_b = new_worker(store)
+
+    worker_a.add_message("c3", HumanMessage(content="question"))
+    worker_a.add_message("c3", AIMessage(content="answer"))
+    check(len(await worker_b.aget_conversation("c3")) == 2, "read by the other worker")
+
+    # within version_ttl the copy in memory is used, then re-validated
+    worker_a.add_message("c3", HumanMessage(content="another question"))
+    n_store_loads = worker_b.n_store_loads
+    check(len(await worker_b.aget_conversation("c3")) == 2, "cached within version_ttl")
+    check(worker_b.n_store_loads == n_store_loads, "no load within version_ttl")
+    time.sleep(VERSION_TTL)
+    check(
+        len(await worker_b.aget_conversation("c3")) == 3, "reloaded after version_ttl"
+    )
+
+    # cleared and re-used by worker A: worker B must not keep the old messages
+    worker_a.clear_conversation("c3")
+    worker_a.add_message("c3", HumanMessage(content="new question"))
+    time.sleep(VERSION_TTL)
+    messages = await worker_b.aget_conversation("c3")
+    check([m.content for m in messages] == ["new question"], "cleared and re-used")
+    check(not await worker_b.ahas_data("c3"), "has_data")
+
+    # a conversation not in memory is loaded (in a thread) before the append
+    worker_c = new_worker(store)
+    await worker_c.aadd_message("c3", AIMessage(content="new answer"))
+    messages = await worker_c.aget_conversation("c3")
+    check(
+        [m.content for m in messages] == ["new question", "new answer"],
+        "loaded before the append",
+    )
+    check(worker_c.has_conversation("c3"), "has_conversation")
+
+
+#
+# Main
+#
+logger = get_console_logger()
+
+tmp_dir = tempfile.mkdtemp()
+
+stores = {
+    "memory": lambda: InMemoryConversationStore(max_msgs=MAX_MSGS),
+    "sqlite": lambda: SQLiteConversationStore(
+        os.path.join(tmp_dir, f"conversations_{time.time_ns()}.db"), max_msgs=MAX_MSGS
+    ),
+    "redis": lambda: RedisConversationStore(client=RedisStandIn(), max_msgs=MAX_MSGS),
+}
+
+for store_name, create_store in stores.items():
+    test_store(store_name, create_store())
+    asyncio.run(test_workers(store_name, create_store()))
+
+# in Redis the keys expire: the version must not restart from 0
+create_banner("Test Redis expiry")
+
+redis = RedisStandIn()
+redis_store = RedisConversationStore(client=redis, max_msgs=MAX_MSGS, idle_ttl=60)
+_, version_before = redis_store.append("c4", [msg(1)])
+redis.advance(61)
+check(redis_store.version("c4") == 0, "expired")
+_, version_after = redis_store.append("c4", [msg(1)])
+check(version_after > version_before, "version after expiry")
+
+logger.info("")
+logger.info("Results:")
+logger.info("   N. test: %d", results["n_tests"])
+logger.info("   N. OK: %d", results["n_ok"])
+logger.info("")
@@ -4,7 +4,6 @@ Tracer Singleton
     to support integration with OCI APM
 """
 
-import os
 from opentelemetry import trace
 from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.sdk.trace.export import BatchSpanProcessor
@@ -14,7 +13,7 @@ from opentelemetry.sdk.trace.export import (
     SpanExportResult,
 )
 from opentelemetry.sdk.resources import Resource
-from config_reader import ConfigReader
+from config_reader import get_config
 from config_private import APM_PUBLIC_KEY
 from utils import get_console_logger
 
@@ -56,10 +55,8 @@ class TracerSingleton:
         """
         Init tracer for APM integration, leggendo i parametri dalla configurazione.
         """
-        # Legge la configurazione dal file (puoi personalizzare il percorso)
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        config_path = os.path.join(current_dir, "config.toml")
-        config = ConfigReader(config_path)
+        # the config shared by all the modules
+        config = get_config()
 
         trace_enable = config.find_key("trace_enable")
         apm_endpoint = config.find_key("apm_endpoint")